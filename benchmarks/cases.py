@@ -0,0 +1,313 @@
+"""
+Hot-path cases for benchmarks/run.py.
+
+Each case is a zero-argument callable doing one unit of the work done per
+packet.  The database is replaced by a stub pool whose cursor accepts and
+discards statements, so the timings cover only our Python: SQL building,
+protobuf work, dict building and the batch writer's buffering.
+"""
+
+from __future__ import annotations
+
+import itertools
+import sys
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from cryptography.hazmat.primitives.ciphers import (  # noqa: E402
+    Cipher,
+    algorithms,
+    modes,
+)
+
+from exporter import enums  # noqa: E402
+from exporter.client_details import ClientDetails  # noqa: E402
+from exporter.db_handler import BatchWriter, DBHandler  # noqa: E402
+from exporter.keyring import DEFAULT_PSK, channel_hash  # noqa: E402
+from exporter.processor.processor_base import MessageProcessor  # noqa: E402
+from exporter.processor.processors import (  # noqa: E402
+    AIR_QUALITY_METRICS,
+    DEVICE_METRICS,
+    ENVIRONMENT_METRICS,
+    LOCAL_STATS,
+    POWER_METRICS,
+    NeighborInfoAppProcessor,
+    TelemetryAppProcessor,
+)
+
+try:
+    from meshtastic.config_pb2 import Config
+    from meshtastic.mesh_pb2 import Data, HardwareModel, MeshPacket, NeighborInfo
+    from meshtastic.mqtt_pb2 import ServiceEnvelope
+    from meshtastic.portnums_pb2 import PortNum
+    from meshtastic.telemetry_pb2 import (
+        AirQualityMetrics,
+        DeviceMetrics,
+        EnvironmentMetrics,
+        LocalStats,
+        PowerMetrics,
+        Telemetry,
+    )
+except ImportError:
+    from meshtastic.protobuf.config_pb2 import Config
+    from meshtastic.protobuf.mesh_pb2 import (
+        Data,
+        HardwareModel,
+        MeshPacket,
+        NeighborInfo,
+    )
+    from meshtastic.protobuf.mqtt_pb2 import ServiceEnvelope
+    from meshtastic.protobuf.portnums_pb2 import PortNum
+    from meshtastic.protobuf.telemetry_pb2 import (
+        AirQualityMetrics,
+        DeviceMetrics,
+        EnvironmentMetrics,
+        LocalStats,
+        PowerMetrics,
+        Telemetry,
+    )
+
+import main  # noqa: E402
+
+CASES: Dict[str, Callable[[], Callable[[], object]]] = {}
+
+
+def case(name: str):
+    """Register a setup function returning the callable to time."""
+
+    def register(setup):
+        CASES[name] = setup
+        return setup
+
+    return register
+
+
+class StubCursor:
+    def execute(self, sql, params=None):
+        pass
+
+    def fetchone(self):
+        return None
+
+    @contextmanager
+    def copy(self, sql):
+        yield self
+
+    def write_row(self, row):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class StubConnection:
+    def __init__(self):
+        self._cursor = StubCursor()
+
+    def cursor(self):
+        return self._cursor
+
+    def commit(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class StubPool:
+    def __init__(self):
+        self._conn = StubConnection()
+
+    def connection(self):
+        return self._conn
+
+
+SENDER = 0x0A0B0C0D
+CLIENT = ClientDetails(node_id=SENDER, short_name="AB", long_name="Alpha")
+
+TELEMETRY = {
+    "device": (
+        Telemetry(
+            device_metrics=DeviceMetrics(
+                battery_level=87,
+                voltage=4.05,
+                channel_utilization=12.5,
+                air_util_tx=1.25,
+                uptime_seconds=86400,
+            )
+        ),
+        "device_metrics",
+        DEVICE_METRICS,
+    ),
+    "environment": (
+        Telemetry(
+            environment_metrics=EnvironmentMetrics(
+                temperature=23.5, relative_humidity=55.0, barometric_pressure=1012.0
+            )
+        ),
+        "environment_metrics",
+        ENVIRONMENT_METRICS,
+    ),
+    "air_quality": (
+        Telemetry(
+            air_quality_metrics=AirQualityMetrics(pm10_standard=4, pm25_standard=7)
+        ),
+        "air_quality_metrics",
+        AIR_QUALITY_METRICS,
+    ),
+    "power": (
+        Telemetry(power_metrics=PowerMetrics(ch1_voltage=5.1, ch1_current=120.0)),
+        "power_metrics",
+        POWER_METRICS,
+    ),
+    "local_stats": (
+        Telemetry(
+            local_stats=LocalStats(
+                uptime_seconds=3600, num_packets_tx=120, num_packets_rx=900
+            )
+        ),
+        "local_stats",
+        LOCAL_STATS,
+    ),
+}
+
+
+def _encrypted_envelope() -> bytes:
+    data = Data(
+        portnum=PortNum.TELEMETRY_APP,
+        payload=TELEMETRY["device"][0].SerializeToString(),
+    )
+    packet = MeshPacket(id=0x1234, to=0xFFFFFFFF, hop_start=3, hop_limit=2)
+    setattr(packet, "from", SENDER)
+    packet.channel = channel_hash("LongFast", DEFAULT_PSK)
+    nonce = packet.id.to_bytes(8, "little") + SENDER.to_bytes(8, "little")
+    encryptor = Cipher(algorithms.AES(DEFAULT_PSK), modes.CTR(nonce)).encryptor()
+    packet.encrypted = encryptor.update(data.SerializeToString()) + encryptor.finalize()
+    envelope = ServiceEnvelope(channel_id="LongFast", gateway_id="!aabbccdd")
+    envelope.packet.CopyFrom(packet)
+    return envelope.SerializeToString()
+
+
+ENVELOPE = _encrypted_envelope()
+
+
+@case("envelope_parse")
+def _envelope_parse():
+    return lambda: ServiceEnvelope.FromString(ENVELOPE)
+
+
+@case("decrypt")
+def _decrypt():
+    processor = MessageProcessor(StubPool())
+    packet = ServiceEnvelope.FromString(ENVELOPE).packet
+    # The keyring call is MessageProcessor.decrypt without the in-place
+    # copy, so the same packet can be decrypted on every iteration.
+    return lambda: processor.keyring.decrypt(packet)
+
+
+for _variant, (_telemetry, _field, _extractor) in TELEMETRY.items():
+
+    def _setup(message=getattr(_telemetry, _field), extractor=_extractor):
+        return lambda: extractor.values(message)
+
+    case(f"extract.{_variant}")(_setup)
+
+
+@case("telemetry_process")
+def _telemetry_process():
+    writer = BatchWriter(StubPool(), batch_size=500)
+    processor = TelemetryAppProcessor(StubPool(), DBHandler(StubPool(), writer))
+    payload = TELEMETRY["device"][0].SerializeToString()
+    return lambda: processor.process(payload, CLIENT)
+
+
+def _neighbor_info(snr_shift: float = 0.0) -> bytes:
+    info = NeighborInfo(node_id=SENDER)
+    for i in range(8):
+        neighbor = info.neighbors.add()
+        neighbor.node_id = 0x10000000 + i
+        neighbor.snr = 4.5 - i + snr_shift
+    return info.SerializeToString()
+
+
+@case("neighbor_info_update")
+def _neighbor_info_update():
+    # Alternate between two reports far enough apart to be written each time.
+    processor = NeighborInfoAppProcessor(StubPool(), DBHandler(StubPool()))
+    payloads = itertools.cycle((_neighbor_info(), _neighbor_info(5.0)))
+    return lambda: processor.process(next(payloads), CLIENT)
+
+
+@case("neighbor_info_unchanged")
+def _neighbor_info_unchanged():
+    processor = NeighborInfoAppProcessor(StubPool(), DBHandler(StubPool()))
+    payload = _neighbor_info()
+    processor.process(payload, CLIENT)
+    return lambda: processor.process(payload, CLIENT)
+
+
+@case("insert_row_sql")
+def _insert_row_sql():
+    cur = StubCursor()
+    row = {
+        "node_id": 123,
+        "battery_level": 87,
+        "voltage": 4.05,
+        "channel_utilization": 12.5,
+        "air_util_tx": 1.25,
+        "uptime_seconds": 86400,
+    }
+    return lambda: DBHandler._insert_row(cur, "device_metrics", row)
+
+
+@case("classify_topic")
+def _classify_topic():
+    topics = [
+        "msh/EU_868/2/e/LongFast/!aabbccdd",
+        "msh/EU_868/2/json/LongFast/!aabbccdd",
+        "msh/EU_868/2/stat/!aabbccdd",
+        "msh/EU_868/2/map/",
+    ]
+    return lambda: [main.classify_topic(t) for t in topics]
+
+
+@case("port_name")
+def _port_name():
+    port = int(PortNum.TELEMETRY_APP)
+    return lambda: enums.port_name(port)
+
+
+def _scan(descriptor, key, default):
+    """The per-call descriptor scan ``enums`` replaced, kept as a reference."""
+    for value in descriptor.values:
+        if value.number == key or value.name == key:
+            return value.name
+    return default
+
+
+@case("port_name_scan")
+def _port_name_scan():
+    port = int(PortNum.TELEMETRY_APP)
+    return lambda: _scan(PortNum.DESCRIPTOR, port, "UNKNOWN_PORT")
+
+
+# NodeInfo and MapReport packets also resolve a hardware model and a role.
+@case("hardware_model_name")
+def _hardware_model_name():
+    models = [HardwareModel.TBEAM, HardwareModel.HELTEC_V3, HardwareModel.RAK4631]
+    return lambda: [enums.hardware_model_name(m) for m in models]
+
+
+@case("role_name")
+def _role_name():
+    roles = [Config.DeviceConfig.Role.CLIENT, Config.DeviceConfig.Role.ROUTER]
+    return lambda: [enums.role_name(r) for r in roles]
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks for the ingest hot path, with regression thresholds.
+
+Run from the repo root:
+
+    python3 benchmarks/run.py                  # compare with baseline.json
+    python3 benchmarks/run.py --update         # record a new baseline
+    python3 benchmarks/run.py -k extract       # only cases matching "extract"
+
+Each case in ``benchmarks/cases.py`` times one hot function on its own,
+with the database replaced by a stub pool.  The result for a case is the
+best of several repeats, in nanoseconds per call.  The run fails (exit
+status 1) when a case is slower than its baseline by more than the
+margin, which is 25% unless --margin or BENCH_MARGIN says otherwise.
+Baselines depend on the machine, so record them on the machine that runs
+the comparison.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from cases import CASES  # noqa: E402
+
+DEFAULT_BASELINE = Path(__file__).resolve().parent / "baseline.json"
+
+
+def measure(fn, repeat: int = 5, min_time: float = 0.2) -> float:
+    """Best-of-``repeat`` time per call of ``fn``, in nanoseconds."""
+    timer = timeit.Timer(fn)
+    number, elapsed = timer.autorange()
+    if elapsed < min_time:
+        number = max(1, int(number * min_time / max(elapsed, 1e-9)))
+    best = min(timer.repeat(repeat=repeat, number=number))
+    return best / number * 1e9
+
+
+def run_cases(selected: list[str], repeat: int) -> dict[str, float]:
+    results = {}
+    for name in selected:
+        results[name] = round(measure(CASES[name](), repeat=repeat), 1)
+        print(f"  {name:28s} {results[name]:>12,.1f} ns")
+    return results
+
+
+def compare(
+    results: dict[str, float], baseline: dict[str, float], margin: float
+) -> list[str]:
+    """Return a message for every case slower than ``baseline`` by more
+    than ``margin`` (a fraction, 0.25 meaning 25%)."""
+    regressions = []
+    for name, ns in results.items():
+        reference = baseline.get(name)
+        if reference is None:
+            continue
+        if ns > reference * (1 + margin):
+            regressions.append(
+                f"{name}: {ns:,.1f} ns vs baseline {reference:,.1f} ns "
+                f"(+{(ns / reference - 1) * 100:.0f}%, limit +{margin * 100:.0f}%)"
+            )
+    return regressions
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument(
+        "--baseline",
+        type=Path,
+        default=DEFAULT_BASELINE,
+        help="baseline JSON file (default: benchmarks/baseline.json)",
+    )
+    parser.add_argument(
+        "--update",
+        action="store_true",
+        help="write the results to the baseline instead of comparing",
+    )
+    parser.add_argument(
+        "--margin",
+        type=float,
+        default=float(os.getenv("BENCH_MARGIN", "0.25")),
+        help="allowed slowdown as a fraction (default: BENCH_MARGIN or 0.25)",
+    )
+    parser.add_argument(
+        "-k", "--filter", default="", help="only run cases whose name contains this"
+    )
+    parser.add_argument("--repeat", type=int, default=5, help="repeats per case")
+    parser.add_argument("--json", type=Path, help="also write the results here")
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = parse_args(argv)
+    selected = [name for name in CASES if args.filter in name]
+    if not selected:
+        print(f"no cases match {args.filter!r}")
+        return 1
+
+    print(f"{len(selected)} cases, python {platform.python_version()}")
+    results = run_cases(selected, args.repeat)
+    report = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results": results,
+    }
+    if args.json:
+        args.json.write_text(json.dumps(report, indent=2) + "\n")
+
+    if args.update:
+        if args.baseline.exists() and args.filter:
+            previous = json.loads(args.baseline.read_text())["results"]
+            report["results"] = {**previous, **results}
+        args.baseline.write_text(json.dumps(report, indent=2) + "\n")
+        print(f"baseline written to {args.baseline}")
+        return 0
+
+    if not args.baseline.exists():
+        print(f"no baseline at {args.baseline}; run with --update first")
+        return 1
+    baseline = json.loads(args.baseline.read_text())["results"]
+    regressions = compare(results, baseline, args.margin)
+    for message in regressions:
+        print(f"REGRESSION {message}")
+    if regressions:
+        return 1
+    print(f"no case slower than baseline by more than {args.margin * 100:.0f}%")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
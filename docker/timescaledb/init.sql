@@ -3,8 +3,14 @@
 -- Design notes:
 --   * One hypertable per metric family (device / environment / air_quality /
 --     power / pax_counter / mesh_packet).  All partition on `time`.
---   * `node_details`, `node_neighbors`, `node_configurations`, `messages` stay
---     plain tables — they are slowly-changing state, not time-series.
+--   * `node_details`, `node_neighbors`, `node_configurations` stay plain
+--     tables — they are slowly-changing state, not time-series.
+--   * Node ids are the firmware's 32-bit node numbers, stored as BIGINT (they
+--     don't fit a signed INT).  mesh_packet_metrics stores the port number as
+--     SMALLINT, named through `port_names`.  Volumes created with VARCHAR ids
+--     or port names are converted by scripts/migrate_node_ids.py.
+--   * Dashboards read continuous aggregates (`mesh_packet_1m`,
+--     `device_metrics_5m`) instead of raw hypertables where they can.
 --   * No per-row triggers on hypertables. Anything that needs to react to new
 --     rows runs as a TimescaleDB scheduled job (`add_job`) instead.
 --   * Idempotent: every CREATE/ALTER uses IF NOT EXISTS / if_not_exists, so
@@ -18,7 +24,7 @@ CREATE EXTENSION IF NOT EXISTS timescaledb;
 
 CREATE TABLE IF NOT EXISTS node_details
 (
-    node_id              VARCHAR PRIMARY KEY,
+    node_id              BIGINT PRIMARY KEY,
     short_name           VARCHAR,
     long_name            VARCHAR,
     hardware_model       VARCHAR,
@@ -46,8 +52,8 @@ ALTER TABLE node_details ADD COLUMN IF NOT EXISTS num_online_local    INT;
 CREATE TABLE IF NOT EXISTS node_neighbors
 (
     id          SERIAL PRIMARY KEY,
-    node_id     VARCHAR,
-    neighbor_id VARCHAR,
+    node_id     BIGINT,
+    neighbor_id BIGINT,
     snr         FLOAT,
     FOREIGN KEY (node_id) REFERENCES node_details (node_id),
     FOREIGN KEY (neighbor_id) REFERENCES node_details (node_id),
@@ -59,7 +65,7 @@ CREATE UNIQUE INDEX IF NOT EXISTS idx_unique_node_neighbor
 
 CREATE TABLE IF NOT EXISTS node_configurations
 (
-    node_id                           VARCHAR PRIMARY KEY,
+    node_id                           BIGINT PRIMARY KEY,
     last_updated                      TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
 
     environment_update_interval       INTERVAL  DEFAULT '0 seconds' NOT NULL,
@@ -96,13 +102,101 @@ CREATE TABLE IF NOT EXISTS node_configurations
     map_broadcast_last_timestamp      TIMESTAMP DEFAULT NOW()
 );
 
-CREATE TABLE IF NOT EXISTS messages
+-- Newest telemetry reading per node, one column group per metric family.
+-- Upserted in batches by the exporter as rows arrive, so reading a node's
+-- current values is a primary-key lookup instead of a newest-row search
+-- in every hypertable.  A reading only replaces the columns it carries a
+-- value for, so each column holds its last known value.
+CREATE TABLE IF NOT EXISTS node_latest
 (
-    id          TEXT PRIMARY KEY,
-    received_at TIMESTAMP NOT NULL DEFAULT NOW()
+    node_id             BIGINT PRIMARY KEY,
+    device_time         TIMESTAMPTZ,
+    battery_level       FLOAT,
+    voltage             FLOAT,
+    channel_utilization FLOAT,
+    air_util_tx         FLOAT,
+    uptime_seconds      BIGINT,
+    environment_time    TIMESTAMPTZ,
+    temperature         FLOAT,
+    relative_humidity   FLOAT,
+    barometric_pressure FLOAT,
+    gas_resistance      FLOAT,
+    iaq                 FLOAT,
+    distance            FLOAT,
+    lux                 FLOAT,
+    white_lux           FLOAT,
+    ir_lux              FLOAT,
+    uv_lux              FLOAT,
+    wind_direction      FLOAT,
+    wind_speed          FLOAT,
+    weight              FLOAT,
+    air_quality_time    TIMESTAMPTZ,
+    pm10_standard       FLOAT,
+    pm25_standard       FLOAT,
+    pm100_standard      FLOAT,
+    pm10_environmental  FLOAT,
+    pm25_environmental  FLOAT,
+    pm100_environmental FLOAT,
+    particles_03um      FLOAT,
+    particles_05um      FLOAT,
+    particles_10um      FLOAT,
+    particles_25um      FLOAT,
+    particles_50um      FLOAT,
+    particles_100um     FLOAT,
+    power_time          TIMESTAMPTZ,
+    ch1_voltage         FLOAT,
+    ch1_current         FLOAT,
+    ch2_voltage         FLOAT,
+    ch2_current         FLOAT,
+    ch3_voltage         FLOAT,
+    ch3_current         FLOAT
 );
 
-CREATE INDEX IF NOT EXISTS idx_messages_received_at ON messages (received_at);
+-- Shared dedup for multi-instance deployments (DEDUP_DB_FALLBACK=true).
+-- A single exporter dedups in memory.
+--
+-- Time is cut into 5-minute slots, and the table into a ring of three
+-- UNLOGGED partitions, one per `slot % 3`.  A claim inserts
+-- (from, packet id) into the current slot and the next one with ON
+-- CONFLICT DO NOTHING; only the first claim gets both rows in.  A packet
+-- is remembered until the slot after its last sighting ends, 5 to 10
+-- minutes.  At any time two partitions are in use, and
+-- `packet_dedup_cleanup_job` truncates the third — no row-by-row deletes,
+-- no WAL.  Unlogged tables are emptied by a crash restart, which costs at
+-- most a few duplicate rows.
+CREATE TABLE IF NOT EXISTS packet_dedup
+(
+    ring      SMALLINT NOT NULL,
+    slot      BIGINT   NOT NULL,
+    sender    BIGINT   NOT NULL,
+    packet_id BIGINT   NOT NULL,
+    PRIMARY KEY (ring, slot, sender, packet_id)
+) PARTITION BY LIST (ring);
+
+CREATE UNLOGGED TABLE IF NOT EXISTS packet_dedup_0 PARTITION OF packet_dedup FOR VALUES IN (0);
+CREATE UNLOGGED TABLE IF NOT EXISTS packet_dedup_1 PARTITION OF packet_dedup FOR VALUES IN (1);
+CREATE UNLOGGED TABLE IF NOT EXISTS packet_dedup_2 PARTITION OF packet_dedup FOR VALUES IN (2);
+
+-- The slot a claim made at `t` falls in, and the one after it.
+CREATE OR REPLACE FUNCTION packet_dedup_slots(t TIMESTAMPTZ)
+RETURNS SETOF BIGINT
+LANGUAGE sql IMMUTABLE
+AS $$
+    SELECT generate_series(s, s + 1)
+    FROM (SELECT floor(extract(epoch FROM t) / 300)::bigint AS s) n
+$$;
+
+-- The TEXT-keyed, WAL-logged table it replaces.
+DROP TABLE IF EXISTS messages;
+
+-- PortNum names by number.  mesh_packet_metrics stores the number only;
+-- the exporter fills this table from the PortNum enum of its protobufs
+-- at startup, so new ports get a name when the protobufs are upgraded.
+CREATE TABLE IF NOT EXISTS port_names
+(
+    portnum SMALLINT PRIMARY KEY,
+    name    VARCHAR  NOT NULL
+);
 
 -- ---------------------------------------------------------------------------
 -- Hypertables (time-series)
@@ -111,7 +205,7 @@ CREATE INDEX IF NOT EXISTS idx_messages_received_at ON messages (received_at);
 CREATE TABLE IF NOT EXISTS device_metrics
 (
     time                TIMESTAMPTZ NOT NULL,
-    node_id             VARCHAR     NOT NULL,
+    node_id             BIGINT      NOT NULL,
     battery_level       FLOAT,
     voltage             FLOAT,
     channel_utilization FLOAT,
@@ -122,7 +216,7 @@ CREATE TABLE IF NOT EXISTS device_metrics
 CREATE TABLE IF NOT EXISTS environment_metrics
 (
     time                TIMESTAMPTZ NOT NULL,
-    node_id             VARCHAR     NOT NULL,
+    node_id             BIGINT      NOT NULL,
     temperature         FLOAT,
     relative_humidity   FLOAT,
     barometric_pressure FLOAT,
@@ -141,7 +235,7 @@ CREATE TABLE IF NOT EXISTS environment_metrics
 CREATE TABLE IF NOT EXISTS air_quality_metrics
 (
     time                TIMESTAMPTZ NOT NULL,
-    node_id             VARCHAR     NOT NULL,
+    node_id             BIGINT      NOT NULL,
     pm10_standard       FLOAT,
     pm25_standard       FLOAT,
     pm100_standard      FLOAT,
@@ -159,7 +253,7 @@ CREATE TABLE IF NOT EXISTS air_quality_metrics
 CREATE TABLE IF NOT EXISTS power_metrics
 (
     time        TIMESTAMPTZ NOT NULL,
-    node_id     VARCHAR     NOT NULL,
+    node_id     BIGINT      NOT NULL,
     ch1_voltage FLOAT,
     ch1_current FLOAT,
     ch2_voltage FLOAT,
@@ -171,7 +265,7 @@ CREATE TABLE IF NOT EXISTS power_metrics
 CREATE TABLE IF NOT EXISTS pax_counter_metrics
 (
     time          TIMESTAMPTZ NOT NULL,
-    node_id       VARCHAR     NOT NULL,
+    node_id       BIGINT      NOT NULL,
     wifi_stations BIGINT,
     ble_beacons   BIGINT,
     uptime        BIGINT
@@ -183,9 +277,9 @@ ALTER TABLE pax_counter_metrics ADD COLUMN IF NOT EXISTS uptime BIGINT;
 CREATE TABLE IF NOT EXISTS mesh_packet_metrics
 (
     time               TIMESTAMPTZ NOT NULL,
-    source_id          VARCHAR     NOT NULL,
-    destination_id     VARCHAR     NOT NULL,
-    portnum            VARCHAR,
+    source_id          BIGINT      NOT NULL,
+    destination_id     BIGINT      NOT NULL,
+    portnum            SMALLINT,
     packet_id          BIGINT,
     channel            INT,
     rx_time            BIGINT,
@@ -210,7 +304,7 @@ ALTER TABLE mesh_packet_metrics ADD COLUMN IF NOT EXISTS pki_encrypted BOOLEAN;
 CREATE TABLE IF NOT EXISTS local_stats
 (
     time                  TIMESTAMPTZ NOT NULL,
-    node_id               VARCHAR     NOT NULL,
+    node_id               BIGINT      NOT NULL,
     num_packets_tx        BIGINT,
     num_packets_rx        BIGINT,
     num_packets_rx_bad    BIGINT,
@@ -226,7 +320,7 @@ CREATE TABLE IF NOT EXISTS local_stats
 CREATE TABLE IF NOT EXISTS node_position_metrics
 (
     time            TIMESTAMPTZ NOT NULL,
-    node_id         VARCHAR     NOT NULL,
+    node_id         BIGINT      NOT NULL,
     latitude        INT,
     longitude       INT,
     altitude        INT,
@@ -239,6 +333,23 @@ CREATE TABLE IF NOT EXISTS node_position_metrics
     precision_bits  INT
 );
 
+-- Data freshness, written by the exporter once a minute: lag percentiles
+-- for the packets that arrived in that minute, per topic root, gateway and
+-- stage.  stage = 'gateway' is gateway rx_time -> exporter arrival;
+-- stage = 'commit' is exporter arrival -> mesh_packet_metrics row committed.
+CREATE TABLE IF NOT EXISTS ingest_lag
+(
+    time        TIMESTAMPTZ NOT NULL,
+    topic_root  VARCHAR     NOT NULL,
+    gateway_id  VARCHAR     NOT NULL,
+    stage       VARCHAR     NOT NULL,
+    samples     INT,
+    p50_seconds FLOAT,
+    p95_seconds FLOAT,
+    p99_seconds FLOAT,
+    max_seconds FLOAT
+);
+
 -- Convert each metric table to a hypertable. `if_not_exists => true` makes
 -- this a no-op when re-run.  Chunk interval is 1 day — mesh-radio data is
 -- low volume; bigger chunks would waste memory on indexes.
@@ -250,6 +361,7 @@ SELECT create_hypertable('pax_counter_metrics',  'time', chunk_time_interval =>
 SELECT create_hypertable('mesh_packet_metrics',  'time', chunk_time_interval => INTERVAL '1 day', if_not_exists => true);
 SELECT create_hypertable('local_stats',          'time', chunk_time_interval => INTERVAL '1 day', if_not_exists => true);
 SELECT create_hypertable('node_position_metrics','time', chunk_time_interval => INTERVAL '1 day', if_not_exists => true);
+SELECT create_hypertable('ingest_lag',           'time', chunk_time_interval => INTERVAL '1 day', if_not_exists => true);
 
 CREATE INDEX IF NOT EXISTS idx_device_metrics_node_id        ON device_metrics        (node_id, time DESC);
 CREATE INDEX IF NOT EXISTS idx_environment_metrics_node_id   ON environment_metrics   (node_id, time DESC);
@@ -261,6 +373,7 @@ CREATE INDEX IF NOT EXISTS idx_mesh_packet_metrics_dest      ON mesh_packet_metr
 CREATE INDEX IF NOT EXISTS idx_mesh_packet_metrics_portnum   ON mesh_packet_metrics   (portnum, time DESC);
 CREATE INDEX IF NOT EXISTS idx_local_stats_node_id           ON local_stats           (node_id, time DESC);
 CREATE INDEX IF NOT EXISTS idx_node_position_metrics_node_id ON node_position_metrics (node_id, time DESC);
+CREATE INDEX IF NOT EXISTS idx_ingest_lag_gateway            ON ingest_lag            (gateway_id, time DESC);
 
 -- ---------------------------------------------------------------------------
 -- Columnstore (compression).  Segment by the entity each query filters on
@@ -277,6 +390,7 @@ ALTER TABLE pax_counter_metrics   SET (timescaledb.enable_columnstore = true, ti
 ALTER TABLE mesh_packet_metrics   SET (timescaledb.enable_columnstore = true, timescaledb.segmentby = 'source_id', timescaledb.orderby = 'time DESC');
 ALTER TABLE local_stats           SET (timescaledb.enable_columnstore = true, timescaledb.segmentby = 'node_id',   timescaledb.orderby = 'time DESC');
 ALTER TABLE node_position_metrics SET (timescaledb.enable_columnstore = true, timescaledb.segmentby = 'node_id',   timescaledb.orderby = 'time DESC');
+ALTER TABLE ingest_lag            SET (timescaledb.enable_columnstore = true, timescaledb.segmentby = 'gateway_id', timescaledb.orderby = 'time DESC');
 
 -- Columnstore (compression) policies. `add_columnstore_policy` is a
 -- procedure, so it must be CALLed at the top level — table name has to be
@@ -290,6 +404,7 @@ CALL add_columnstore_policy('pax_counter_metrics',   after => INTERVAL '14 days'
 CALL add_columnstore_policy('mesh_packet_metrics',   after => INTERVAL '14 days', if_not_exists => true);
 CALL add_columnstore_policy('local_stats',           after => INTERVAL '14 days', if_not_exists => true);
 CALL add_columnstore_policy('node_position_metrics', after => INTERVAL '14 days', if_not_exists => true);
+CALL add_columnstore_policy('ingest_lag',            after => INTERVAL '14 days', if_not_exists => true);
 
 -- Retention policies (drop chunks older than 30 days).  Function form
 -- supports `if_not_exists => true` for idempotent re-runs.
@@ -301,6 +416,292 @@ SELECT add_retention_policy('pax_counter_metrics',   INTERVAL '30 days', if_not_
 SELECT add_retention_policy('mesh_packet_metrics',   INTERVAL '30 days', if_not_exists => true);
 SELECT add_retention_policy('local_stats',           INTERVAL '30 days', if_not_exists => true);
 SELECT add_retention_policy('node_position_metrics', INTERVAL '30 days', if_not_exists => true);
+SELECT add_retention_policy('ingest_lag',            INTERVAL '30 days', if_not_exists => true);
+
+-- ---------------------------------------------------------------------------
+-- Continuous aggregates behind the Overview and Investigation dashboards.
+--
+-- Dashboards read these instead of scanning raw packets and telemetry on
+-- every refresh.  `materialized_only = false` keeps real-time aggregation
+-- on: buckets newer than the last refresh are computed from the raw
+-- hypertable at query time, so the newest minutes still show up.
+--
+-- Averages are stored as SUM + COUNT so they stay exact when a panel
+-- re-groups buckets into wider intervals.  SNR / RSSI of 0 is the firmware
+-- default for "not measured" and is left out of the signal columns.
+-- ---------------------------------------------------------------------------
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS mesh_packet_1m
+WITH (timescaledb.continuous, timescaledb.materialized_only = false) AS
+SELECT time_bucket(INTERVAL '1 minute', time)                     AS bucket,
+       source_id,
+       portnum,
+       channel,
+       destination_id IN (4294967295, 1, 0)                       AS broadcast,
+       COUNT(*)                                                   AS packets,
+       SUM(message_size_bytes)                                    AS bytes,
+       COUNT(CASE WHEN hop_start > 0 THEN 1 END)                  AS hopped_packets,
+       MAX(CASE WHEN hop_start > 0 THEN hop_start END)            AS max_hop_start,
+       MAX(CASE WHEN hop_start > 0 THEN hop_start - hop_limit END) AS max_hops_taken,
+       COUNT(CASE WHEN rx_snr <> 0 THEN 1 END)                    AS snr_samples,
+       SUM(CASE WHEN rx_snr <> 0 THEN rx_snr END)                 AS snr_sum,
+       MIN(CASE WHEN rx_snr <> 0 THEN rx_snr END)                 AS snr_min,
+       MAX(CASE WHEN rx_snr <> 0 THEN rx_snr END)                 AS snr_max,
+       COUNT(CASE WHEN rx_rssi <> 0 THEN 1 END)                   AS rssi_samples,
+       SUM(CASE WHEN rx_rssi <> 0 THEN rx_rssi END)               AS rssi_sum,
+       MIN(CASE WHEN rx_rssi <> 0 THEN rx_rssi END)               AS rssi_min,
+       MAX(CASE WHEN rx_rssi <> 0 THEN rx_rssi END)               AS rssi_max
+FROM mesh_packet_metrics
+GROUP BY bucket, source_id, portnum, channel, broadcast;
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS device_metrics_5m
+WITH (timescaledb.continuous, timescaledb.materialized_only = false) AS
+SELECT time_bucket(INTERVAL '5 minutes', time) AS bucket,
+       node_id,
+       COUNT(*)                                 AS samples,
+       AVG(battery_level)                       AS battery_level_avg,
+       AVG(voltage)                             AS voltage_avg,
+       SUM(channel_utilization)                 AS channel_utilization_sum,
+       COUNT(channel_utilization)               AS channel_utilization_samples,
+       MAX(channel_utilization)                 AS channel_utilization_max,
+       SUM(air_util_tx)                         AS air_util_tx_sum,
+       COUNT(air_util_tx)                       AS air_util_tx_samples,
+       MAX(air_util_tx)                         AS air_util_tx_max,
+       MAX(uptime_seconds)                      AS uptime_seconds_max
+FROM device_metrics
+GROUP BY bucket, node_id;
+
+CREATE INDEX IF NOT EXISTS idx_mesh_packet_1m_source ON mesh_packet_1m    (source_id, bucket DESC);
+CREATE INDEX IF NOT EXISTS idx_device_metrics_5m_node ON device_metrics_5m (node_id, bucket DESC);
+
+-- Refresh policies.  Only ranges invalidated by new or late rows are
+-- re-materialized, so the wide start_offset is cheap; it lets rows
+-- replayed from the exporter's spool after an outage reach the aggregates.
+SELECT add_continuous_aggregate_policy('mesh_packet_1m',
+    start_offset => INTERVAL '1 day', end_offset => INTERVAL '1 minute',
+    schedule_interval => INTERVAL '1 minute', if_not_exists => true);
+SELECT add_continuous_aggregate_policy('device_metrics_5m',
+    start_offset => INTERVAL '1 day', end_offset => INTERVAL '5 minutes',
+    schedule_interval => INTERVAL '5 minutes', if_not_exists => true);
+
+SELECT add_retention_policy('mesh_packet_1m',    INTERVAL '30 days', if_not_exists => true);
+SELECT add_retention_policy('device_metrics_5m', INTERVAL '30 days', if_not_exists => true);
+
+-- ---------------------------------------------------------------------------
+-- Long-term telemetry tiers.  Raw telemetry is dropped after 30 days;
+-- hourly (<family>_1h, kept 180 days) and daily (<family>_1d, kept 5 years)
+-- rollups per node keep its history.  Each tier keeps the raw table's
+-- column names, with the bucket as `time`, so a dashboard query can switch
+-- tiers by table name alone (scripts/build_dashboards.py picks one from
+-- the time range and $__interval).  Gauges are averaged and uptime
+-- counters take the maximum.
+--
+-- Both tiers read the raw tables.  Their refresh windows end well inside
+-- the raw retention, so dropping raw chunks never removes rollup rows.
+-- ---------------------------------------------------------------------------
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS device_metrics_1h
+WITH (timescaledb.continuous, timescaledb.materialized_only = false) AS
+SELECT time_bucket(INTERVAL '1 hour', time) AS time,
+       node_id,
+       COUNT(*)                             AS samples,
+       AVG(battery_level)                   AS battery_level,
+       AVG(voltage)                         AS voltage,
+       AVG(channel_utilization)             AS channel_utilization,
+       AVG(air_util_tx)                     AS air_util_tx,
+       MAX(uptime_seconds)                  AS uptime_seconds
+FROM device_metrics
+GROUP BY time_bucket(INTERVAL '1 hour', time), node_id;
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS environment_metrics_1h
+WITH (timescaledb.continuous, timescaledb.materialized_only = false) AS
+SELECT time_bucket(INTERVAL '1 hour', time) AS time,
+       node_id,
+       COUNT(*)                             AS samples,
+       AVG(temperature)                     AS temperature,
+       AVG(relative_humidity)               AS relative_humidity,
+       AVG(barometric_pressure)             AS barometric_pressure,
+       AVG(gas_resistance)                  AS gas_resistance,
+       AVG(iaq)                             AS iaq,
+       AVG(distance)                        AS distance,
+       AVG(lux)                             AS lux,
+       AVG(white_lux)                       AS white_lux,
+       AVG(ir_lux)                          AS ir_lux,
+       AVG(uv_lux)                          AS uv_lux,
+       AVG(wind_direction)                  AS wind_direction,
+       AVG(wind_speed)                      AS wind_speed,
+       AVG(weight)                          AS weight
+FROM environment_metrics
+GROUP BY time_bucket(INTERVAL '1 hour', time), node_id;
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS air_quality_metrics_1h
+WITH (timescaledb.continuous, timescaledb.materialized_only = false) AS
+SELECT time_bucket(INTERVAL '1 hour', time) AS time,
+       node_id,
+       COUNT(*)                             AS samples,
+       AVG(pm10_standard)                   AS pm10_standard,
+       AVG(pm25_standard)                   AS pm25_standard,
+       AVG(pm100_standard)                  AS pm100_standard,
+       AVG(pm10_environmental)              AS pm10_environmental,
+       AVG(pm25_environmental)              AS pm25_environmental,
+       AVG(pm100_environmental)             AS pm100_environmental,
+       AVG(particles_03um)                  AS particles_03um,
+       AVG(particles_05um)                  AS particles_05um,
+       AVG(particles_10um)                  AS particles_10um,
+       AVG(particles_25um)                  AS particles_25um,
+       AVG(particles_50um)                  AS particles_50um,
+       AVG(particles_100um)                 AS particles_100um
+FROM air_quality_metrics
+GROUP BY time_bucket(INTERVAL '1 hour', time), node_id;
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS power_metrics_1h
+WITH (timescaledb.continuous, timescaledb.materialized_only = false) AS
+SELECT time_bucket(INTERVAL '1 hour', time) AS time,
+       node_id,
+       COUNT(*)                             AS samples,
+       AVG(ch1_voltage)                     AS ch1_voltage,
+       AVG(ch1_current)                     AS ch1_current,
+       AVG(ch2_voltage)                     AS ch2_voltage,
+       AVG(ch2_current)                     AS ch2_current,
+       AVG(ch3_voltage)                     AS ch3_voltage,
+       AVG(ch3_current)                     AS ch3_current
+FROM power_metrics
+GROUP BY time_bucket(INTERVAL '1 hour', time), node_id;
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS pax_counter_metrics_1h
+WITH (timescaledb.continuous, timescaledb.materialized_only = false) AS
+SELECT time_bucket(INTERVAL '1 hour', time) AS time,
+       node_id,
+       COUNT(*)                             AS samples,
+       AVG(wifi_stations)                   AS wifi_stations,
+       AVG(ble_beacons)                     AS ble_beacons,
+       MAX(uptime)                          AS uptime
+FROM pax_counter_metrics
+GROUP BY time_bucket(INTERVAL '1 hour', time), node_id;
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS device_metrics_1d
+WITH (timescaledb.continuous, timescaledb.materialized_only = false) AS
+SELECT time_bucket(INTERVAL '1 day', time) AS time,
+       node_id,
+       COUNT(*)                            AS samples,
+       AVG(battery_level)                  AS battery_level,
+       AVG(voltage)                        AS voltage,
+       AVG(channel_utilization)            AS channel_utilization,
+       AVG(air_util_tx)                    AS air_util_tx,
+       MAX(uptime_seconds)                 AS uptime_seconds
+FROM device_metrics
+GROUP BY time_bucket(INTERVAL '1 day', time), node_id;
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS environment_metrics_1d
+WITH (timescaledb.continuous, timescaledb.materialized_only = false) AS
+SELECT time_bucket(INTERVAL '1 day', time) AS time,
+       node_id,
+       COUNT(*)                            AS samples,
+       AVG(temperature)                    AS temperature,
+       AVG(relative_humidity)              AS relative_humidity,
+       AVG(barometric_pressure)            AS barometric_pressure,
+       AVG(gas_resistance)                 AS gas_resistance,
+       AVG(iaq)                            AS iaq,
+       AVG(distance)                       AS distance,
+       AVG(lux)                            AS lux,
+       AVG(white_lux)                      AS white_lux,
+       AVG(ir_lux)                         AS ir_lux,
+       AVG(uv_lux)                         AS uv_lux,
+       AVG(wind_direction)                 AS wind_direction,
+       AVG(wind_speed)                     AS wind_speed,
+       AVG(weight)                         AS weight
+FROM environment_metrics
+GROUP BY time_bucket(INTERVAL '1 day', time), node_id;
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS air_quality_metrics_1d
+WITH (timescaledb.continuous, timescaledb.materialized_only = false) AS
+SELECT time_bucket(INTERVAL '1 day', time) AS time,
+       node_id,
+       COUNT(*)                            AS samples,
+       AVG(pm10_standard)                  AS pm10_standard,
+       AVG(pm25_standard)                  AS pm25_standard,
+       AVG(pm100_standard)                 AS pm100_standard,
+       AVG(pm10_environmental)             AS pm10_environmental,
+       AVG(pm25_environmental)             AS pm25_environmental,
+       AVG(pm100_environmental)            AS pm100_environmental,
+       AVG(particles_03um)                 AS particles_03um,
+       AVG(particles_05um)                 AS particles_05um,
+       AVG(particles_10um)                 AS particles_10um,
+       AVG(particles_25um)                 AS particles_25um,
+       AVG(particles_50um)                 AS particles_50um,
+       AVG(particles_100um)                AS particles_100um
+FROM air_quality_metrics
+GROUP BY time_bucket(INTERVAL '1 day', time), node_id;
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS power_metrics_1d
+WITH (timescaledb.continuous, timescaledb.materialized_only = false) AS
+SELECT time_bucket(INTERVAL '1 day', time) AS time,
+       node_id,
+       COUNT(*)                            AS samples,
+       AVG(ch1_voltage)                    AS ch1_voltage,
+       AVG(ch1_current)                    AS ch1_current,
+       AVG(ch2_voltage)                    AS ch2_voltage,
+       AVG(ch2_current)                    AS ch2_current,
+       AVG(ch3_voltage)                    AS ch3_voltage,
+       AVG(ch3_current)                    AS ch3_current
+FROM power_metrics
+GROUP BY time_bucket(INTERVAL '1 day', time), node_id;
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS pax_counter_metrics_1d
+WITH (timescaledb.continuous, timescaledb.materialized_only = false) AS
+SELECT time_bucket(INTERVAL '1 day', time) AS time,
+       node_id,
+       COUNT(*)                            AS samples,
+       AVG(wifi_stations)                  AS wifi_stations,
+       AVG(ble_beacons)                    AS ble_beacons,
+       MAX(uptime)                         AS uptime
+FROM pax_counter_metrics
+GROUP BY time_bucket(INTERVAL '1 day', time), node_id;
+
+SELECT add_continuous_aggregate_policy('device_metrics_1h',      start_offset => INTERVAL '3 days', end_offset => INTERVAL '1 hour', schedule_interval => INTERVAL '30 minutes', if_not_exists => true);
+SELECT add_continuous_aggregate_policy('environment_metrics_1h', start_offset => INTERVAL '3 days', end_offset => INTERVAL '1 hour', schedule_interval => INTERVAL '30 minutes', if_not_exists => true);
+SELECT add_continuous_aggregate_policy('air_quality_metrics_1h', start_offset => INTERVAL '3 days', end_offset => INTERVAL '1 hour', schedule_interval => INTERVAL '30 minutes', if_not_exists => true);
+SELECT add_continuous_aggregate_policy('power_metrics_1h',       start_offset => INTERVAL '3 days', end_offset => INTERVAL '1 hour', schedule_interval => INTERVAL '30 minutes', if_not_exists => true);
+SELECT add_continuous_aggregate_policy('pax_counter_metrics_1h', start_offset => INTERVAL '3 days', end_offset => INTERVAL '1 hour', schedule_interval => INTERVAL '30 minutes', if_not_exists => true);
+SELECT add_continuous_aggregate_policy('device_metrics_1d',      start_offset => INTERVAL '7 days', end_offset => INTERVAL '1 day',  schedule_interval => INTERVAL '1 hour',     if_not_exists => true);
+SELECT add_continuous_aggregate_policy('environment_metrics_1d', start_offset => INTERVAL '7 days', end_offset => INTERVAL '1 day',  schedule_interval => INTERVAL '1 hour',     if_not_exists => true);
+SELECT add_continuous_aggregate_policy('air_quality_metrics_1d', start_offset => INTERVAL '7 days', end_offset => INTERVAL '1 day',  schedule_interval => INTERVAL '1 hour',     if_not_exists => true);
+SELECT add_continuous_aggregate_policy('power_metrics_1d',       start_offset => INTERVAL '7 days', end_offset => INTERVAL '1 day',  schedule_interval => INTERVAL '1 hour',     if_not_exists => true);
+SELECT add_continuous_aggregate_policy('pax_counter_metrics_1d', start_offset => INTERVAL '7 days', end_offset => INTERVAL '1 day',  schedule_interval => INTERVAL '1 hour',     if_not_exists => true);
+
+-- Compress tier chunks once they are past the refresh window.
+ALTER MATERIALIZED VIEW device_metrics_1h      SET (timescaledb.enable_columnstore = true);
+ALTER MATERIALIZED VIEW environment_metrics_1h SET (timescaledb.enable_columnstore = true);
+ALTER MATERIALIZED VIEW air_quality_metrics_1h SET (timescaledb.enable_columnstore = true);
+ALTER MATERIALIZED VIEW power_metrics_1h       SET (timescaledb.enable_columnstore = true);
+ALTER MATERIALIZED VIEW pax_counter_metrics_1h SET (timescaledb.enable_columnstore = true);
+ALTER MATERIALIZED VIEW device_metrics_1d      SET (timescaledb.enable_columnstore = true);
+ALTER MATERIALIZED VIEW environment_metrics_1d SET (timescaledb.enable_columnstore = true);
+ALTER MATERIALIZED VIEW air_quality_metrics_1d SET (timescaledb.enable_columnstore = true);
+ALTER MATERIALIZED VIEW power_metrics_1d       SET (timescaledb.enable_columnstore = true);
+ALTER MATERIALIZED VIEW pax_counter_metrics_1d SET (timescaledb.enable_columnstore = true);
+
+CALL add_columnstore_policy('device_metrics_1h',      after => INTERVAL '14 days', if_not_exists => true);
+CALL add_columnstore_policy('environment_metrics_1h', after => INTERVAL '14 days', if_not_exists => true);
+CALL add_columnstore_policy('air_quality_metrics_1h', after => INTERVAL '14 days', if_not_exists => true);
+CALL add_columnstore_policy('power_metrics_1h',       after => INTERVAL '14 days', if_not_exists => true);
+CALL add_columnstore_policy('pax_counter_metrics_1h', after => INTERVAL '14 days', if_not_exists => true);
+CALL add_columnstore_policy('device_metrics_1d',      after => INTERVAL '30 days', if_not_exists => true);
+CALL add_columnstore_policy('environment_metrics_1d', after => INTERVAL '30 days', if_not_exists => true);
+CALL add_columnstore_policy('air_quality_metrics_1d', after => INTERVAL '30 days', if_not_exists => true);
+CALL add_columnstore_policy('power_metrics_1d',       after => INTERVAL '30 days', if_not_exists => true);
+CALL add_columnstore_policy('pax_counter_metrics_1d', after => INTERVAL '30 days', if_not_exists => true);
+
+SELECT add_retention_policy('device_metrics_1h',      INTERVAL '180 days',  if_not_exists => true);
+SELECT add_retention_policy('environment_metrics_1h', INTERVAL '180 days',  if_not_exists => true);
+SELECT add_retention_policy('air_quality_metrics_1h', INTERVAL '180 days',  if_not_exists => true);
+SELECT add_retention_policy('power_metrics_1h',       INTERVAL '180 days',  if_not_exists => true);
+SELECT add_retention_policy('pax_counter_metrics_1h', INTERVAL '180 days',  if_not_exists => true);
+SELECT add_retention_policy('device_metrics_1d',      INTERVAL '1825 days', if_not_exists => true);
+SELECT add_retention_policy('environment_metrics_1d', INTERVAL '1825 days', if_not_exists => true);
+SELECT add_retention_policy('air_quality_metrics_1d', INTERVAL '1825 days', if_not_exists => true);
+SELECT add_retention_policy('power_metrics_1d',       INTERVAL '1825 days', if_not_exists => true);
+SELECT add_retention_policy('pax_counter_metrics_1d', INTERVAL '1825 days', if_not_exists => true);
 
 -- ---------------------------------------------------------------------------
 -- node_configurations maintenance
@@ -416,12 +817,20 @@ DROP TRIGGER IF EXISTS trigger_environment_metrics_insert ON environment_metrics
 DROP TRIGGER IF EXISTS trigger_air_quality_metrics_insert ON air_quality_metrics;
 DROP TRIGGER IF EXISTS trigger_power_metrics_insert       ON power_metrics;
 DROP TRIGGER IF EXISTS trigger_pax_counter_metrics_insert ON pax_counter_metrics;
-DROP TRIGGER IF EXISTS trigger_expire_old_messages        ON messages;
 DROP FUNCTION IF EXISTS update_node_configurations();
 DROP FUNCTION IF EXISTS expire_old_messages();
 DROP FUNCTION IF EXISTS calculate_update_intervals();
 DROP PROCEDURE IF EXISTS calculate_update_intervals_job(int, jsonb);
 
+DO $$
+BEGIN
+    PERFORM delete_job(job_id) FROM timescaledb_information.jobs
+    WHERE proc_name = 'messages_cleanup_job';
+EXCEPTION WHEN OTHERS THEN
+    RAISE NOTICE 'messages_cleanup job: %', SQLERRM;
+END $$;
+DROP PROCEDURE IF EXISTS messages_cleanup_job(int, jsonb);
+
 -- Schedule the refresh job hourly.  Idempotent: add_job throws if the same
 -- name already exists.
 DO $$
@@ -435,82 +844,189 @@ EXCEPTION WHEN OTHERS THEN
     RAISE NOTICE 'refresh_node_configurations job: %', SQLERRM;
 END $$;
 
--- Also schedule cleanup of the dedup `messages` table.  Replaces the
--- per-row trigger that DELETEd on every INSERT.
-CREATE OR REPLACE PROCEDURE messages_cleanup_job(job_id int, config jsonb)
+-- Also schedule expiry of the dedup ring: truncate the partition of the
+-- slot before the current one.  Claims no longer write to it, except a
+-- transaction that started in that slot, whose next-slot row survives.
+CREATE OR REPLACE PROCEDURE packet_dedup_cleanup_job(job_id int, config jsonb)
 LANGUAGE plpgsql
 AS $$
+DECLARE
+    ring int;
 BEGIN
-    DELETE FROM messages WHERE received_at < NOW() - INTERVAL '5 minutes';
+    SELECT (min(s) + 2) % 3 INTO ring FROM packet_dedup_slots(NOW()) s;
+    EXECUTE format('TRUNCATE packet_dedup_%s', ring);
 END;
 $$;
 
 DO $$
 BEGIN
     PERFORM add_job(
-        proc => 'messages_cleanup_job',
+        proc => 'packet_dedup_cleanup_job',
         schedule_interval => INTERVAL '1 minute',
-        job_name => 'messages_cleanup_minutely'
+        job_name => 'packet_dedup_cleanup_minutely'
     );
 EXCEPTION WHEN OTHERS THEN
-    RAISE NOTICE 'messages_cleanup job: %', SQLERRM;
+    RAISE NOTICE 'packet_dedup_cleanup job: %', SQLERRM;
 END $$;
 
 -- ---------------------------------------------------------------------------
--- Convenience view used by db_handler.get_latest_metrics().
+-- Convenience view used by db_handler.get_latest_metrics().  A plain join
+-- on node_latest; the exporter keeps that table current.
 -- ---------------------------------------------------------------------------
 
+-- Seed node_latest from telemetry already stored, e.g. when this file is
+-- re-run on a volume from before node_latest existed.  Families the
+-- exporter has already written are left alone.
+INSERT INTO node_latest (node_id, device_time,
+                          battery_level, voltage, channel_utilization,
+                          air_util_tx, uptime_seconds)
+SELECT DISTINCT ON (node_id) node_id, time,
+       battery_level, voltage, channel_utilization, air_util_tx,
+       uptime_seconds
+FROM device_metrics ORDER BY node_id, time DESC
+ON CONFLICT (node_id) DO UPDATE
+SET (device_time,
+     battery_level, voltage, channel_utilization, air_util_tx, uptime_seconds) =
+    (EXCLUDED.device_time,
+     EXCLUDED.battery_level, EXCLUDED.voltage, EXCLUDED.channel_utilization,
+     EXCLUDED.air_util_tx, EXCLUDED.uptime_seconds)
+WHERE node_latest.device_time IS NULL;
+
+INSERT INTO node_latest (node_id, environment_time,
+                          temperature, relative_humidity, barometric_pressure,
+                          gas_resistance, iaq, distance, lux, white_lux,
+                          ir_lux, uv_lux, wind_direction, wind_speed, weight)
+SELECT DISTINCT ON (node_id) node_id, time,
+       temperature, relative_humidity, barometric_pressure, gas_resistance,
+       iaq, distance, lux, white_lux, ir_lux, uv_lux, wind_direction,
+       wind_speed, weight
+FROM environment_metrics ORDER BY node_id, time DESC
+ON CONFLICT (node_id) DO UPDATE
+SET (environment_time,
+     temperature, relative_humidity, barometric_pressure, gas_resistance, iaq,
+     distance, lux, white_lux, ir_lux, uv_lux, wind_direction, wind_speed,
+     weight) =
+    (EXCLUDED.environment_time,
+     EXCLUDED.temperature, EXCLUDED.relative_humidity,
+     EXCLUDED.barometric_pressure, EXCLUDED.gas_resistance, EXCLUDED.iaq,
+     EXCLUDED.distance, EXCLUDED.lux, EXCLUDED.white_lux, EXCLUDED.ir_lux,
+     EXCLUDED.uv_lux, EXCLUDED.wind_direction, EXCLUDED.wind_speed,
+     EXCLUDED.weight)
+WHERE node_latest.environment_time IS NULL;
+
+INSERT INTO node_latest (node_id, air_quality_time,
+                          pm10_standard, pm25_standard, pm100_standard,
+                          pm10_environmental, pm25_environmental,
+                          pm100_environmental, particles_03um, particles_05um,
+                          particles_10um, particles_25um, particles_50um,
+                          particles_100um)
+SELECT DISTINCT ON (node_id) node_id, time,
+       pm10_standard, pm25_standard, pm100_standard, pm10_environmental,
+       pm25_environmental, pm100_environmental, particles_03um,
+       particles_05um, particles_10um, particles_25um, particles_50um,
+       particles_100um
+FROM air_quality_metrics ORDER BY node_id, time DESC
+ON CONFLICT (node_id) DO UPDATE
+SET (air_quality_time,
+     pm10_standard, pm25_standard, pm100_standard, pm10_environmental,
+     pm25_environmental, pm100_environmental, particles_03um, particles_05um,
+     particles_10um, particles_25um, particles_50um, particles_100um) =
+    (EXCLUDED.air_quality_time,
+     EXCLUDED.pm10_standard, EXCLUDED.pm25_standard, EXCLUDED.pm100_standard,
+     EXCLUDED.pm10_environmental, EXCLUDED.pm25_environmental,
+     EXCLUDED.pm100_environmental, EXCLUDED.particles_03um,
+     EXCLUDED.particles_05um, EXCLUDED.particles_10um,
+     EXCLUDED.particles_25um, EXCLUDED.particles_50um,
+     EXCLUDED.particles_100um)
+WHERE node_latest.air_quality_time IS NULL;
+
+INSERT INTO node_latest (node_id, power_time,
+                          ch1_voltage, ch1_current, ch2_voltage, ch2_current,
+                          ch3_voltage, ch3_current)
+SELECT DISTINCT ON (node_id) node_id, time,
+       ch1_voltage, ch1_current, ch2_voltage, ch2_current, ch3_voltage,
+       ch3_current
+FROM power_metrics ORDER BY node_id, time DESC
+ON CONFLICT (node_id) DO UPDATE
+SET (power_time,
+     ch1_voltage, ch1_current, ch2_voltage, ch2_current, ch3_voltage,
+     ch3_current) =
+    (EXCLUDED.power_time,
+     EXCLUDED.ch1_voltage, EXCLUDED.ch1_current, EXCLUDED.ch2_voltage,
+     EXCLUDED.ch2_current, EXCLUDED.ch3_voltage, EXCLUDED.ch3_current)
+WHERE node_latest.power_time IS NULL;
+
 CREATE OR REPLACE VIEW node_telemetry AS
 SELECT d.node_id,
        d.short_name,
        d.long_name,
        d.hardware_model,
        d.role,
-       dm.time AS device_time,
-       dm.battery_level,
-       dm.voltage,
-       dm.channel_utilization,
-       dm.air_util_tx,
-       dm.uptime_seconds,
-       em.time AS environment_time,
-       em.temperature,
-       em.relative_humidity,
-       em.barometric_pressure,
-       em.gas_resistance,
-       em.iaq,
-       em.distance,
-       em.lux,
-       em.white_lux,
-       em.ir_lux,
-       em.uv_lux,
-       em.wind_direction,
-       em.wind_speed,
-       em.weight,
-       aq.time AS air_quality_time,
-       aq.pm10_standard,
-       aq.pm25_standard,
-       aq.pm100_standard,
-       aq.pm10_environmental,
-       aq.pm25_environmental,
-       aq.pm100_environmental,
-       aq.particles_03um,
-       aq.particles_05um,
-       aq.particles_10um,
-       aq.particles_25um,
-       aq.particles_50um,
-       aq.particles_100um,
-       pm.time AS power_time,
-       pm.ch1_voltage,
-       pm.ch1_current,
-       pm.ch2_voltage,
-       pm.ch2_current,
-       pm.ch3_voltage,
-       pm.ch3_current
+       l.device_time,
+       l.battery_level,
+       l.voltage,
+       l.channel_utilization,
+       l.air_util_tx,
+       l.uptime_seconds,
+       l.environment_time,
+       l.temperature,
+       l.relative_humidity,
+       l.barometric_pressure,
+       l.gas_resistance,
+       l.iaq,
+       l.distance,
+       l.lux,
+       l.white_lux,
+       l.ir_lux,
+       l.uv_lux,
+       l.wind_direction,
+       l.wind_speed,
+       l.weight,
+       l.air_quality_time,
+       l.pm10_standard,
+       l.pm25_standard,
+       l.pm100_standard,
+       l.pm10_environmental,
+       l.pm25_environmental,
+       l.pm100_environmental,
+       l.particles_03um,
+       l.particles_05um,
+       l.particles_10um,
+       l.particles_25um,
+       l.particles_50um,
+       l.particles_100um,
+       l.power_time,
+       l.ch1_voltage,
+       l.ch1_current,
+       l.ch2_voltage,
+       l.ch2_current,
+       l.ch3_voltage,
+       l.ch3_current
 FROM node_details d
-LEFT JOIN LATERAL (SELECT * FROM device_metrics      WHERE node_id = d.node_id ORDER BY time DESC LIMIT 1) dm ON true
-LEFT JOIN LATERAL (SELECT * FROM environment_metrics WHERE node_id = d.node_id ORDER BY time DESC LIMIT 1) em ON true
-LEFT JOIN LATERAL (SELECT * FROM air_quality_metrics WHERE node_id = d.node_id ORDER BY time DESC LIMIT 1) aq ON true
-LEFT JOIN LATERAL (SELECT * FROM power_metrics       WHERE node_id = d.node_id ORDER BY time DESC LIMIT 1) pm ON true;
+LEFT JOIN node_latest l ON l.node_id = d.node_id;
+
+-- mesh_packet_metrics with port names instead of numbers, for ad-hoc
+-- queries.  Dashboards group on the number and look up the names of the
+-- result rows only.
+CREATE OR REPLACE VIEW mesh_packets AS
+SELECT m.time,
+       m.source_id,
+       m.destination_id,
+       COALESCE(p.name, m.portnum::text) AS portnum,
+       m.packet_id,
+       m.channel,
+       m.rx_time,
+       m.rx_snr,
+       m.rx_rssi,
+       m.hop_limit,
+       m.hop_start,
+       m.want_ack,
+       m.via_mqtt,
+       m.message_size_bytes,
+       m.priority,
+       m.pki_encrypted
+FROM mesh_packet_metrics m
+LEFT JOIN port_names p ON p.portnum = m.portnum;
 
 -- Run once at init so the configurations side-table reflects any data that
 -- may already be present.
@@ -0,0 +1,160 @@
+"""Load shedding by port priority when the ingest backlog grows.
+
+A burst such as a firmware push or a storm of NodeInfo broadcasts can
+outrun the database.  The queues then fill, and what is lost depends on
+timing.  :class:`AdmissionController` sits in front of
+``MessageProcessor.process`` and sheds the least valuable work first,
+based on the backlog (``load``, a 0..1 fill fraction of the ingest
+queues and the batch writer):
+
+``SHED_LOW_PRIORITY``
+    Packets on ports nothing is stored for are dropped outright.  These
+    are the parse-and-drop ``_noop`` ports and
+    ``TEXT_MESSAGE_COMPRESSED_APP``.
+``SHED_PACKET_ROWS``
+    In addition, packets on every port except ``TELEMETRY_APP`` skip
+    their ``mesh_packet_metrics`` row and the destination lookup it
+    needs.  The port's own processor still runs, so positions, node info
+    and the rest are still stored.
+
+Packets on ``TELEMETRY_APP``, ``POSITION_APP`` and ``NODEINFO_APP`` are
+never dropped, but only telemetry keeps its packet row at
+``SHED_PACKET_ROWS``; Position and NodeInfo keep only what their
+processors store.
+A level is entered when ``load`` reaches its watermark and left once
+``load`` falls below ``recover_ratio`` times that watermark, so the
+controller doesn't flap around a threshold.
+"""
+
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List
+
+try:
+    from meshtastic.portnums_pb2 import PortNum
+except ImportError:
+    from meshtastic.protobuf.portnums_pb2 import PortNum
+
+from exporter import enums
+from exporter.metric import instruments
+
+logger = logging.getLogger(__name__)
+
+NORMAL = 0
+SHED_LOW_PRIORITY = 1
+SHED_PACKET_ROWS = 2
+LEVEL_NAMES = ("normal", "shed_low_priority", "shed_packet_rows")
+
+# Never dropped; only PACKET_ROW_PORTS also keep their packet row.
+PROTECTED_PORTS = frozenset(
+    {PortNum.TELEMETRY_APP, PortNum.POSITION_APP, PortNum.NODEINFO_APP}
+)
+# The one port whose mesh_packet_metrics row survives SHED_PACKET_ROWS;
+# Position and NodeInfo rows are shed with the rest.
+PACKET_ROW_PORTS = frozenset({PortNum.TELEMETRY_APP})
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        load: Callable[[], float],
+        sheddable_ports: Iterable[int],
+        shed_at: float = 0.5,
+        shed_packet_rows_at: float = 0.8,
+        recover_ratio: float = 0.5,
+        check_interval: float = 0.25,
+    ):
+        self.load = load
+        self.sheddable_ports = frozenset(sheddable_ports) - PROTECTED_PORTS
+        # A watermark of 0 disables its level.
+        self.watermarks = (shed_at, shed_packet_rows_at)
+        self.recover_ratio = recover_ratio
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._level = NORMAL
+        self._load = 0.0
+        self._checked_at = float("-inf")
+        self._transitions = 0
+        # port -> [packets shed, packet rows shed]
+        self._shed: Dict[int, List[int]] = {}
+
+    @property
+    def level(self) -> int:
+        now = time.monotonic()
+        if now - self._checked_at >= self.check_interval:
+            self._update(now)
+        return self._level
+
+    def admit(self, port_num: int) -> bool:
+        """False when the packet should be dropped before any work."""
+        if port_num not in self.sheddable_ports or self.level < SHED_LOW_PRIORITY:
+            return True
+        self._count(port_num, 0)
+        return False
+
+    def store_packet_row(self, port_num: int) -> bool:
+        """False when the packet's ``mesh_packet_metrics`` row should be
+        skipped."""
+        if port_num in PACKET_ROW_PORTS or self.level < SHED_PACKET_ROWS:
+            return True
+        self._count(port_num, 1)
+        return False
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out: Dict[str, Any] = {
+                "level": self._level,
+                "load": round(self._load, 3),
+                "transitions_total": self._transitions,
+            }
+            for port_num, (packets, rows) in self._shed.items():
+                out[enums.port_name(port_num)] = {
+                    "shed_packets_total": packets,
+                    "shed_packet_rows_total": rows,
+                }
+            return out
+
+    # ---------- internals ----------
+
+    def _update(self, now: float):
+        self._checked_at = now
+        try:
+            load = self.load()
+        except Exception as e:
+            logger.debug(f"Admission load check failed: {e}")
+            return
+        with self._lock:
+            self._load = load
+            level = self._level
+            target = NORMAL
+            for index, mark in enumerate(self.watermarks):
+                if mark and load >= mark:
+                    target = index + 1
+            if target > level:
+                level = target
+            # Step down past every level we are well below.
+            while level > target:
+                mark = self.watermarks[level - 1]
+                if mark and load >= mark * self.recover_ratio:
+                    break
+                level -= 1
+            if level == self._level:
+                return
+            previous, self._level = self._level, level
+            self._transitions += 1
+        log = logger.warning if level > previous else logger.info
+        log(
+            f"Ingest load {load:.0%}: admission {LEVEL_NAMES[previous]} -> "
+            f"{LEVEL_NAMES[level]}"
+        )
+        instruments.ADMISSION_LEVEL.set(level)
+
+    def _count(self, port_num: int, what: int):
+        with self._lock:
+            counts = self._shed.get(port_num)
+            if counts is None:
+                counts = self._shed[port_num] = [0, 0]
+            counts[what] += 1
+        packets, rows = instruments.shed_series(port_num)
+        (rows if what else packets).inc()
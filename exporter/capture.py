@@ -0,0 +1,109 @@
+"""Capture file for raw MQTT traffic, for offline replay and benchmarks.
+
+The file starts with :data:`MAGIC`.  Each record after it is a
+little-endian ``(receive time as float64 seconds, topic length as
+uint16, payload length as uint32)`` header, followed by the UTF-8 topic
+and the raw payload.  A capture can be replayed with
+``scripts/replay_capture.py``.
+
+:class:`CaptureWriter` rotates the way ``RotatingFileHandler`` does.
+Once the file passes ``max_bytes`` it is renamed to ``<path>.1``, older
+files shift up, and at most ``backup_count`` of them are kept.
+"""
+
+import os
+import struct
+import threading
+from typing import BinaryIO, Iterator, Optional, Tuple
+
+MAGIC = b"MMXCAP1\n"
+RECORD_HEADER = struct.Struct("<dHI")
+
+CaptureRecord = Tuple[float, str, bytes]
+
+
+class CaptureWriter:
+    def __init__(self, path: str, max_bytes: int = 0, backup_count: int = 5):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self._lock = threading.Lock()
+        self._file: Optional[BinaryIO] = None
+        self._size = 0
+        self._records = 0
+        self._bytes = 0
+        self._rotations = 0
+        self._open()
+
+    def write(self, received_at: float, topic: str, payload: bytes):
+        encoded = topic.encode("utf-8")
+        record = RECORD_HEADER.pack(received_at, len(encoded), len(payload))
+        with self._lock:
+            if self._file is None:
+                return
+            written = len(record) + len(encoded) + len(payload)
+            # A record bigger than max_bytes on its own still gets written,
+            # rather than rotating out a file with no records in it.
+            if (
+                self.max_bytes
+                and self._size + written > self.max_bytes
+                and self._size > len(MAGIC)
+            ):
+                self._rotate()
+            self._file.write(record)
+            self._file.write(encoded)
+            self._file.write(payload)
+            self._size += written
+            self._bytes += written
+            self._records += 1
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def stats(self):
+        with self._lock:
+            return {
+                "records_total": self._records,
+                "bytes_total": self._bytes,
+                "rotations_total": self._rotations,
+            }
+
+    def _open(self):
+        self._file = open(self.path, "ab")
+        if self._file.tell() == 0:
+            self._file.write(MAGIC)
+        self._size = self._file.tell()
+
+    def _rotate(self):
+        self._file.close()
+        if self.backup_count > 0:
+            for i in range(self.backup_count - 1, 0, -1):
+                src = f"{self.path}.{i}"
+                if os.path.exists(src):
+                    os.replace(src, f"{self.path}.{i + 1}")
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self._rotations += 1
+        self._open()
+
+
+def read_capture(path: str) -> Iterator[CaptureRecord]:
+    """Yield ``(received_at, topic, payload)`` records.  A record cut off
+    by a crash mid-write ends the iteration instead of raising."""
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a capture file")
+        while True:
+            header = f.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                return
+            received_at, topic_len, payload_len = RECORD_HEADER.unpack(header)
+            topic = f.read(topic_len)
+            payload = f.read(payload_len)
+            if len(topic) < topic_len or len(payload) < payload_len:
+                return
+            yield received_at, topic.decode("utf-8"), payload
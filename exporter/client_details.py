@@ -5,6 +5,8 @@ except ImportError:
     from meshtastic.protobuf.config_pb2 import Config
     from meshtastic.protobuf.mesh_pb2 import HardwareModel
 
+from exporter import enums
+
 
 class ClientDetails:
     def __init__(self, node_id, short_name='Unknown', long_name='Unknown', hardware_model=HardwareModel.UNSET,
@@ -26,16 +28,8 @@ class ClientDetails:
 
     @staticmethod
     def get_role_name_from_role(role):
-        descriptor = Config.DeviceConfig.Role.DESCRIPTOR
-        for enum_value in descriptor.values:
-            if enum_value.number == role or enum_value.name == role:
-                return enum_value.name
-        return 'UNKNOWN_ROLE'
+        return enums.role_name(role)
 
     @staticmethod
     def get_hardware_model_name_from_code(hardware_model):
-        descriptor = HardwareModel.DESCRIPTOR
-        for enum_value in descriptor.values:
-            if enum_value.number == hardware_model or enum_value.name == hardware_model:
-                return enum_value.name
-        return 'UNKNOWN_HARDWARE_MODEL'
+        return enums.hardware_model_name(hardware_model)
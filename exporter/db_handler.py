@@ -1,15 +1,54 @@
+import logging
+import threading
+import time
+from contextlib import ExitStack
 from datetime import datetime
-from typing import Any, Dict, Iterable
+from functools import partial
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
 
+import psycopg
 from psycopg_pool import ConnectionPool
 
+from exporter.extractors import RowExtractor
+from exporter.freshness import Arrival, LagTracker
+from exporter.metric import instruments
+from exporter.node_cache import NodeCache
+from exporter.node_state import NodeStateWriter, upsert_nodes
+from exporter.spool import Spool, SpooledBatch
 
-BROADCAST_NODE_IDS = {"4294967295", "1"}
+logger = logging.getLogger(__name__)
+
+
+BROADCAST_NODE_IDS = {4294967295, 1}
+
+# Hypertable columns that reference node_details.  The batch writer makes
+# sure those nodes exist (one set-based INSERT) before COPYing the rows.
+NODE_REFERENCE_COLUMNS = {"mesh_packet_metrics": ("source_id", "destination_id")}
+
+# Telemetry tables whose newest row per node is kept in node_latest, and
+# the prefix of that family's timestamp column there.
+LATEST_FAMILIES = {
+    "device_metrics": "device",
+    "environment_metrics": "environment",
+    "air_quality_metrics": "air_quality",
+    "power_metrics": "power",
+}
 
 
 class DBHandler:
-    def __init__(self, db_pool: ConnectionPool):
+    def __init__(
+        self,
+        db_pool: ConnectionPool,
+        writer: Optional["BatchWriter"] = None,
+        node_cache: Optional[NodeCache] = None,
+        node_state: Optional[NodeStateWriter] = None,
+        node_latest: Optional[NodeStateWriter] = None,
+    ):
         self.db_pool = db_pool
+        self.writer = writer
+        self.node_cache = node_cache
+        self.node_state = node_state
+        self.node_latest = node_latest
 
     def get_connection(self):
         return self.db_pool.getconn()
@@ -17,55 +56,185 @@ class DBHandler:
     def release_connection(self, conn):
         self.db_pool.putconn(conn)
 
-    def execute_db_operation(self, operation):
+    def execute_db_operation(self, operation, uow: Optional["UnitOfWork"] = None):
+        if uow is not None:
+            return uow.run(operation)
         with self.db_pool.connection() as conn:
             with conn.cursor() as cur:
                 return operation(cur, conn)
 
-    def store_device_metrics(self, node_id: str, metrics: Dict[str, Any]):
-        self._insert_node_metrics("device_metrics", node_id, metrics)
+    def store_device_metrics(
+        self, node_id: int, metrics: Dict[str, Any], uow: Optional["UnitOfWork"] = None
+    ):
+        self._insert_node_metrics("device_metrics", node_id, metrics, uow)
 
-    def store_environment_metrics(self, node_id: str, metrics: Dict[str, Any]):
-        self._insert_node_metrics("environment_metrics", node_id, metrics)
+    def store_environment_metrics(
+        self, node_id: int, metrics: Dict[str, Any], uow: Optional["UnitOfWork"] = None
+    ):
+        self._insert_node_metrics("environment_metrics", node_id, metrics, uow)
 
-    def store_air_quality_metrics(self, node_id: str, metrics: Dict[str, Any]):
-        self._insert_node_metrics("air_quality_metrics", node_id, metrics)
+    def store_air_quality_metrics(
+        self, node_id: int, metrics: Dict[str, Any], uow: Optional["UnitOfWork"] = None
+    ):
+        self._insert_node_metrics("air_quality_metrics", node_id, metrics, uow)
 
-    def store_power_metrics(self, node_id: str, metrics: Dict[str, Any]):
-        self._insert_node_metrics("power_metrics", node_id, metrics)
+    def store_power_metrics(
+        self, node_id: int, metrics: Dict[str, Any], uow: Optional["UnitOfWork"] = None
+    ):
+        self._insert_node_metrics("power_metrics", node_id, metrics, uow)
 
-    def store_pax_counter_metrics(self, node_id: str, metrics: Dict[str, Any]):
-        self._insert_node_metrics("pax_counter_metrics", node_id, metrics)
+    def store_pax_counter_metrics(
+        self, node_id: int, metrics: Dict[str, Any], uow: Optional["UnitOfWork"] = None
+    ):
+        self._insert_node_metrics("pax_counter_metrics", node_id, metrics, uow)
 
-    def store_local_stats(self, node_id: str, metrics: Dict[str, Any]):
-        self._insert_node_metrics("local_stats", node_id, metrics)
+    def store_local_stats(
+        self, node_id: int, metrics: Dict[str, Any], uow: Optional["UnitOfWork"] = None
+    ):
+        self._insert_node_metrics("local_stats", node_id, metrics, uow)
 
-    def store_node_position(self, node_id: str, metrics: Dict[str, Any]):
-        self._insert_node_metrics("node_position_metrics", node_id, metrics)
+    def store_node_position(
+        self, node_id: int, metrics: Dict[str, Any], uow: Optional["UnitOfWork"] = None
+    ):
+        self._insert_node_metrics("node_position_metrics", node_id, metrics, uow)
+
+    def store_message(
+        self,
+        extractor: RowExtractor,
+        node_id: int,
+        message,
+        uow: Optional["UnitOfWork"] = None,
+    ):
+        """Store one node metrics row taken from ``message`` by
+        ``extractor``, in the extractor's column order."""
+        values = (datetime.now(), node_id) + extractor.values(message)
+        latest = None
+        if self.node_latest is not None:
+            latest = self._latest_update(
+                extractor.table, node_id, zip(extractor.columns, values)
+            )
+        if self.writer is not None:
+            self.writer.add_values(
+                extractor.table, extractor.columns, values, after_commit=latest
+            )
+            return
+        if uow is not None:
+            uow.execute(extractor.sql, values)
+            if latest is not None:
+                uow.after_commit(latest)
+            return
+        with self.db_pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(extractor.sql, values)
+                conn.commit()
+        if latest is not None:
+            latest()
 
     def store_mesh_packet_metrics(
-        self, source_id: str, destination_id: str, metrics: Dict[str, Any]
+        self,
+        source_id: int,
+        destination_id: int,
+        metrics: Dict[str, Any],
+        uow: Optional["UnitOfWork"] = None,
+        arrival: Optional[Arrival] = None,
     ):
         if not metrics:
             return
 
+        row = {
+            "time": datetime.now(),
+            "source_id": source_id,
+            "destination_id": destination_id,
+            **metrics,
+        }
+        if self.writer is not None:
+            self.writer.add("mesh_packet_metrics", row, arrival)
+            return
+        if uow is not None:
+            _ensure_nodes_exist(uow, {source_id, destination_id})
+            self._insert_row(uow, "mesh_packet_metrics", row)
+            return
+
         with self.db_pool.connection() as conn:
             with conn.cursor() as cur:
                 self._ensure_node_exists(cur, source_id)
                 self._ensure_node_exists(cur, destination_id)
-                self._insert_row(
-                    cur,
-                    "mesh_packet_metrics",
-                    {
-                        "time": datetime.now(),
-                        "source_id": source_id,
-                        "destination_id": destination_id,
-                        **metrics,
-                    },
+                self._insert_row(cur, "mesh_packet_metrics", row)
+                conn.commit()
+
+    def update_node_details(
+        self,
+        node_id: int,
+        columns: Dict[str, Any],
+        defaults: Optional[Dict[str, Any]] = None,
+        touch: bool = True,
+        uow: Optional["UnitOfWork"] = None,
+    ):
+        """Upsert state columns of a ``node_details`` row.  ``defaults``
+        only fill in a new row; with ``touch`` ``updated_at`` is set too.
+        Coalesced through the node state writer when there is one."""
+        if self.node_state is not None:
+            self.node_state.update(node_id, columns, defaults, touch)
+            return
+        if touch:
+            columns = {**columns, "updated_at": datetime.now()}
+
+        def db_op(cur, conn):
+            upsert_nodes(cur, {node_id: (columns, defaults or {})})
+            conn.commit()
+
+        self.execute_db_operation(db_op, uow)
+
+    def store_ingest_lag(self, rows: List[Dict[str, Any]]):
+        """Per-minute lag percentiles from :class:`~exporter.freshness.LagTracker`."""
+        if self.writer is not None:
+            for row in rows:
+                self.writer.add("ingest_lag", row)
+            return
+        with self.db_pool.connection() as conn:
+            with conn.cursor() as cur:
+                for row in rows:
+                    self._insert_row(cur, "ingest_lag", row)
+                conn.commit()
+
+    def claim_message(self, sender: int, packet_id: int) -> bool:
+        """Shared dedup for multi-instance deployments.  Returns True when
+        this call is the first to record ``(sender, packet_id)``: only the
+        first claim gets both its current- and next-slot rows into
+        ``packet_dedup``."""
+        with self.db_pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "INSERT INTO packet_dedup (ring, slot, sender, packet_id) "
+                    "SELECT s %% 3, s, %s, %s FROM packet_dedup_slots(NOW()) s "
+                    "ON CONFLICT DO NOTHING RETURNING slot",
+                    (sender, packet_id),
                 )
+                claimed = len(cur.fetchall()) == 2
                 conn.commit()
+                return claimed
+
+    def load_node_details(self, limit: int) -> List[tuple]:
+        """Most recently updated nodes first, for warming the node cache."""
+        with self.db_pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "SELECT node_id, short_name, long_name, hardware_model, role "
+                    "FROM node_details ORDER BY updated_at DESC LIMIT %s",
+                    (limit,),
+                )
+                return cur.fetchall()
 
-    def get_latest_metrics(self, node_id: str) -> Dict[str, Any]:
+    def store_port_names(self, names: Dict[int, str]) -> int:
+        """Upsert ``{port number: name}`` into ``port_names``."""
+        with self.db_pool.connection() as conn:
+            with conn.cursor() as cur:
+                upsert_port_names(cur, names)
+            conn.commit()
+        return len(names)
+
+    def get_latest_metrics(self, node_id: int) -> Dict[str, Any]:
+        """The node's details joined with its ``node_latest`` row."""
         with self.db_pool.connection() as conn:
             with conn.cursor() as cur:
                 cur.execute(
@@ -80,17 +249,53 @@ class DBHandler:
 
     # ---------- internals ----------
 
-    def _insert_node_metrics(self, table: str, node_id: str, metrics: Dict[str, Any]):
+    def _insert_node_metrics(
+        self,
+        table: str,
+        node_id: int,
+        metrics: Dict[str, Any],
+        uow: Optional["UnitOfWork"] = None,
+    ):
         if not metrics:
             return
+        row = {"time": datetime.now(), "node_id": node_id, **metrics}
+        latest = None
+        if self.node_latest is not None:
+            latest = self._latest_update(table, node_id, row.items())
+        if self.writer is not None:
+            self.writer.add(table, row, after_commit=latest)
+            return
+        if uow is not None:
+            self._insert_row(uow, table, row)
+            if latest is not None:
+                uow.after_commit(latest)
+            return
         with self.db_pool.connection() as conn:
             with conn.cursor() as cur:
-                self._insert_row(
-                    cur,
-                    table,
-                    {"time": datetime.now(), "node_id": node_id, **metrics},
-                )
+                self._insert_row(cur, table, row)
                 conn.commit()
+        if latest is not None:
+            latest()
+
+    def _latest_update(
+        self, table: str, node_id: int, row: Iterable[Tuple[str, Any]]
+    ) -> Optional[Callable[[], None]]:
+        """The ``node_latest`` update that records the ``(column, value)``
+        pairs of ``row`` as ``node_id``'s newest reading of its family, to
+        run once the row has committed.  The values the row carries
+        replace the stored ones.  NULLs (fields the message didn't set) and
+        the family's other columns keep their last known values.  None for
+        tables without a family."""
+        family = LATEST_FAMILIES.get(table)
+        if family is None:
+            return None
+        columns = {}
+        for column, value in row:
+            if column == "time":
+                columns[f"{family}_time"] = value
+            elif value is not None and column != "node_id":
+                columns[column] = value
+        return partial(self.node_latest.update, node_id, columns, touch=False)
 
     @staticmethod
     def _insert_row(cur, table: str, row: Dict[str, Any]):
@@ -102,7 +307,7 @@ class DBHandler:
         )
 
     @staticmethod
-    def _ensure_node_exists(cur, node_id: str):
+    def _ensure_node_exists(cur, node_id: int):
         cur.execute("SELECT 1 FROM node_details WHERE node_id = %s", (node_id,))
         if cur.fetchone():
             return
@@ -129,3 +334,473 @@ class DBHandler:
 
 def _values(row: Dict[str, Any]) -> Iterable[Any]:
     return tuple(row.values())
+
+
+class UnitOfWork:
+    """Every statement for one packet, on one connection, committed once.
+
+    The connection is borrowed on the first statement and switched to
+    pipeline mode, so writes are queued without waiting for the server.
+    Only reads and the final commit cost a round trip; ``statements`` and
+    ``round_trips`` count both so callers can report them per packet.
+    A unit of work that never executes anything never touches the pool.
+    Callbacks given to :meth:`after_commit` run once the commit succeeded.
+    """
+
+    def __init__(self, db_pool: ConnectionPool):
+        self.db_pool = db_pool
+        self.statements = 0
+        self.round_trips = 0
+        self._after_commit: List[Callable[[], None]] = []
+        self._stack: Optional[ExitStack] = None
+        self._conn = None
+        self._cur = None
+
+    def __enter__(self) -> "UnitOfWork":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+        else:
+            self._close(exc_type, exc, tb)
+        return False
+
+    def execute(self, sql: str, params=None):
+        self._cursor().execute(sql, params)
+        self.statements += 1
+
+    def fetchone(self, sql: str, params=None):
+        self.execute(sql, params)
+        return self._fetch("fetchone")
+
+    def run(self, operation):
+        """Run a ``DBHandler.execute_db_operation`` callback inside this
+        unit of work.  Its ``conn.commit()`` is deferred to :meth:`commit`."""
+        return operation(_UnitCursor(self), _DeferredCommit())
+
+    def after_commit(self, callback: Callable[[], None]):
+        """Call ``callback`` after :meth:`commit`; dropped if the unit of
+        work fails or is rolled back."""
+        self._after_commit.append(callback)
+
+    def commit(self):
+        if self._conn is None:
+            self._run_after_commit()
+            return
+        start = time.perf_counter()
+        try:
+            self._conn.commit()
+            self.round_trips += 1
+            instruments.DB_COMMIT.observe(time.perf_counter() - start)
+        except BaseException as e:
+            self._close(type(e), e, e.__traceback__)
+            raise
+        self._close(None, None, None)
+        self._run_after_commit()
+
+    def _run_after_commit(self):
+        callbacks, self._after_commit = self._after_commit, []
+        for callback in callbacks:
+            callback()
+
+    def _cursor(self):
+        if self._cur is None:
+            self._stack = ExitStack()
+            self._conn = self._stack.enter_context(self.db_pool.connection())
+            self._stack.enter_context(self._conn.pipeline())
+            self._cur = self._conn.cursor()
+        return self._cur
+
+    def _fetch(self, method: str):
+        self.round_trips += 1
+        return getattr(self._cursor(), method)()
+
+    def _close(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self._after_commit = []
+        stack = self._stack
+        self._stack = self._conn = self._cur = None
+        if stack is not None:
+            stack.__exit__(exc_type, exc, tb)
+
+
+class _UnitCursor:
+    """The subset of a psycopg cursor processors use, routed through a
+    :class:`UnitOfWork` so statements are counted."""
+
+    def __init__(self, uow: UnitOfWork):
+        self._uow = uow
+
+    def execute(self, sql: str, params=None):
+        self._uow.execute(sql, params)
+
+    def fetchone(self):
+        return self._uow._fetch("fetchone")
+
+    def fetchall(self):
+        return self._uow._fetch("fetchall")
+
+
+class _DeferredCommit:
+    @staticmethod
+    def commit():
+        # The unit of work commits once, after the whole packet.
+        pass
+
+
+class _TableStats:
+    __slots__ = (
+        "flushes",
+        "rows",
+        "failed_rows",
+        "spooled_rows",
+        "seconds",
+        "last",
+        "max",
+    )
+
+    def __init__(self):
+        self.flushes = 0
+        self.rows = 0
+        self.failed_rows = 0
+        self.spooled_rows = 0
+        self.seconds = 0.0
+        self.last = 0.0
+        self.max = 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "flushes_total": self.flushes,
+            "rows_total": self.rows,
+            "failed_rows_total": self.failed_rows,
+            "spooled_rows_total": self.spooled_rows,
+            "flush_seconds_total": round(self.seconds, 6),
+            "last_flush_ms": round(self.last * 1000, 3),
+            "max_flush_ms": round(self.max * 1000, 3),
+        }
+
+
+class BatchWriter:
+    """Write-behind buffer for hypertable rows.
+
+    Rows are grouped by ``(table, columns)`` and written with ``COPY`` in
+    one transaction per batch, either when a batch reaches ``batch_size``
+    or when its oldest row is ``max_delay`` seconds old.  Once
+    ``max_pending`` rows are buffered in total the caller waits (up to
+    ``max_delay``) for the writer to catch up, so memory stays bounded and
+    a slow database pushes back on the ingest workers.
+
+    Flushes run on the writer thread, never on the caller's: a caller may
+    be inside a unit of work that has just created a node row, and the
+    flush's node insert would wait on that uncommitted row forever.
+    Before :meth:`start` (and after :meth:`close`) ``add`` flushes inline.
+
+    Rows added with an :class:`~exporter.freshness.Arrival` are reported
+    to ``lag_tracker`` once their batch commits, and rows added with an
+    ``after_commit`` callback have it called then.
+
+    With a :class:`~exporter.spool.Spool`, a batch the database can't
+    take (connection errors, not bad rows) goes to disk instead of being
+    dropped, and so does every batch after it until a spool replay
+    succeeds and calls :meth:`mark_healthy`.  Over ``max_pending``,
+    callers don't wait either; buffered batches are spilled to the spool.
+    Spooled rows are not counted in commit lag and don't run their
+    callbacks.
+    """
+
+    def __init__(
+        self,
+        db_pool: ConnectionPool,
+        batch_size: int = 500,
+        max_delay: float = 2.0,
+        max_pending: int = 50000,
+        lag_tracker: Optional[LagTracker] = None,
+        spool: Optional[Spool] = None,
+    ):
+        self.db_pool = db_pool
+        self.lag_tracker = lag_tracker
+        self.spool = spool
+        self._healthy = True
+        self.batch_size = max(1, batch_size)
+        self.max_delay = max_delay
+        self.max_pending = max(self.batch_size, max_pending)
+        self._lock = threading.Lock()
+        self._buffers: Dict[Tuple[str, Tuple[str, ...]], List[tuple]] = {}
+        self._first_at: Dict[Tuple[str, Tuple[str, ...]], float] = {}
+        self._arrivals: Dict[Tuple[str, Tuple[str, ...]], List[Arrival]] = {}
+        self._callbacks: Dict[Tuple[str, Tuple[str, ...]], List[Callable]] = {}
+        self._pending = 0
+        self._stats: Dict[str, _TableStats] = {}
+        self._room = threading.Condition(self._lock)
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name="db-batch-writer", daemon=True
+            )
+            self._thread.start()
+
+    def close(self):
+        """Stop the background flusher and write out everything buffered."""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def add(
+        self,
+        table: str,
+        row: Dict[str, Any],
+        arrival: Optional[Arrival] = None,
+        after_commit: Optional[Callable[[], None]] = None,
+    ):
+        self.add_values(table, tuple(row), tuple(row.values()), arrival, after_commit)
+
+    def add_values(
+        self,
+        table: str,
+        columns: Tuple[str, ...],
+        values: tuple,
+        arrival: Optional[Arrival] = None,
+        after_commit: Optional[Callable[[], None]] = None,
+    ):
+        """:meth:`add` for rows that already have a fixed column order."""
+        key = (table, columns)
+        with self._lock:
+            buffer = self._buffers.get(key)
+            if buffer is None:
+                buffer = self._buffers[key] = []
+            if not buffer:
+                self._first_at[key] = time.monotonic()
+            buffer.append(values)
+            if arrival is not None and self.lag_tracker is not None:
+                self._arrivals.setdefault(key, []).append(arrival)
+            if after_commit is not None:
+                self._callbacks.setdefault(key, []).append(after_commit)
+            self._pending += 1
+            full = len(buffer) >= self.batch_size
+            over = self._pending >= self.max_pending
+            if self._thread is not None:
+                if full or over:
+                    self._wake.set()
+                if over and self.spool is None:
+                    self._room.wait_for(
+                        lambda: self._pending < self.max_pending, self.max_delay
+                    )
+                return
+        if over:
+            self.flush()
+        elif full:
+            self._flush_key(key)
+
+    def flush(self, older_than: Optional[float] = None, spill: bool = False):
+        """Flush every buffered batch, or only those that are full or whose
+        oldest row was added more than ``older_than`` seconds ago.  With
+        ``spill`` the batches go to the spool instead of the database."""
+        now = time.monotonic()
+        with self._lock:
+            keys = [
+                key
+                for key, rows in self._buffers.items()
+                if rows
+                and (
+                    older_than is None
+                    or len(rows) >= self.batch_size
+                    or now - self._first_at[key] >= older_than
+                )
+            ]
+        for key in keys:
+            self._flush_key(key, spill)
+
+    def replay(self, batches: List[SpooledBatch]):
+        """Write spooled batches in one transaction, one COPY per table
+        and column set."""
+        grouped: Dict[Tuple[str, Tuple[str, ...]], List[tuple]] = {}
+        for table, columns, rows in batches:
+            grouped.setdefault((table, columns), []).extend(rows)
+        with self.db_pool.connection() as conn:
+            with conn.cursor() as cur:
+                for (table, columns), rows in grouped.items():
+                    _copy_rows(cur, table, columns, rows)
+            conn.commit()
+
+    def mark_healthy(self):
+        if not self._healthy:
+            logger.info("Database is back; writing batches directly again")
+        self._healthy = True
+
+    @staticmethod
+    def is_unavailable(error: Exception) -> bool:
+        """True for errors that say the database can't be reached, as
+        opposed to a batch it rejected."""
+        return isinstance(error, (psycopg.OperationalError, psycopg.InterfaceError))
+
+    def fill(self) -> float:
+        """Buffered rows as a fraction of ``max_pending``."""
+        return self._pending / self.max_pending
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            pending: Dict[str, int] = {}
+            for (table, _), rows in self._buffers.items():
+                pending[table] = pending.get(table, 0) + len(rows)
+            out: Dict[str, Any] = {
+                "pending": self._pending,
+                "healthy": self._healthy,
+            }
+            for table, stats in self._stats.items():
+                out[table] = {**stats.as_dict(), "pending": pending.get(table, 0)}
+            return out
+
+    # ---------- internals ----------
+
+    def _run(self):
+        interval = max(self.max_delay / 2, 0.05)
+        while not self._stop.is_set():
+            self._wake.wait(interval)
+            self._wake.clear()
+            if self._stop.is_set():
+                return
+            try:
+                with self._lock:
+                    over = self._pending >= self.max_pending
+                if over and self.spool is not None:
+                    self.flush(spill=True)
+                else:
+                    self.flush(older_than=None if over else self.max_delay)
+            except Exception as e:
+                logger.error(f"Background flush failed: {e}")
+
+    def _take(self, key) -> Tuple[List[tuple], List[Arrival], List[Callable]]:
+        with self._lock:
+            rows = self._buffers.get(key) or []
+            if rows:
+                self._buffers[key] = []
+                self._pending -= len(rows)
+                self._room.notify_all()
+            return rows, self._arrivals.pop(key, []), self._callbacks.pop(key, [])
+
+    def _flush_key(self, key: Tuple[str, Tuple[str, ...]], spill: bool = False):
+        rows, arrivals, callbacks = self._take(key)
+        if not rows:
+            return
+        table, columns = key
+        if self.spool is not None and (spill or not self._healthy):
+            self._spool(table, columns, rows)
+            return
+        start = time.perf_counter()
+        spooled = False
+        try:
+            self._copy(table, columns, rows)
+            failed = 0
+            if arrivals:
+                self.lag_tracker.committed(arrivals, time.time())
+        except Exception as e:
+            failed = len(rows)
+            instruments.DB_FLUSH_ERRORS.inc()
+            if self.spool is not None and self.is_unavailable(e):
+                if self._healthy:
+                    logger.warning(f"Database unavailable, spooling batches: {e}")
+                self._healthy = False
+                spooled = True
+            else:
+                logger.error(f"Failed to flush {len(rows)} rows into {table}: {e}")
+        elapsed = time.perf_counter() - start
+        instruments.DB_FLUSH.observe(elapsed)
+        with self._lock:
+            stats = self._table_stats(table)
+            stats.flushes += 1
+            stats.rows += len(rows) - failed
+            if not spooled:
+                stats.failed_rows += failed
+            stats.seconds += elapsed
+            stats.last = elapsed
+            stats.max = max(stats.max, elapsed)
+        if spooled:
+            self._spool(table, columns, rows)
+        elif not failed:
+            for callback in callbacks:
+                try:
+                    callback()
+                except Exception as e:
+                    logger.error(f"After-commit callback for {table} failed: {e}")
+
+    def _spool(self, table: str, columns: Tuple[str, ...], rows: List[tuple]):
+        try:
+            stored = self.spool.append(table, columns, rows)
+        except OSError as e:
+            logger.error(f"Failed to spool {len(rows)} rows for {table}: {e}")
+            stored = False
+        with self._lock:
+            stats = self._table_stats(table)
+            if stored:
+                stats.spooled_rows += len(rows)
+            else:
+                stats.failed_rows += len(rows)
+
+    def _table_stats(self, table: str) -> _TableStats:
+        stats = self._stats.get(table)
+        if stats is None:
+            stats = self._stats[table] = _TableStats()
+        return stats
+
+    def _copy(self, table: str, columns: Tuple[str, ...], rows: List[tuple]):
+        with self.db_pool.connection() as conn:
+            with conn.cursor() as cur:
+                _copy_rows(cur, table, columns, rows)
+            conn.commit()
+
+
+def _copy_rows(cur, table: str, columns: Tuple[str, ...], rows: List[tuple]):
+    node_columns = NODE_REFERENCE_COLUMNS.get(table)
+    if node_columns:
+        indexes = [columns.index(c) for c in node_columns if c in columns]
+        _ensure_nodes_exist(cur, {row[i] for row in rows for i in indexes})
+    with cur.copy(f"COPY {table} ({', '.join(columns)}) FROM STDIN") as copy:
+        for row in rows:
+            copy.write_row(row)
+
+
+def _ensure_nodes_exist(cur, node_ids: Iterable[int]):
+    """Set-based counterpart of ``DBHandler._ensure_node_exists``."""
+    ids, short_names, long_names, hardware, roles = [], [], [], [], []
+    for node_id in sorted(node_ids):
+        broadcast = node_id in BROADCAST_NODE_IDS
+        ids.append(node_id)
+        short_names.append("Broadcast" if broadcast else "Unknown")
+        long_names.append("Broadcast" if broadcast else "Unknown")
+        hardware.append("BROADCAST" if broadcast else None)
+        roles.append("BROADCAST" if broadcast else None)
+    if not ids:
+        return
+    cur.execute(
+        """
+        INSERT INTO node_details
+            (node_id, short_name, long_name, hardware_model, role)
+        SELECT * FROM unnest(
+            %s::bigint[], %s::varchar[], %s::varchar[], %s::varchar[], %s::varchar[]
+        )
+        ON CONFLICT (node_id) DO NOTHING
+        """,
+        (ids, short_names, long_names, hardware, roles),
+    )
+
+
+def upsert_port_names(cur, names: Dict[int, str]):
+    """Write ``{port number: name}`` to ``port_names``; only renamed ports
+    are updated."""
+    cur.execute(
+        """
+        INSERT INTO port_names (portnum, name)
+        SELECT * FROM unnest(%s::smallint[], %s::varchar[])
+        ON CONFLICT (portnum) DO UPDATE SET name = EXCLUDED.name
+        WHERE port_names.name <> EXCLUDED.name
+        """,
+        (list(names), list(names.values())),
+    )
@@ -0,0 +1,123 @@
+"""Envelope parse and decrypt, shared by the in-process ingest stages and
+the optional decode worker processes.
+
+Parsing the ``ServiceEnvelope``, AES-CTR and parsing the decrypted
+``Data`` take a full core on the public broker, and in one interpreter
+that work is bound by the GIL.  With ``INGEST_DECODE_PROCESSES`` set,
+:class:`ProcessDecoder` ships batches of raw payloads to a process pool
+that runs the same :func:`parse_envelope` / :func:`decrypt_packet` steps
+the in-process stages run.  Each decoded envelope comes back as its wire
+bytes plus the ``(from, id)`` dedup key, so the parent can dedup without
+parsing anything.  Packets that cannot be parsed or decrypted are dropped
+in the worker.
+"""
+
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+try:
+    from meshtastic.mesh_pb2 import MeshPacket
+    from meshtastic.mqtt_pb2 import ServiceEnvelope
+except ImportError:
+    from meshtastic.protobuf.mesh_pb2 import MeshPacket
+    from meshtastic.protobuf.mqtt_pb2 import ServiceEnvelope
+
+from exporter.keyring import ChannelKeyring
+from exporter.metric import instruments
+
+logger = logging.getLogger(__name__)
+
+# (topic, sender, packet id, received at, decoded ServiceEnvelope bytes)
+DecodedRecord = Tuple[str, int, int, float, bytes]
+
+
+def parse_envelope(payload: bytes) -> Optional[ServiceEnvelope]:
+    envelope = ServiceEnvelope()
+    try:
+        envelope.ParseFromString(payload)
+    except Exception as e:
+        # Public MQTT carries a constant trickle of malformed / partially-
+        # encrypted packets; logging each one at ERROR floods the log.
+        logger.debug(f"Failed to handle message: {e}")
+        return None
+    return envelope
+
+
+def decrypt_packet(mesh_packet: MeshPacket, keyring: ChannelKeyring) -> bool:
+    """Decrypt ``mesh_packet`` in place.  Returns False when the packet is
+    encrypted and could not be decoded; already-decoded packets pass
+    through untouched."""
+    if not mesh_packet.encrypted:
+        return True
+    data = keyring.decrypt(mesh_packet)
+    if data is None:
+        return False
+    mesh_packet.decoded.CopyFrom(data)
+    return True
+
+
+_worker_keyring: Optional[ChannelKeyring] = None
+
+
+def _init_worker(keys: List[Tuple[str, bytes]], fallback: Optional[bytes] = None):
+    global _worker_keyring
+    _worker_keyring = ChannelKeyring(keys, fallback)
+
+
+def decode_batch(
+    items: Sequence[Tuple[str, bytes, float]],
+) -> Tuple[List[DecodedRecord], Dict[str, Any]]:
+    """Worker-side: parse and decrypt ``(topic, payload, received_at)``
+    items.  Returns the decoded records and the batch's counters: how
+    many payloads were malformed or undecryptable, and the keyring's."""
+    records: List[DecodedRecord] = []
+    malformed = undecryptable = 0
+    for topic, payload, received_at in items:
+        envelope = parse_envelope(payload)
+        if envelope is None:
+            malformed += 1
+            continue
+        packet = envelope.packet
+        if not decrypt_packet(packet, _worker_keyring):
+            undecryptable += 1
+            continue
+        records.append(
+            (
+                topic,
+                getattr(packet, "from"),
+                packet.id,
+                received_at,
+                envelope.SerializeToString(),
+            )
+        )
+    return records, {
+        "malformed": malformed,
+        "undecryptable": undecryptable,
+        "keyring": _worker_keyring.take_counts(),
+    }
+
+
+class ProcessDecoder:
+    def __init__(self, keyring: ChannelKeyring, processes: int):
+        self.keyring = keyring
+        self.processes = max(1, processes)
+        # spawn rather than fork: by the time the pool starts workers the
+        # parent already runs the batch writer and pool threads.
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.processes,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(keyring.keys(), keyring.fallback),
+        )
+
+    def decode(self, items: Sequence[Tuple[str, bytes, float]]) -> List[DecodedRecord]:
+        records, counts = self._executor.submit(decode_batch, list(items)).result()
+        self.keyring.add_counts(counts["keyring"])
+        instruments.MALFORMED.inc(counts["malformed"])
+        instruments.UNDECRYPTABLE.inc(counts["undecryptable"])
+        return records
+
+    def close(self):
+        self._executor.shutdown()
@@ -0,0 +1,75 @@
+"""In-process packet dedup.
+
+Every gateway that hears a packet republishes it to MQTT, so the same
+packet reaches us several times within a few seconds.  The cache remembers
+``(from, packet.id)`` — bare ``packet.id`` collides between nodes — for 5
+minutes, the least the shared ``packet_dedup`` table keeps in the database,
+and holds at most ``max_entries`` keys (roughly 150 bytes each), evicting
+the oldest first.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Tuple
+
+DEFAULT_TTL_SECONDS = 300.0
+DEFAULT_MAX_ENTRIES = 200_000
+
+
+class PacketDeduplicator:
+    def __init__(
+        self,
+        ttl: float = DEFAULT_TTL_SECONDS,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.ttl = ttl
+        self.max_entries = max(1, max_entries)
+        self._clock = clock
+        self._lock = threading.Lock()
+        # Insertion order is first-seen order, so expiry and eviction
+        # both pop from the front.
+        self._seen: "OrderedDict[Tuple[int, int], float]" = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expired = 0
+
+    def is_duplicate(self, sender: int, packet_id: int) -> bool:
+        """Return True if ``(sender, packet_id)`` was seen within the TTL,
+        otherwise remember it and return False."""
+        key = (sender, packet_id)
+        now = self._clock()
+        with self._lock:
+            self._expire(now)
+            if key in self._seen:
+                self._hits += 1
+                return True
+            self._misses += 1
+            self._seen[key] = now
+            if len(self._seen) > self.max_entries:
+                self._seen.popitem(last=False)
+                self._evictions += 1
+            return False
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._seen),
+                "capacity": self.max_entries,
+                "hits_total": self._hits,
+                "misses_total": self._misses,
+                "evictions_total": self._evictions,
+                "expired_total": self._expired,
+            }
+
+    def _expire(self, now: float):
+        cutoff = now - self.ttl
+        seen = self._seen
+        while seen:
+            key, first_seen = next(iter(seen.items()))
+            if first_seen > cutoff:
+                return
+            seen.popitem(last=False)
+            self._expired += 1
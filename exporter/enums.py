@@ -0,0 +1,72 @@
+"""Precomputed enum name lookups.
+
+Port, role, hardware model and routing error names used to be resolved by
+scanning the protobuf descriptor on every call, and the port name is
+needed for every stored packet.  The tables here are built once at import
+from the descriptors of the installed meshtastic protobufs.  Each table
+maps both the number and the name of every value to its (interned) name,
+so callers can pass either.  When a number has aliases the first declared
+name wins, as it did with the descriptor scan.
+"""
+
+import sys
+from typing import Any, Dict, Union
+
+try:
+    from meshtastic.config_pb2 import Config
+    from meshtastic.mesh_pb2 import HardwareModel, Routing
+    from meshtastic.mqtt_pb2 import MapReport
+    from meshtastic.portnums_pb2 import PortNum
+except ImportError:
+    from meshtastic.protobuf.config_pb2 import Config
+    from meshtastic.protobuf.mesh_pb2 import HardwareModel, Routing
+    from meshtastic.protobuf.mqtt_pb2 import MapReport
+    from meshtastic.protobuf.portnums_pb2 import PortNum
+
+EnumKey = Union[int, str]
+
+UNKNOWN_PORT = "UNKNOWN_PORT"
+UNKNOWN_ROLE = "UNKNOWN_ROLE"
+UNKNOWN_HARDWARE_MODEL = "UNKNOWN_HARDWARE_MODEL"
+UNKNOWN_ERROR = "UNKNOWN_ERROR"
+
+
+def build_lookup(enum_descriptor) -> Dict[EnumKey, str]:
+    """``{number: name, name: name}`` for every value of ``enum_descriptor``."""
+    table: Dict[EnumKey, str] = {}
+    for value in enum_descriptor.values:
+        name = sys.intern(value.name)
+        table.setdefault(value.number, name)
+        table[name] = name
+    return table
+
+
+PORT_NAMES = build_lookup(PortNum.DESCRIPTOR)
+ROLE_NAMES = build_lookup(Config.DeviceConfig.Role.DESCRIPTOR)
+HARDWARE_MODEL_NAMES = build_lookup(HardwareModel.DESCRIPTOR)
+ROUTING_ERROR_NAMES = build_lookup(Routing.Error.DESCRIPTOR)
+REGION_NAMES = build_lookup(MapReport.DESCRIPTOR.fields_by_name["region"].enum_type)
+MODEM_PRESET_NAMES = build_lookup(
+    MapReport.DESCRIPTOR.fields_by_name["modem_preset"].enum_type
+)
+
+
+def numbers(table: Dict[EnumKey, str]) -> Dict[int, str]:
+    """``{number: name}`` for every number of a lookup table."""
+    return {key: name for key, name in table.items() if isinstance(key, int)}
+
+
+def port_name(port_num: Any) -> str:
+    return PORT_NAMES.get(port_num, UNKNOWN_PORT)
+
+
+def role_name(role: Any) -> str:
+    return ROLE_NAMES.get(role, UNKNOWN_ROLE)
+
+
+def hardware_model_name(hardware_model: Any) -> str:
+    return HARDWARE_MODEL_NAMES.get(hardware_model, UNKNOWN_HARDWARE_MODEL)
+
+
+def routing_error_name(error_code: Any) -> str:
+    return ROUTING_ERROR_NAMES.get(error_code, UNKNOWN_ERROR)
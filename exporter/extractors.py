@@ -0,0 +1,73 @@
+"""Protobuf-to-row extractors, built once from the message descriptors.
+
+A :class:`RowExtractor` turns one message type into rows of one table.
+The column order is fixed when the extractor is built, so the INSERT
+statement is built once too.  Rows are value tuples, never dicts, and
+the batch writer takes them as they are.
+
+``values`` is generated source compiled at import.  It reads every field
+with one ``attrgetter`` call.  For fields with explicit presence
+(``optional`` in the .proto, as in ``DeviceMetrics`` or ``Position``), a
+zero value is checked with ``HasField``, so an unset field becomes NULL
+instead of a misleading 0.  Fields without presence keep their value,
+since proto3 can't tell 0 from unset there.  Fields this protobuf
+version doesn't have are always NULL.
+"""
+
+from operator import attrgetter
+from typing import Callable, Sequence, Tuple, Union
+
+# Leading columns of every node metrics row, filled in by DBHandler.
+ROW_PREFIX = ("time", "node_id")
+
+# A field name, or ``(column, field name)`` when they differ.
+FieldSpec = Union[str, Tuple[str, str]]
+
+
+class RowExtractor:
+    def __init__(self, table: str, message_cls, fields: Sequence[FieldSpec]):
+        self.table = table
+        self.message_cls = message_cls
+        pairs = [(f, f) if isinstance(f, str) else f for f in fields]
+        self.fields = tuple(field for _, field in pairs)
+        self.columns = ROW_PREFIX + tuple(column for column, _ in pairs)
+        self.sql = (
+            f"INSERT INTO {table} ({', '.join(self.columns)}) "
+            f"VALUES ({', '.join(['%s'] * len(self.columns))})"
+        )
+        self.values: Callable[[object], tuple] = _compile(message_cls, self.fields)
+
+    def __repr__(self) -> str:
+        return f"RowExtractor({self.table!r}, {self.message_cls.__name__})"
+
+
+def _compile(message_cls, fields: Tuple[str, ...]) -> Callable[[object], tuple]:
+    by_name = message_cls.DESCRIPTOR.fields_by_name
+    known = [f for f in fields if f in by_name]
+    index = {field: i for i, field in enumerate(known)}
+    parts = []
+    for field in fields:
+        if field not in index:
+            parts.append("None")
+        elif by_name[field].has_presence:
+            i = index[field]
+            parts.append(f"v[{i}] if v[{i}] or has(m, {field!r}) else None")
+        else:
+            parts.append(f"v[{index[field]}]")
+    if len(known) == 1:
+        read = "v = (get(m),)"
+    elif known:
+        read = "v = get(m)"
+    else:
+        read = "pass"
+    source = (
+        "def values(m, get=get, has=has):\n"
+        f"    {read}\n"
+        f"    return ({''.join(part + ', ' for part in parts)})\n"
+    )
+    namespace = {
+        "get": attrgetter(*known) if known else None,
+        "has": message_cls.HasField,
+    }
+    exec(compile(source, f"<extractor {message_cls.__name__}>", "exec"), namespace)
+    return namespace["values"]
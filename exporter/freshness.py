@@ -0,0 +1,196 @@
+"""End-to-end data freshness: how far behind the radio the database is.
+
+Two lags are tracked for every packet, per topic root and gateway:
+
+``gateway``
+    From the gateway's ``MeshPacket.rx_time`` to the MQTT message
+    arriving at the exporter.  ``rx_time`` has one-second resolution and
+    comes from the gateway's clock.  Packets without it are skipped.
+``commit``
+    From the MQTT message arriving to its ``mesh_packet_metrics`` row
+    being committed, including queueing and batch-writer buffering.
+
+Samples are kept per minute of arrival.  Once a minute has been over for
+``grace`` seconds, so its slowest commits are in, the tracker hands its
+percentiles to ``sink`` (one row per minute, topic root, gateway and
+stage) for the ``ingest_lag`` hypertable.  The same samples also feed the
+``ingest_lag_seconds`` histogram on ``/metrics``.
+
+Both lags assume arrivals are stamped with the wall clock as they happen.
+Replayed or synthetic traffic carries ``rx_time`` values from another
+time, so the tracker can be built with ``enabled=False`` to record
+nothing at all.
+"""
+
+import logging
+import math
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from exporter.metric import instruments
+
+logger = logging.getLogger(__name__)
+
+GATEWAY = "gateway"
+COMMIT = "commit"
+
+
+class Arrival(NamedTuple):
+    """Where and when an MQTT message entered the exporter."""
+
+    topic_root: str
+    gateway_id: str
+    received_at: float
+
+
+def topic_root(topic: str) -> str:
+    """``msh/EU_868/2/e/LongFast/!gw`` -> ``msh/EU_868``.  Topics without
+    the protocol version segment keep their first two levels."""
+    root, sep, _ = topic.partition("/2/")
+    if sep:
+        return root
+    return "/".join(topic.split("/")[:2])
+
+
+def percentile(ordered: List[float], q: float) -> float:
+    """Nearest-rank percentile of an already sorted, non-empty list."""
+    rank = max(1, math.ceil(q * len(ordered)))
+    return ordered[rank - 1]
+
+
+class _Window:
+    __slots__ = ("samples", "seen", "max")
+
+    def __init__(self):
+        self.samples: List[float] = []
+        self.seen = 0
+        self.max = 0.0
+
+
+class LagTracker:
+    def __init__(
+        self,
+        sink: Optional[Callable[[List[Dict[str, Any]]], None]] = None,
+        interval: float = 60.0,
+        grace: float = 30.0,
+        max_samples: int = 2000,
+        enabled: bool = True,
+    ):
+        self.sink = sink
+        self.enabled = enabled
+        self.interval = interval
+        self.grace = grace
+        # Per-window reservoir size: a busy gateway doesn't grow memory, and
+        # percentiles stay unbiased.
+        self.max_samples = max_samples
+        self._lock = threading.Lock()
+        self._windows: Dict[Tuple[int, str, str, str], _Window] = {}
+        self._rows_written = 0
+        self._samples = {GATEWAY: 0, COMMIT: 0}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread is None and self.sink is not None:
+            self._thread = threading.Thread(
+                target=self._run, name="lag-tracker", daemon=True
+            )
+            self._thread.start()
+
+    def close(self):
+        """Stop the flusher and hand every window, finished or not, to the
+        sink."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush(everything=True)
+
+    def received(self, arrival: Arrival, rx_time: int):
+        """Record the gateway lag of a packet the gateway stamped with
+        ``rx_time`` (epoch seconds, 0 when unknown)."""
+        if rx_time > 0:
+            self._add(GATEWAY, arrival, max(0.0, arrival.received_at - rx_time))
+
+    def committed(self, arrivals: Iterable[Arrival], committed_at: float):
+        for arrival in arrivals:
+            self._add(COMMIT, arrival, max(0.0, committed_at - arrival.received_at))
+
+    def flush(self, everything: bool = False):
+        rows = self.drain(None if everything else time.time())
+        if rows and self.sink is not None:
+            try:
+                self.sink(rows)
+            except Exception as e:
+                logger.error(f"Failed to store {len(rows)} ingest lag rows: {e}")
+                return
+            with self._lock:
+                self._rows_written += len(rows)
+
+    def drain(self, now: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Remove and summarise the windows for minutes that ended at least
+        ``grace`` seconds before ``now`` (all of them when ``now`` is None)."""
+        current = None if now is None else int((now - self.grace) // 60)
+        with self._lock:
+            done = [key for key in self._windows if current is None or key[0] < current]
+            windows = [(key, self._windows.pop(key)) for key in done]
+        rows = []
+        for (minute, root, gateway, stage), window in windows:
+            ordered = sorted(window.samples)
+            rows.append(
+                {
+                    "time": datetime.fromtimestamp(minute * 60, timezone.utc),
+                    "topic_root": root,
+                    "gateway_id": gateway,
+                    "stage": stage,
+                    "samples": window.seen,
+                    "p50_seconds": percentile(ordered, 0.5),
+                    "p95_seconds": percentile(ordered, 0.95),
+                    "p99_seconds": percentile(ordered, 0.99),
+                    "max_seconds": window.max,
+                }
+            )
+        return rows
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "open_windows": len(self._windows),
+                "rows_total": self._rows_written,
+                "gateway_samples_total": self._samples[GATEWAY],
+                "commit_samples_total": self._samples[COMMIT],
+            }
+
+    # ---------- internals ----------
+
+    def _add(self, stage: str, arrival: Arrival, lag: float):
+        if not self.enabled:
+            return
+        instruments.lag_series(stage, arrival.topic_root).observe(lag)
+        key = (
+            int(arrival.received_at // 60),
+            arrival.topic_root,
+            arrival.gateway_id,
+            stage,
+        )
+        with self._lock:
+            self._samples[stage] += 1
+            window = self._windows.get(key)
+            if window is None:
+                window = self._windows[key] = _Window()
+            window.seen += 1
+            if lag > window.max:
+                window.max = lag
+            if len(window.samples) < self.max_samples:
+                window.samples.append(lag)
+            else:
+                slot = random.randrange(window.seen)
+                if slot < self.max_samples:
+                    window.samples[slot] = lag
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.flush()
@@ -0,0 +1,218 @@
+"""Staged ingest pipeline between the MQTT network thread and the database.
+
+paho delivers every message on its network thread; anything slow done
+there (a Postgres round trip, a burst of AES work) stalls the socket and
+the broker eventually drops us.  The pipeline keeps that thread down to a
+single bounded-queue ``put``: each :class:`Stage` owns a queue and a pool
+of worker threads, hands its result to the next stage, and drops the item
+when its handler returns ``None``.
+
+When a queue is full the producer blocks (back-pressure instead of silent
+loss) and the time spent blocked is counted, so a slow database shows up
+as growing ``blocked_seconds_total`` on the stage in front of it.
+"""
+
+import logging
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class Stage:
+    def __init__(
+        self,
+        name: str,
+        handler: Callable[[Any], Any],
+        workers: int = 1,
+        maxsize: int = 1000,
+    ):
+        self.name = name
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.queue: queue.Queue = queue.Queue(maxsize=maxsize)
+        self.next: Optional["Stage"] = None
+        self._threads: List[threading.Thread] = []
+        self._lock = threading.Lock()
+        self._enqueued = 0
+        self._dequeued = 0
+        self._failed = 0
+        self._blocked = 0.0
+        self._busy = 0.0
+
+    def start(self):
+        for i in range(self.workers):
+            t = threading.Thread(
+                target=self._run, name=f"ingest-{self.name}-{i}", daemon=True
+            )
+            t.start()
+            self._threads.append(t)
+
+    def put(self, item: Any):
+        blocked = 0.0
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            start = time.perf_counter()
+            self.queue.put(item)
+            blocked = time.perf_counter() - start
+        with self._lock:
+            self._enqueued += 1
+            self._blocked += blocked
+
+    def drain(self):
+        """Block until every queued item has been handled, then stop the
+        workers."""
+        self.queue.join()
+        for _ in self._threads:
+            self.queue.put(_STOP)
+        for t in self._threads:
+            t.join()
+        self._threads = []
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "depth": self.queue.qsize(),
+                "capacity": self.queue.maxsize,
+                "workers": self.workers,
+                "enqueued_total": self._enqueued,
+                "dequeued_total": self._dequeued,
+                "failed_total": self._failed,
+                "blocked_seconds_total": round(self._blocked, 6),
+                "busy_seconds_total": round(self._busy, 6),
+            }
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is _STOP:
+                self.queue.task_done()
+                return
+            failed = 0
+            start = time.perf_counter()
+            try:
+                result = self.handler(item)
+                if result is not None and self.next is not None:
+                    self.next.put(result)
+            except Exception as e:
+                failed = 1
+                logger.debug(f"Ingest stage {self.name} failed: {e}")
+            finally:
+                busy = time.perf_counter() - start
+                with self._lock:
+                    self._dequeued += 1
+                    self._failed += failed
+                    self._busy += busy
+                self.queue.task_done()
+
+
+class BatchStage(Stage):
+    """A :class:`Stage` whose handler takes a list of up to ``batch_size``
+    queued items and returns a list of results for the next stage.  A
+    worker takes whatever is queued when it wakes up rather than waiting
+    for a full batch, so batching adds no latency under light load.
+
+    A handler may also be a generator yielding one result per item (None
+    for items with nothing to pass on).  If it raises part way, the
+    results already yielded have gone downstream and only the items
+    after them count as failed."""
+
+    def __init__(
+        self,
+        name: str,
+        handler: Callable[[List[Any]], List[Any]],
+        batch_size: int = 64,
+        workers: int = 1,
+        maxsize: int = 1000,
+    ):
+        super().__init__(name, handler, workers, maxsize)
+        self.batch_size = max(1, batch_size)
+        self._batches = 0
+
+    def stats(self) -> Dict[str, Any]:
+        stats = super().stats()
+        with self._lock:
+            stats["batch_size"] = self.batch_size
+            stats["batches_total"] = self._batches
+        return stats
+
+    def _run(self):
+        while True:
+            batch = []
+            stop = False
+            item = self.queue.get()
+            while True:
+                if item is _STOP:
+                    stop = True
+                    break
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+            if batch:
+                self._handle(batch)
+            if stop:
+                self.queue.task_done()
+                return
+
+    def _handle(self, batch: List[Any]):
+        failed = handled = 0
+        start = time.perf_counter()
+        try:
+            for result in self.handler(batch):
+                handled += 1
+                if result is not None and self.next is not None:
+                    self.next.put(result)
+        except Exception as e:
+            failed = max(len(batch) - handled, 0)
+            logger.debug(f"Ingest stage {self.name} failed: {e}")
+        finally:
+            busy = time.perf_counter() - start
+            with self._lock:
+                self._dequeued += len(batch)
+                self._failed += failed
+                self._busy += busy
+                self._batches += 1
+            for _ in batch:
+                self.queue.task_done()
+
+
+class IngestPipeline:
+    """A chain of :class:`Stage` objects fed through :meth:`submit`."""
+
+    def __init__(self, stages: List[Stage]):
+        if not stages:
+            raise ValueError("IngestPipeline needs at least one stage")
+        self.stages = stages
+        for upstream, downstream in zip(stages, stages[1:]):
+            upstream.next = downstream
+
+    def start(self):
+        for stage in self.stages:
+            stage.start()
+
+    def submit(self, item: Any):
+        self.stages[0].put(item)
+
+    def close(self):
+        """Drain the stages front to back.  Callers must stop submitting
+        first; every item already accepted is processed before this
+        returns."""
+        for stage in self.stages:
+            stage.drain()
+
+    def fill(self) -> float:
+        """Queued items across every stage as a fraction of total capacity."""
+        depth = sum(stage.queue.qsize() for stage in self.stages)
+        return depth / sum(stage.queue.maxsize for stage in self.stages)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {stage.name: stage.stats() for stage in self.stages}
@@ -0,0 +1,228 @@
+"""Channel keys for decrypting mesh packets, indexed by channel hash.
+
+A Meshtastic packet does not carry its channel name, only an 8-bit hash
+of it in ``MeshPacket.channel``: the XOR of the name's bytes with the
+XOR of the expanded key's bytes.  The keyring computes that hash once
+per configured key.  Each encrypted packet then goes straight to the
+keys that can decrypt it.
+
+Keys come from two places:
+
+* ``MQTT_SERVER_KEY``: the key of the default public channels.  It is
+  registered under every modem-preset channel name (``LongFast``,
+  ``MediumFast``, ...).  It is also the fallback key: packets whose hash
+  matches no key, or that none of the matching keys decrypts, get one
+  attempt with it, so channels with a custom name that keep the default
+  key still decode.  With ``MQTT_SERVER_KEY_FALLBACK=false`` those
+  packets are skipped before any AES work instead.
+* ``MQTT_CHANNEL_KEYS``: extra ``name=base64key`` pairs, comma separated.
+
+A one-byte key is a Meshtastic "simple" PSK index: ``AQ==`` is the
+default key and ``2``..``10`` bump its last byte.
+"""
+
+import base64
+import logging
+import os
+import threading
+from functools import reduce
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+
+try:
+    from meshtastic.mesh_pb2 import Data, MeshPacket
+except ImportError:
+    from meshtastic.protobuf.mesh_pb2 import Data, MeshPacket
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MQTT_KEY = "1PG7OiApB1nwvP+rz05pAQ=="
+DEFAULT_PSK = base64.b64decode(DEFAULT_MQTT_KEY)
+
+# Primary channel names the firmware derives from the modem preset when
+# the channel has no explicit name.
+DEFAULT_CHANNEL_NAMES = (
+    "LongFast",
+    "LongSlow",
+    "LongModerate",
+    "LongTurbo",
+    "VeryLongSlow",
+    "MediumFast",
+    "MediumSlow",
+    "ShortFast",
+    "ShortSlow",
+    "ShortTurbo",
+)
+
+
+def expand_psk(psk: bytes) -> bytes:
+    """Expand a one-byte PSK index to the key the firmware uses."""
+    if len(psk) != 1:
+        return psk
+    index = psk[0]
+    if index == 0:
+        return b""
+    return DEFAULT_PSK[:-1] + bytes([(DEFAULT_PSK[-1] + index - 1) & 0xFF])
+
+
+def _xor(data: bytes) -> int:
+    return reduce(lambda acc, b: acc ^ b, data, 0)
+
+
+def channel_hash(name: str, psk: bytes) -> int:
+    return _xor(name.encode("utf-8")) ^ _xor(expand_psk(psk))
+
+
+def parse_channel_keys(spec: str) -> List[Tuple[str, bytes]]:
+    """``"Ops=base64,Team=base64"`` -> ``[("Ops", b"..."), ("Team", b"...")]``."""
+    keys = []
+    for entry in spec.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        name, sep, encoded = entry.partition("=")
+        if not sep or not name.strip():
+            raise ValueError(f"Channel key {entry!r} is not of the form name=key")
+        keys.append((name.strip(), base64.b64decode(encoded.strip())))
+    return keys
+
+
+class ChannelKey:
+    def __init__(self, name: str, psk: bytes):
+        key = expand_psk(psk)
+        if len(key) not in (16, 32):
+            raise ValueError(
+                f"Key for channel {name!r} does not expand to a 16 or 32 byte "
+                f"AES key ({len(psk)} bytes given)"
+            )
+        self.name = name
+        self.psk = psk
+        self.key = key
+        self.hash = channel_hash(name, psk)
+        self.algorithm = algorithms.AES(key)
+        self.hits = 0
+        self.failures = 0
+
+
+class ChannelKeyring:
+    def __init__(
+        self, keys: Iterable[Tuple[str, bytes]] = (), fallback: Optional[bytes] = None
+    ):
+        self._lock = threading.Lock()
+        self._by_hash: Dict[int, List[ChannelKey]] = {}
+        self._keys: Dict[str, ChannelKey] = {}
+        self._skipped = 0
+        self._fallback = None if fallback is None else ChannelKey("fallback", fallback)
+        for name, psk in keys:
+            self.add(name, psk)
+
+    @classmethod
+    def from_env(cls) -> "ChannelKeyring":
+        server_key = base64.b64decode(os.getenv("MQTT_SERVER_KEY", DEFAULT_MQTT_KEY))
+        keys = [(name, server_key) for name in DEFAULT_CHANNEL_NAMES]
+        keys += parse_channel_keys(os.getenv("MQTT_CHANNEL_KEYS", ""))
+        fallback = os.getenv("MQTT_SERVER_KEY_FALLBACK", "true").lower() == "true"
+        return cls(keys, server_key if fallback else None)
+
+    @property
+    def fallback(self) -> Optional[bytes]:
+        return None if self._fallback is None else self._fallback.psk
+
+    def add(self, name: str, psk: bytes):
+        """Register ``psk`` for channel ``name``; a later key for the same
+        name replaces the earlier one."""
+        key = ChannelKey(name, psk)
+        with self._lock:
+            previous = self._keys.pop(name, None)
+            if previous is not None:
+                self._by_hash[previous.hash].remove(previous)
+            self._keys[name] = key
+            self._by_hash.setdefault(key.hash, []).append(key)
+
+    def keys(self) -> List[Tuple[str, bytes]]:
+        with self._lock:
+            return [(key.name, key.psk) for key in self._keys.values()]
+
+    def take_counts(self) -> Dict[str, Any]:
+        """Return and reset the counters, for shipping them from a decode
+        worker process back to the keyring in the parent."""
+        with self._lock:
+            counts: Dict[str, Any] = {"skipped": self._skipped}
+            self._skipped = 0
+            if self._fallback is not None:
+                counts["fallback"] = (self._fallback.hits, self._fallback.failures)
+                self._fallback.hits = self._fallback.failures = 0
+            for name, key in self._keys.items():
+                counts[name] = (key.hits, key.failures)
+                key.hits = key.failures = 0
+            return counts
+
+    def add_counts(self, counts: Dict[str, Any]):
+        with self._lock:
+            self._skipped += counts.get("skipped", 0)
+            if self._fallback is not None:
+                hits, failures = counts.get("fallback", (0, 0))
+                self._fallback.hits += hits
+                self._fallback.failures += failures
+            for name, key in self._keys.items():
+                hits, failures = counts.get(name, (0, 0))
+                key.hits += hits
+                key.failures += failures
+
+    def decrypt(self, mesh_packet: MeshPacket) -> Optional[Data]:
+        """Decode ``mesh_packet.encrypted`` with the keys registered for
+        its channel hash, then with the fallback key if none of them
+        yields a parseable ``Data``.  Returns None when that fails too."""
+        candidates = self._by_hash.get(mesh_packet.channel, ())
+        fallback = self._fallback
+        if fallback is not None and any(k.key == fallback.key for k in candidates):
+            # Already tried under its channel name.
+            fallback = None
+        if not candidates and fallback is None:
+            with self._lock:
+                self._skipped += 1
+            return None
+
+        sender = getattr(mesh_packet, "from")
+        nonce = mesh_packet.id.to_bytes(8, "little") + sender.to_bytes(8, "little")
+        if fallback is not None:
+            candidates = (*candidates, fallback)
+        for key in candidates:
+            decryptor = Cipher(
+                key.algorithm, modes.CTR(nonce), backend=default_backend()
+            ).decryptor()
+            plain = decryptor.update(mesh_packet.encrypted) + decryptor.finalize()
+            data = Data()
+            try:
+                data.ParseFromString(plain)
+            except Exception as e:
+                logger.debug(
+                    f"Channel {key.name} could not decrypt packet "
+                    f"{mesh_packet.id} from node {sender:x}: {e}"
+                )
+                with self._lock:
+                    key.failures += 1
+                continue
+            with self._lock:
+                key.hits += 1
+            return data
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats: Dict[str, Any] = {
+                "keys": len(self._keys),
+                "skipped_total": self._skipped,
+            }
+            if self._fallback is not None:
+                stats["fallback_hits_total"] = self._fallback.hits
+                stats["fallback_failures_total"] = self._fallback.failures
+            for name, key in self._keys.items():
+                stats[name] = {
+                    "hash": key.hash,
+                    "hits_total": key.hits,
+                    "failures_total": key.failures,
+                }
+            return stats
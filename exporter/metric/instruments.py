@@ -0,0 +1,115 @@
+"""The exporter's own ingest metrics, served at ``/metrics``.
+
+Series used per packet are resolved here, once, so instrumented code
+only calls ``observe`` / ``inc`` on a module attribute.
+"""
+
+from typing import Dict, Tuple
+
+from exporter import enums
+from exporter.metric.prometheus import CounterSeries, HistogramSeries, Registry
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "stage_seconds",
+    "Time spent in each ingest step, per message (per batch for decode).",
+    labels=("stage",),
+)
+PROCESSOR_SECONDS = REGISTRY.histogram(
+    "processor_seconds",
+    "Time spent in the port processor for one packet.",
+    labels=("port",),
+)
+MESSAGES = REGISTRY.counter(
+    "messages_total", "MQTT messages received, by topic type.", labels=("topic_type",)
+)
+PACKETS_BY_PORT = REGISTRY.counter(
+    "packets_by_port_total", "Decoded packets, by port.", labels=("port",)
+)
+PACKET_OUTCOMES = REGISTRY.counter(
+    "packets_total", "Mesh packets, by what became of them.", labels=("outcome",)
+)
+DB_ERRORS = REGISTRY.counter(
+    "db_errors_total", "Failed database operations.", labels=("operation",)
+)
+SHED = REGISTRY.counter(
+    "shed_total",
+    "Work dropped by load shedding: whole packets (what=packet) or their "
+    "mesh_packet_metrics row (what=packet_row), by port.",
+    labels=("port", "what"),
+)
+ADMISSION = REGISTRY.gauge(
+    "admission_level",
+    "Load shedding level: 0 normal, 1 low-priority ports shed, 2 packet rows shed.",
+)
+INGEST_LAG = REGISTRY.histogram(
+    "ingest_lag_seconds",
+    "Gateway receive to exporter (stage=gateway) and exporter to committed "
+    "row (stage=commit), by topic root.",
+    labels=("stage", "topic_root"),
+    buckets=(0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60, 120, 300, 600, 1800, 3600),
+)
+
+MQTT_CALLBACK = STAGE_SECONDS.labels("mqtt_callback")
+PARSE = STAGE_SECONDS.labels("parse")
+DECRYPT = STAGE_SECONDS.labels("decrypt")
+DECODE = STAGE_SECONDS.labels("decode")
+DEDUP = STAGE_SECONDS.labels("dedup")
+NODE_LOOKUP = STAGE_SECONDS.labels("node_lookup")
+DB_COMMIT = STAGE_SECONDS.labels("db_commit")
+DB_FLUSH = STAGE_SECONDS.labels("db_flush")
+
+TOPIC_TYPES = {kind: MESSAGES.labels(kind) for kind in ("protobuf", "json", "stat")}
+
+STORED = PACKET_OUTCOMES.labels("stored")
+DUPLICATE = PACKET_OUTCOMES.labels("duplicate")
+UNDECRYPTABLE = PACKET_OUTCOMES.labels("undecryptable")
+MALFORMED = PACKET_OUTCOMES.labels("malformed")
+FILTERED = PACKET_OUTCOMES.labels("filtered")
+FAILED = PACKET_OUTCOMES.labels("failed")
+SHED_PACKETS = PACKET_OUTCOMES.labels("shed")
+
+ADMISSION_LEVEL = ADMISSION.labels()
+
+DB_FLUSH_ERRORS = DB_ERRORS.labels("flush")
+DB_UNIT_OF_WORK_ERRORS = DB_ERRORS.labels("unit_of_work")
+DB_NODE_STATUS_ERRORS = DB_ERRORS.labels("node_status")
+
+_ports: Dict[int, Tuple[CounterSeries, HistogramSeries]] = {}
+_lags: Dict[str, Dict[str, HistogramSeries]] = {}
+_shed: Dict[int, Tuple[CounterSeries, CounterSeries]] = {}
+
+
+def port_series(port_num: int) -> Tuple[CounterSeries, HistogramSeries]:
+    """``(packet counter, processor histogram)`` for ``port_num``.  Ports
+    get their series on first sight, so idle ports are not exported."""
+    series = _ports.get(port_num)
+    if series is None:
+        name = enums.port_name(port_num)
+        series = _ports[port_num] = (
+            PACKETS_BY_PORT.labels(name),
+            PROCESSOR_SECONDS.labels(name),
+        )
+    return series
+
+
+def lag_series(stage: str, topic_root: str) -> HistogramSeries:
+    series = _lags.get(stage, {}).get(topic_root)
+    if series is None:
+        series = _lags.setdefault(stage, {})[topic_root] = INGEST_LAG.labels(
+            stage, topic_root
+        )
+    return series
+
+
+def shed_series(port_num: int) -> Tuple[CounterSeries, CounterSeries]:
+    """``(packets shed, packet rows shed)`` for ``port_num``."""
+    series = _shed.get(port_num)
+    if series is None:
+        name = enums.port_name(port_num)
+        series = _shed[port_num] = (
+            SHED.labels(name, "packet"),
+            SHED.labels(name, "packet_row"),
+        )
+    return series
@@ -0,0 +1,288 @@
+"""Minimal Prometheus instruments and a ``/metrics`` endpoint.
+
+The exporter writes mesh data to TimescaleDB, not Prometheus, so this is
+only for the exporter's own health.  Instruments are cheap enough for the
+per-packet path.  Each labelled series is created once, usually at
+import, and callers keep a reference to it.  A histogram series is a
+preallocated list of bucket counts, so an observation is a bisect plus
+two additions under a lock.
+
+:func:`render` also turns the ``stats()`` snapshots the
+:class:`~exporter.metric.reporter.StatsReporter` logs into gauges and
+counters, so the two views always agree.
+"""
+
+import logging
+import re
+import threading
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from exporter.metric.reporter import flatten
+
+logger = logging.getLogger(__name__)
+
+NAMESPACE = "meshtastic_exporter"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds.  Parsing an envelope takes a few microseconds and a COPY flush
+# can take seconds, so the range is wide.
+DEFAULT_BUCKETS = (
+    0.00001,
+    0.000025,
+    0.00005,
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+)
+
+_INVALID_NAME_CHARS = re.compile(r"[^a-zA-Z0-9_]")
+
+
+class CounterSeries:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: int = 1):
+        with self._lock:
+            self.value += amount
+
+
+class GaugeSeries:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def set(self, value: float):
+        self.value = value
+
+
+class HistogramSeries:
+    __slots__ = ("buckets", "counts", "sum", "_lock")
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(buckets)
+        # One slot per bucket plus +Inf; rendered cumulatively.
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+
+class Family:
+    """A named metric and its labelled series."""
+
+    def __init__(
+        self,
+        kind: str,
+        name: str,
+        documentation: str,
+        label_names: Tuple[str, ...],
+        factory: Callable[[], Any],
+    ):
+        self.kind = kind
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self._factory = factory
+        self._series: Dict[Tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values: str):
+        """The series for ``values``, created on first use.  Resolve it
+        once and keep it; this is not meant for the per-packet path."""
+        if len(values) != len(self.label_names):
+            raise ValueError(
+                f"{self.name} takes labels {self.label_names}, got {values}"
+            )
+        series = self._series.get(values)
+        if series is None:
+            with self._lock:
+                series = self._series.setdefault(values, self._factory())
+        return series
+
+    def render(self, out: List[str]):
+        out.append(f"# HELP {self.name} {self.documentation}")
+        out.append(f"# TYPE {self.name} {self.kind}")
+        with self._lock:
+            series = list(self._series.items())
+        for values, item in series:
+            labels = dict(zip(self.label_names, values))
+            if self.kind != "histogram":
+                out.append(f"{self.name}{_labels(labels)} {item.value}")
+                continue
+            with item._lock:
+                counts = list(item.counts)
+                total = item.sum
+            cumulative = 0
+            for bound, count in zip(item.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                out.append(
+                    f"{self.name}_bucket{_labels({**labels, 'le': le})} {cumulative}"
+                )
+            out.append(f"{self.name}_sum{_labels(labels)} {total}")
+            out.append(f"{self.name}_count{_labels(labels)} {cumulative}")
+
+
+class Registry:
+    def __init__(self, namespace: str = NAMESPACE):
+        self.namespace = namespace
+        self._families: List[Family] = []
+
+    def counter(
+        self, name: str, documentation: str, labels: Sequence[str] = ()
+    ) -> Family:
+        return self._add(
+            Family(
+                "counter",
+                f"{self.namespace}_{name}",
+                documentation,
+                tuple(labels),
+                CounterSeries,
+            )
+        )
+
+    def gauge(
+        self, name: str, documentation: str, labels: Sequence[str] = ()
+    ) -> Family:
+        return self._add(
+            Family(
+                "gauge",
+                f"{self.namespace}_{name}",
+                documentation,
+                tuple(labels),
+                GaugeSeries,
+            )
+        )
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> Family:
+        buckets = tuple(sorted(buckets))
+        return self._add(
+            Family(
+                "histogram",
+                f"{self.namespace}_{name}",
+                documentation,
+                tuple(labels),
+                lambda: HistogramSeries(buckets),
+            )
+        )
+
+    def render(self, stats: Optional[Dict[str, Any]] = None) -> str:
+        """Every instrument in the text exposition format, followed by the
+        numeric values of a ``StatsReporter.snapshot()``."""
+        out: List[str] = []
+        for family in self._families:
+            family.render(out)
+        if stats:
+            _render_stats(stats, self.namespace, out)
+        return "\n".join(out) + "\n"
+
+    def _add(self, family: Family) -> Family:
+        self._families.append(family)
+        return family
+
+
+class MetricsServer:
+    """Serves ``render()`` at ``/metrics`` from a daemon thread."""
+
+    def __init__(self, render: Callable[[], str], port: int, host: str = ""):
+        self._render = render
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def port(self) -> int:
+        return self._server.server_address[1]
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._server.serve_forever, name="metrics-http", daemon=True
+            )
+            self._thread.start()
+
+    def close(self):
+        if self._thread is not None:
+            self._server.shutdown()
+            self._thread.join()
+            self._thread = None
+        self._server.server_close()
+
+    def _handler(self):
+        render = self._render
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?", 1)[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                try:
+                    body = render().encode("utf-8")
+                except Exception as e:
+                    logger.error(f"Failed to render metrics: {e}")
+                    self.send_error(500)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logger.debug(f"metrics: {format % args}")
+
+        return Handler
+
+
+def _labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    pairs = ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items())
+    return "{" + pairs + "}"
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _render_stats(stats: Dict[str, Any], namespace: str, out: List[str]):
+    for group, values in flatten(stats).items():
+        for key, value in values.items():
+            if isinstance(value, bool):
+                value = int(value)
+            if not isinstance(value, (int, float)):
+                continue
+            name = _INVALID_NAME_CHARS.sub("_", f"{namespace}_{group}_{key}")
+            kind = "counter" if key.endswith("_total") else "gauge"
+            out.append(f"# TYPE {name} {kind}")
+            out.append(f"{name} {value}")
@@ -0,0 +1,88 @@
+"""Periodic log line for the exporter's internal statistics.
+
+Components expose a ``stats()`` callable returning a flat dict (or a dict of
+flat dicts, one per sub-component).  Keys ending in ``_total`` are
+monotonic counters; the reporter logs their per-second rate over the last
+interval next to the raw value.  Everything else is logged as-is.
+"""
+
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+StatsSource = Callable[[], Dict[str, Any]]
+
+
+def flatten(snapshot: Dict[str, Any], prefix: str = "") -> Dict[str, Any]:
+    """``{"ingest": {"parse": {"depth": 1}}}`` -> ``{"ingest.parse": {"depth": 1}}``."""
+    out: Dict[str, Any] = {}
+    scalars = {}
+    for key, value in snapshot.items():
+        name = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            out.update(flatten(value, name))
+        else:
+            scalars[key] = value
+    if scalars:
+        out[prefix] = scalars
+    return out
+
+
+class StatsReporter:
+    def __init__(self, interval: float = 60.0):
+        self.interval = interval
+        self._sources: Dict[str, StatsSource] = {}
+        self._previous: Dict[str, Dict[str, Any]] = {}
+        self._previous_at: Optional[float] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def register(self, name: str, source: StatsSource):
+        self._sources[name] = source
+
+    def snapshot(self) -> Dict[str, Any]:
+        snap: Dict[str, Any] = {}
+        for name, source in self._sources.items():
+            try:
+                snap[name] = source()
+            except Exception as e:
+                logger.debug(f"Stats source {name} failed: {e}")
+        return snap
+
+    def start(self):
+        if self.interval <= 0 or self._thread is not None:
+            return
+        self._thread = threading.Thread(
+            target=self._run, name="stats-reporter", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.report()
+
+    def report(self):
+        now = time.monotonic()
+        groups = flatten(self.snapshot())
+        elapsed = now - self._previous_at if self._previous_at else None
+        for group, values in groups.items():
+            previous = self._previous.get(group, {})
+            parts = []
+            for key, value in values.items():
+                parts.append(f"{key}={value}")
+                if elapsed and key.endswith("_total") and key in previous:
+                    rate = (value - previous[key]) / elapsed
+                    parts.append(f"{key[: -len('_total')]}_per_sec={rate:.2f}")
+            logger.info(f"{group}: {', '.join(parts)}")
+        self._previous = groups
+        self._previous_at = now
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.report()
@@ -0,0 +1,117 @@
+"""Read-through cache of :class:`ClientDetails` keyed by node id.
+
+Every packet looks up its source and destination node.  Node names and
+hardware change rarely and the NodeInfo / MapReport processors write
+through to the cache, so lookups for known nodes never touch the
+database.  Entries expire after ``ttl`` seconds so changes written by
+another exporter sharing the database are eventually picked up, and the
+cache holds at most ``max_entries`` nodes, dropping the least recently
+used first.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+from exporter.client_details import ClientDetails
+
+DEFAULT_TTL_SECONDS = 3600.0
+DEFAULT_MAX_ENTRIES = 50_000
+
+
+class NodeCache:
+    def __init__(
+        self,
+        ttl: float = DEFAULT_TTL_SECONDS,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.ttl = ttl
+        self.max_entries = max(1, max_entries)
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[int, Tuple[ClientDetails, float]]" = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def get(self, node_id: int) -> Optional[ClientDetails]:
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(node_id)
+            if entry is None or now - entry[1] > self.ttl:
+                if entry is not None:
+                    del self._entries[node_id]
+                self._misses += 1
+                return None
+            self._entries.move_to_end(node_id)
+            self._hits += 1
+            return entry[0]
+
+    def put(self, details: ClientDetails):
+        now = self._clock()
+        with self._lock:
+            self._store(details, now)
+
+    def merge(self, node_id: int, **fields: Any):
+        """Write-through for processors that learn new node details.  Only
+        fields that are not None replace the cached value; nodes that are
+        not cached are left for the next lookup to load."""
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(node_id)
+            if entry is None:
+                return
+            current = entry[0]
+            merged = ClientDetails(
+                node_id=current.node_id,
+                short_name=current.short_name,
+                long_name=current.long_name,
+                hardware_model=current.hardware_model,
+                role=current.role,
+            )
+            for name, value in fields.items():
+                if value is not None:
+                    setattr(merged, name, value)
+            self._store(merged, now)
+
+    def warm(self, rows: Iterable[tuple]) -> int:
+        """Bulk-load ``(node_id, short_name, long_name, hardware_model,
+        role)`` rows, most important first."""
+        count = 0
+        now = self._clock()
+        with self._lock:
+            for row in rows:
+                if count >= self.max_entries:
+                    break
+                self._store(
+                    ClientDetails(
+                        node_id=row[0],
+                        short_name=row[1],
+                        long_name=row[2],
+                        hardware_model=row[3],
+                        role=row[4],
+                    ),
+                    now,
+                    last=False,
+                )
+                count += 1
+        return count
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "capacity": self.max_entries,
+                "hits_total": self._hits,
+                "misses_total": self._misses,
+                "evictions_total": self._evictions,
+            }
+
+    def _store(self, details: ClientDetails, now: float, last: bool = True):
+        self._entries[details.node_id] = (details, now)
+        self._entries.move_to_end(details.node_id, last=last)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._evictions += 1
@@ -0,0 +1,226 @@
+"""Write-behind, coalescing cache for ``node_details`` state columns.
+
+MQTT status, positions, NodeInfo and MapReport packets each update a
+handful of ``node_details`` columns, usually with the values the row
+already has.  :class:`NodeStateWriter` keeps the last written value of
+each column per node and merges updates into a dirty set, last write
+wins per column.  Values equal to what was last written are dropped, so
+a node that keeps reporting the same position costs nothing.  Every
+``interval`` seconds the dirty nodes are written in one transaction, with
+one multi-row upsert per distinct column set.
+
+``updated_at`` is stamped when a column actually changes.  It is also
+refreshed at most every ``touch_interval`` seconds for a node whose
+reports change nothing, so it still says when the node was last heard
+from.  Known values expire after ``ttl`` seconds, like the node cache, so
+changes written by another exporter sharing the database are not masked
+forever.
+
+With ``interval`` 0 there is no flusher thread; every update that
+changes something is written before :meth:`update` returns.
+
+The same writer keeps ``node_latest`` (``table="node_latest"``), the last
+telemetry values per node, with ``touch=False``: every reading carries
+its own timestamp, so nothing is skipped there, but a node reporting
+several times per interval costs one row.
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from psycopg_pool import ConnectionPool
+
+logger = logging.getLogger(__name__)
+
+# node_id -> (update columns, insert-only defaults)
+PendingNode = Tuple[Dict[str, Any], Dict[str, Any]]
+
+# Keeps a statement well under the 65535 bind parameters PostgreSQL allows.
+UPSERT_CHUNK_ROWS = 1000
+
+_MISSING = object()
+
+
+class NodeStateWriter:
+    def __init__(
+        self,
+        db_pool: ConnectionPool,
+        interval: float = 5.0,
+        touch_interval: float = 300.0,
+        ttl: float = 3600.0,
+        max_nodes: int = 100_000,
+        clock: Callable[[], float] = time.monotonic,
+        table: str = "node_details",
+    ):
+        self.db_pool = db_pool
+        self.table = table
+        self.interval = interval
+        self.touch_interval = touch_interval
+        self.ttl = ttl
+        self.max_nodes = max(1, max_nodes)
+        self._clock = clock
+        self._lock = threading.Lock()
+        # node_id -> (columns as last written, written at, touched at)
+        self._known: "OrderedDict[int, Tuple[Dict[str, Any], float, float]]" = (
+            OrderedDict()
+        )
+        self._dirty: Dict[int, PendingNode] = {}
+        self._updates = 0
+        self._skipped = 0
+        self._flushes = 0
+        self._rows = 0
+        self._failures = 0
+        self._last_flush = 0.0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread is None and self.interval > 0:
+            self._thread = threading.Thread(
+                target=self._run,
+                name=f"{self.table.replace('_', '-')}-writer",
+                daemon=True,
+            )
+            self._thread.start()
+
+    def close(self):
+        """Stop the flusher and write out every dirty node."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def update(
+        self,
+        node_id: int,
+        columns: Dict[str, Any],
+        defaults: Optional[Dict[str, Any]] = None,
+        touch: bool = True,
+    ):
+        """Merge ``columns`` into ``node_id``'s pending state.  ``defaults``
+        are only used if the node has no row yet.  With ``touch``, a real
+        change (or an expired touch) also sets ``updated_at``."""
+        now = self._clock()
+        with self._lock:
+            self._updates += 1
+            known = self._known.get(node_id)
+            if known is not None and now - known[1] > self.ttl:
+                del self._known[node_id]
+                known = None
+            pending = self._dirty.get(node_id)
+            current = {
+                **(known[0] if known is not None else {}),
+                **(pending[0] if pending is not None else {}),
+            }
+            changed = {
+                column: value
+                for column, value in columns.items()
+                if current.get(column, _MISSING) != value
+            }
+            if touch and (
+                changed or known is None or now - known[2] >= self.touch_interval
+            ):
+                changed["updated_at"] = datetime.now()
+            if not changed:
+                self._skipped += 1
+                return
+            if pending is None:
+                pending = self._dirty[node_id] = ({}, {})
+            pending[0].update(changed)
+            for column, value in (defaults or {}).items():
+                pending[1].setdefault(column, value)
+        if self.interval <= 0:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            dirty, self._dirty = self._dirty, {}
+        if not dirty:
+            return
+        start = time.perf_counter()
+        try:
+            with self.db_pool.connection() as conn:
+                with conn.cursor() as cur:
+                    upsert_nodes(cur, dirty, self.table)
+                conn.commit()
+        except Exception as e:
+            logger.error(f"Failed to write {self.table} of {len(dirty)} nodes: {e}")
+            with self._lock:
+                self._failures += 1
+                # Keep the failed values unless a newer update replaced them.
+                for node_id, (columns, defaults) in dirty.items():
+                    newer = self._dirty.get(node_id)
+                    if newer is None:
+                        self._dirty[node_id] = (columns, defaults)
+                    else:
+                        self._dirty[node_id] = (
+                            {**columns, **newer[0]},
+                            {**defaults, **newer[1]},
+                        )
+            return
+        elapsed = time.perf_counter() - start
+        now = self._clock()
+        with self._lock:
+            self._flushes += 1
+            self._rows += len(dirty)
+            self._last_flush = elapsed
+            for node_id, (columns, _) in dirty.items():
+                known = self._known.get(node_id)
+                written = dict(known[0]) if known is not None else {}
+                touched = known[2] if known is not None else now
+                if "updated_at" in columns:
+                    touched = now
+                written.update(columns)
+                written.pop("updated_at", None)
+                self._known[node_id] = (written, now, touched)
+                self._known.move_to_end(node_id)
+            while len(self._known) > self.max_nodes:
+                self._known.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "nodes": len(self._known),
+                "dirty": len(self._dirty),
+                "updates_total": self._updates,
+                "skipped_total": self._skipped,
+                "flushes_total": self._flushes,
+                "rows_total": self._rows,
+                "failed_flushes_total": self._failures,
+                "last_flush_ms": round(self._last_flush * 1000, 3),
+            }
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.flush()
+
+
+def upsert_nodes(cur, nodes: Dict[int, PendingNode], table: str = "node_details"):
+    """Upsert rows of a per-node table keyed on ``node_id``
+    (``node_details`` or ``node_latest``), one statement per distinct set of
+    columns.  Only the update columns are overwritten on conflict; the
+    defaults fill in the other columns of new rows."""
+    groups: Dict[Tuple[Tuple[str, ...], Tuple[str, ...]], List[tuple]] = {}
+    for node_id, (columns, defaults) in sorted(nodes.items()):
+        row = {**defaults, **columns}
+        key = (tuple(sorted(row)), tuple(sorted(columns)))
+        groups.setdefault(key, []).append(
+            (node_id, *(row[column] for column in key[0]))
+        )
+    for (insert_columns, update_columns), rows in groups.items():
+        names = ", ".join(("node_id",) + insert_columns)
+        placeholders = ", ".join(["%s"] * (len(insert_columns) + 1))
+        updates = ", ".join(f"{c} = EXCLUDED.{c}" for c in update_columns)
+        for i in range(0, len(rows), UPSERT_CHUNK_ROWS):
+            chunk = rows[i : i + UPSERT_CHUNK_ROWS]
+            values = ", ".join([f"({placeholders})"] * len(chunk))
+            cur.execute(
+                f"INSERT INTO {table} ({names}) VALUES {values} "
+                f"ON CONFLICT (node_id) DO UPDATE SET {updates}",
+                [value for row in chunk for value in row],
+            )
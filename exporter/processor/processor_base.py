@@ -1,39 +1,85 @@
-import base64
 import json
 import logging
 import os
-
-from cryptography.hazmat.backends import default_backend
-from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+import threading
+import time
+from typing import Any, Dict, Optional
 
 try:
-    from meshtastic.mesh_pb2 import Data, HardwareModel, MeshPacket
+    from meshtastic.mesh_pb2 import HardwareModel, MeshPacket
     from meshtastic.mqtt_pb2 import ServiceEnvelope
     from meshtastic.portnums_pb2 import PortNum
 except ImportError:
-    from meshtastic.protobuf.mesh_pb2 import Data, HardwareModel, MeshPacket
+    from meshtastic.protobuf.mesh_pb2 import HardwareModel, MeshPacket
     from meshtastic.protobuf.mqtt_pb2 import ServiceEnvelope
     from meshtastic.protobuf.portnums_pb2 import PortNum
 
+import psycopg
 from psycopg_pool import ConnectionPool
 
+from exporter import enums
+from exporter.admission import AdmissionController
 from exporter.client_details import ClientDetails
-from exporter.db_handler import BROADCAST_NODE_IDS, DBHandler
+from exporter.db_handler import (
+    BROADCAST_NODE_IDS,
+    BatchWriter,
+    DBHandler,
+    UnitOfWork,
+)
+from exporter.decode import decrypt_packet
+from exporter.freshness import Arrival, LagTracker
+from exporter.keyring import ChannelKeyring
+from exporter.metric import instruments
+from exporter.node_cache import NodeCache
+from exporter.node_state import NodeStateWriter
 from exporter.processor.processors import ProcessorRegistry
 
-DEFAULT_MQTT_KEY = "1PG7OiApB1nwvP+rz05pAQ=="
 HIDDEN = "Hidden"
 
+# mesh_packet_metrics.portnum is a SMALLINT; PortNum values are far below.
+PORTNUM_MAX = 32767
+
 
 class MessageProcessor:
-    def __init__(self, db_pool: ConnectionPool):
+    def __init__(
+        self,
+        db_pool: ConnectionPool,
+        writer: Optional[BatchWriter] = None,
+        node_cache: Optional[NodeCache] = None,
+        keyring: Optional[ChannelKeyring] = None,
+        lag_tracker: Optional[LagTracker] = None,
+        admission: Optional[AdmissionController] = None,
+        node_state: Optional[NodeStateWriter] = None,
+        node_latest: Optional[NodeStateWriter] = None,
+    ):
         self.db_pool = db_pool
-        self.db_handler = DBHandler(db_pool)
-        self.processor_registry = ProcessorRegistry()
+        self.keyring = keyring or ChannelKeyring.from_env()
+        self.lag_tracker = lag_tracker
+        self.admission = admission
+        self.node_cache = node_cache or NodeCache()
+        self.db_handler = DBHandler(
+            db_pool, writer, self.node_cache, node_state, node_latest
+        )
+        self.processor_registry = ProcessorRegistry(db_pool, self.db_handler)
+        self._uow_lock = threading.Lock()
+        self._uow_packets = 0
+        self._uow_statements = 0
+        self._uow_round_trips = 0
+
+    def warm_node_cache(self) -> int:
+        """Bulk-load known nodes so the first packets from them skip the
+        per-node SELECT."""
+        rows = self.db_handler.load_node_details(self.node_cache.max_entries)
+        return self.node_cache.warm(rows)
+
+    def sync_port_names(self) -> int:
+        """Name every PortNum value of the installed protobufs in
+        ``port_names``."""
+        return self.db_handler.store_port_names(enums.numbers(enums.PORT_NAMES))
 
     @staticmethod
-    def process_json_mqtt(message):
-        json.loads(message.payload)
+    def process_json_mqtt(payload: bytes):
+        json.loads(payload)
 
     @staticmethod
     def process_mqtt(
@@ -46,11 +92,16 @@ class MessageProcessor:
         # maintained by the scheduled job.
         del topic, service_envelope, mesh_packet
 
-    def process(self, mesh_packet: MeshPacket):
+    def decrypt(self, mesh_packet: MeshPacket) -> bool:
+        """Decrypt ``mesh_packet`` in place.  Returns False when the packet
+        is encrypted and could not be decoded; already-decoded packets pass
+        through untouched."""
+        return decrypt_packet(mesh_packet, self.keyring)
+
+    def process(self, mesh_packet: MeshPacket, arrival: Optional[Arrival] = None):
         try:
-            if getattr(mesh_packet, "encrypted"):
-                if not self._decrypt(mesh_packet):
-                    return
+            if not self.decrypt(mesh_packet):
+                return
 
             port_num = int(mesh_packet.decoded.portnum)
             payload = mesh_packet.decoded.payload
@@ -60,60 +111,83 @@ class MessageProcessor:
             # Real UNKNOWN_APP packets carry a payload; skip the rest so
             # they don't dominate the metrics.
             if port_num == PortNum.UNKNOWN_APP and not payload:
+                instruments.UNDECRYPTABLE.inc()
+                return
+            admission = self.admission
+            if admission is not None and not admission.admit(port_num):
+                instruments.SHED_PACKETS.inc()
                 return
 
-            source = self._client_details_for(
-                getattr(mesh_packet, "from"), "MESH_HIDE_SOURCE_DATA"
-            )
-            destination = self._client_details_for(
-                getattr(mesh_packet, "to"), "MESH_HIDE_DESTINATION_DATA"
-            )
-
-            self._record_packet(source, destination, mesh_packet, port_num)
-            ProcessorRegistry.get_processor(port_num)(self.db_pool).process(
-                payload, client_details=source
-            )
+            packets, processor_seconds = instruments.port_series(port_num)
+            packets.inc()
+            with UnitOfWork(self.db_pool) as uow:
+                source = self._client_details_for(
+                    getattr(mesh_packet, "from"), "MESH_HIDE_SOURCE_DATA", uow
+                )
+                # The destination is only needed for the packet row; skip
+                # its lookup too when the row is shed.
+                if admission is None or admission.store_packet_row(port_num):
+                    destination = self._client_details_for(
+                        getattr(mesh_packet, "to"), "MESH_HIDE_DESTINATION_DATA", uow
+                    )
+                    self._record_packet(
+                        source, destination, mesh_packet, port_num, uow, arrival
+                    )
+                start = time.perf_counter()
+                self.processor_registry.processor_for(port_num).process(
+                    payload, client_details=source, uow=uow
+                )
+                processor_seconds.observe(time.perf_counter() - start)
+            self._count_unit_of_work(uow)
+            if (
+                arrival is not None
+                and self.lag_tracker is not None
+                and self.db_handler.writer is None
+            ):
+                # Without a batch writer the packet row went out with the
+                # unit of work, so it is committed now.
+                self.lag_tracker.committed((arrival,), time.time())
+            if self.processor_registry.is_filtered(port_num):
+                instruments.FILTERED.inc()
+            else:
+                instruments.STORED.inc()
         except Exception as e:
+            instruments.FAILED.inc()
+            if isinstance(e, psycopg.Error):
+                instruments.DB_UNIT_OF_WORK_ERRORS.inc()
             logging.debug(f"Failed to process message: {e}")
 
+    def unit_of_work_stats(self) -> Dict[str, Any]:
+        with self._uow_lock:
+            packets = self._uow_packets or 1
+            return {
+                "packets_total": self._uow_packets,
+                "statements_total": self._uow_statements,
+                "round_trips_total": self._uow_round_trips,
+                "statements_per_packet": round(self._uow_statements / packets, 3),
+                "round_trips_per_packet": round(self._uow_round_trips / packets, 3),
+            }
+
     @staticmethod
     def get_port_name_from_portnum(port_num) -> str:
-        for enum_value in PortNum.DESCRIPTOR.values:
-            if enum_value.number == port_num:
-                return enum_value.name
-        return "UNKNOWN_PORT"
+        return enums.port_name(port_num)
 
     # ---------- internals ----------
 
-    def _decrypt(self, mesh_packet: MeshPacket) -> bool:
-        key_bytes = base64.b64decode(
-            os.getenv("MQTT_SERVER_KEY", DEFAULT_MQTT_KEY).encode("ascii")
-        )
-        nonce = getattr(mesh_packet, "id").to_bytes(8, "little") + getattr(
-            mesh_packet, "from"
-        ).to_bytes(8, "little")
-        cipher = Cipher(
-            algorithms.AES(key_bytes), modes.CTR(nonce), backend=default_backend()
+    def _count_unit_of_work(self, uow: UnitOfWork):
+        logging.debug(
+            f"Packet committed with {uow.statements} statements "
+            f"in {uow.round_trips} round trips"
         )
-        decryptor = cipher.decryptor()
-        decrypted = (
-            decryptor.update(getattr(mesh_packet, "encrypted")) + decryptor.finalize()
-        )
-        data = Data()
-        try:
-            data.ParseFromString(decrypted)
-        except Exception as e:
-            sender = getattr(mesh_packet, "from", 0)
-            packet_id = getattr(mesh_packet, "id", 0)
-            logging.debug(
-                f"Failed to decrypt packet {packet_id} from node {sender:x}: {e}"
-            )
-            return False
-        mesh_packet.decoded.CopyFrom(data)
-        return True
+        with self._uow_lock:
+            self._uow_packets += 1
+            self._uow_statements += uow.statements
+            self._uow_round_trips += uow.round_trips
 
-    def _client_details_for(self, node_id: int, hide_env_var: str) -> ClientDetails:
-        details = self._get_client_details(node_id)
+    def _client_details_for(
+        self, node_id: int, hide_env_var: str, uow: UnitOfWork
+    ) -> ClientDetails:
+        details = self._get_client_details(node_id, uow)
         if os.getenv(hide_env_var, "false").lower() == "true":
             return ClientDetails(
                 node_id=details.node_id, short_name=HIDDEN, long_name=HIDDEN
@@ -126,12 +200,14 @@ class MessageProcessor:
         destination: ClientDetails,
         mesh_packet: MeshPacket,
         port_num: int,
+        uow: UnitOfWork,
+        arrival: Optional[Arrival] = None,
     ):
         self.db_handler.store_mesh_packet_metrics(
             source.node_id,
             destination.node_id,
             {
-                "portnum": self.get_port_name_from_portnum(port_num),
+                "portnum": port_num if 0 <= port_num <= PORTNUM_MAX else None,
                 "packet_id": mesh_packet.id,
                 "channel": mesh_packet.channel,
                 "rx_time": mesh_packet.rx_time,
@@ -145,50 +221,77 @@ class MessageProcessor:
                 "priority": int(getattr(mesh_packet, "priority", 0) or 0),
                 "pki_encrypted": bool(getattr(mesh_packet, "pki_encrypted", False)),
             },
+            uow=uow,
+            arrival=arrival,
         )
 
-    def _get_client_details(self, node_id: int) -> ClientDetails:
-        node_id_str = str(node_id)
-        if node_id_str in BROADCAST_NODE_IDS:
-            self._upsert_broadcast(node_id_str)
-            return ClientDetails(
-                node_id=node_id_str, short_name="Broadcast", long_name="Broadcast"
+    def _get_client_details(self, node_id: int, uow: UnitOfWork) -> ClientDetails:
+        start = time.perf_counter()
+        details = self._lookup_client_details(node_id, uow)
+        instruments.NODE_LOOKUP.observe(time.perf_counter() - start)
+        return details
+
+    def _lookup_client_details(self, node_id: int, uow: UnitOfWork) -> ClientDetails:
+        details = self.node_cache.get(node_id)
+        if details is not None:
+            return details
+        if node_id in BROADCAST_NODE_IDS:
+            self._upsert_broadcast(node_id, uow)
+            details = ClientDetails(
+                node_id=node_id, short_name="Broadcast", long_name="Broadcast"
+            )
+        else:
+            details = self._fetch_or_create_node(node_id, uow)
+        self.node_cache.put(details)
+        return details
+
+    @staticmethod
+    def _upsert_broadcast(node_id: int, uow: UnitOfWork):
+        uow.execute(
+            """
+            INSERT INTO node_details
+                (node_id, short_name, long_name, hardware_model, role)
+            VALUES (%s, %s, %s, %s, %s)
+            ON CONFLICT (node_id) DO NOTHING
+            """,
+            (node_id, "Broadcast", "Broadcast", "BROADCAST", "BROADCAST"),
+        )
+
+    @staticmethod
+    def _fetch_or_create_node(node_id: int, uow: UnitOfWork) -> ClientDetails:
+        # One statement, one round trip: the INSERT returns the new row, the
+        # SELECT returns the existing one (it runs against the snapshot from
+        # before the INSERT, so exactly one branch yields a row).
+        row = uow.fetchone(
+            """
+            WITH inserted AS (
+                INSERT INTO node_details
+                    (node_id, short_name, long_name, hardware_model, role)
+                VALUES (%s, %s, %s, %s, %s)
+                ON CONFLICT (node_id) DO NOTHING
+                RETURNING node_id, short_name, long_name, hardware_model, role
+            )
+            SELECT node_id, short_name, long_name, hardware_model, role
+            FROM inserted
+            UNION ALL
+            SELECT node_id, short_name, long_name, hardware_model, role
+            FROM node_details
+            WHERE node_id = %s
+            LIMIT 1
+            """,
+            (node_id, "Unknown", "Unknown", HardwareModel.UNSET, None, node_id),
+        )
+        if row is None:
+            # Another worker inserted the node after our snapshot was taken;
+            # the conflict waited for its commit, so a new statement sees it.
+            row = uow.fetchone(
+                """
+                SELECT node_id, short_name, long_name, hardware_model, role
+                FROM node_details
+                WHERE node_id = %s
+                """,
+                (node_id,),
             )
-        return self._fetch_or_create_node(node_id_str)
-
-    def _upsert_broadcast(self, node_id: str):
-        with self.db_pool.connection() as conn:
-            with conn.cursor() as cur:
-                cur.execute(
-                    """
-                    INSERT INTO node_details
-                        (node_id, short_name, long_name, hardware_model, role)
-                    VALUES (%s, %s, %s, %s, %s)
-                    ON CONFLICT (node_id) DO NOTHING
-                    """,
-                    (node_id, "Broadcast", "Broadcast", "BROADCAST", "BROADCAST"),
-                )
-                conn.commit()
-
-    def _fetch_or_create_node(self, node_id: str) -> ClientDetails:
-        with self.db_pool.connection() as conn:
-            with conn.cursor() as cur:
-                cur.execute(
-                    "SELECT node_id, short_name, long_name, hardware_model, role "
-                    "FROM node_details WHERE node_id = %s",
-                    (node_id,),
-                )
-                row = cur.fetchone()
-                if row is None:
-                    cur.execute(
-                        "INSERT INTO node_details "
-                        "(node_id, short_name, long_name, hardware_model, role) "
-                        "VALUES (%s, %s, %s, %s, %s) "
-                        "RETURNING node_id, short_name, long_name, hardware_model, role",
-                        (node_id, "Unknown", "Unknown", HardwareModel.UNSET, None),
-                    )
-                    row = cur.fetchone()
-                    conn.commit()
         return ClientDetails(
             node_id=row[0],
             short_name=row[1],
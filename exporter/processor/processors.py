@@ -1,8 +1,10 @@
 import logging
 import os
+import threading
+import time
 from abc import ABC, abstractmethod
-from datetime import datetime
-from typing import Iterable, Optional, Type
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Tuple, Type
 
 import unishox2
 
@@ -24,7 +26,14 @@ try:
     from meshtastic.portnums_pb2 import PortNum
     from meshtastic.remote_hardware_pb2 import HardwareMessage
     from meshtastic.storeforward_pb2 import StoreAndForward
-    from meshtastic.telemetry_pb2 import Telemetry
+    from meshtastic.telemetry_pb2 import (
+        AirQualityMetrics,
+        DeviceMetrics,
+        EnvironmentMetrics,
+        LocalStats,
+        PowerMetrics,
+        Telemetry,
+    )
 except ImportError:
     from meshtastic.protobuf.admin_pb2 import AdminMessage
     from meshtastic.protobuf.mesh_pb2 import (
@@ -41,13 +50,21 @@ except ImportError:
     from meshtastic.protobuf.portnums_pb2 import PortNum
     from meshtastic.protobuf.remote_hardware_pb2 import HardwareMessage
     from meshtastic.protobuf.storeforward_pb2 import StoreAndForward
-    from meshtastic.protobuf.telemetry_pb2 import Telemetry
+    from meshtastic.protobuf.telemetry_pb2 import (
+        AirQualityMetrics,
+        DeviceMetrics,
+        EnvironmentMetrics,
+        LocalStats,
+        PowerMetrics,
+        Telemetry,
+    )
 
 from psycopg_pool import ConnectionPool
 
+from exporter import enums
 from exporter.client_details import ClientDetails
-from exporter.db_handler import DBHandler
-
+from exporter.db_handler import DBHandler, UnitOfWork
+from exporter.extractors import RowExtractor
 
 DEVICE_METRIC_FIELDS = (
     "battery_level",
@@ -111,18 +128,39 @@ LOCAL_STATS_TO_DEVICE_FIELDS = (
     "channel_utilization",
     "air_util_tx",
 )
+# node_position_metrics column -> Position field, where they differ.
+POSITION_FIELDS = (
+    ("latitude", "latitude_i"),
+    ("longitude", "longitude_i"),
+    "altitude",
+    "sats_in_view",
+    "ground_speed",
+    "ground_track",
+    ("pdop", "PDOP"),
+    ("hdop", "HDOP"),
+    ("vdop", "VDOP"),
+    "precision_bits",
+)
+PAX_COUNTER_FIELDS = (
+    ("wifi_stations", "wifi"),
+    ("ble_beacons", "ble"),
+    "uptime",
+)
 
-
-def _to_dict(message, fields: Iterable[str]) -> dict:
-    return {f: getattr(message, f, 0) for f in fields}
-
-
-def _enum_name(message_cls, field_name: str, value: int) -> str | None:
-    field = message_cls.DESCRIPTOR.fields_by_name.get(field_name)
-    if field is None or field.enum_type is None:
-        return None
-    val = field.enum_type.values_by_number.get(int(value))
-    return val.name if val is not None else None
+DEVICE_METRICS = RowExtractor("device_metrics", DeviceMetrics, DEVICE_METRIC_FIELDS)
+ENVIRONMENT_METRICS = RowExtractor(
+    "environment_metrics", EnvironmentMetrics, ENVIRONMENT_METRIC_FIELDS
+)
+AIR_QUALITY_METRICS = RowExtractor(
+    "air_quality_metrics", AirQualityMetrics, AIR_QUALITY_METRIC_FIELDS
+)
+POWER_METRICS = RowExtractor("power_metrics", PowerMetrics, POWER_METRIC_FIELDS)
+LOCAL_STATS = RowExtractor("local_stats", LocalStats, LOCAL_STATS_FIELDS)
+LOCAL_STATS_TO_DEVICE = RowExtractor(
+    "device_metrics", LocalStats, LOCAL_STATS_TO_DEVICE_FIELDS
+)
+NODE_POSITION = RowExtractor("node_position_metrics", Position, POSITION_FIELDS)
+PAX_COUNTER = RowExtractor("pax_counter_metrics", Paxcount, PAX_COUNTER_FIELDS)
 
 
 def _safe_parse(payload: bytes, message_cls, label: str):
@@ -136,25 +174,66 @@ def _safe_parse(payload: bytes, message_cls, label: str):
 
 
 class Processor(ABC):
-    def __init__(self, db_pool: ConnectionPool):
+    """One long-lived instance per registered class, shared by every ingest
+    worker (see :class:`ProcessorRegistry`).  Per-port state kept on the
+    instance — caches, counters, buffers — must be safe to use from
+    several threads at once."""
+
+    # Ports whose packets are the first to go when the exporter sheds load
+    # (see exporter.admission): nothing they carry is stored.
+    sheddable = False
+
+    def __init__(self, db_pool: ConnectionPool, db_handler: Optional[DBHandler] = None):
         self.db_pool = db_pool
-        self.db_handler = DBHandler(db_pool)
+        self.db_handler = db_handler or DBHandler(db_pool)
 
     @abstractmethod
-    def process(self, payload: bytes, client_details: ClientDetails): ...
+    def process(
+        self,
+        payload: bytes,
+        client_details: ClientDetails,
+        uow: Optional[UnitOfWork] = None,
+    ):
+        """Store whatever ``payload`` carries.  ``uow`` is the packet's
+        unit of work; pass it on to every DBHandler call so the packet's
+        statements share one connection and one commit."""
 
 
 class ProcessorRegistry:
     _registry: dict[int, Type[Processor]] = {}
 
+    def __init__(self, db_pool: ConnectionPool, db_handler: Optional[DBHandler] = None):
+        # Built once, so per-port state lives as long as the exporter and
+        # packets don't pay for a Processor / DBHandler allocation each.
+        # The filter is read here rather than at registration so importing
+        # the package does not depend on the environment being loaded.
+        filtered = os.getenv("EXPORTER_MESSAGE_TYPES_TO_FILTER", "").split(",")
+        classes = set(self._registry.values()) | {UnknownAppProcessor}
+        self._instances: dict[Type[Processor], Processor] = {
+            klass: klass(db_pool, db_handler) for klass in classes
+        }
+        self._unknown = self._instances[UnknownAppProcessor]
+        self._by_port: dict[int, Processor] = {}
+        self._filtered: set[int] = set()
+        for port_num, klass in self._registry.items():
+            if PortNum.Name(port_num) in filtered:
+                logger.info(f"Processor for port_num {port_num} is filtered out")
+                self._filtered.add(port_num)
+                continue
+            self._by_port[port_num] = self._instances[klass]
+
+    def processor_for(self, port_num) -> Processor:
+        return self._by_port.get(port_num, self._unknown)
+
+    def is_filtered(self, port_num) -> bool:
+        return port_num in self._filtered
+
+    def processors(self) -> Iterable[Processor]:
+        return self._instances.values()
+
     @classmethod
     def register_processor(cls, port_num):
         def inner(wrapped_class):
-            filtered = os.getenv("EXPORTER_MESSAGE_TYPES_TO_FILTER", "").split(",")
-            name = PortNum.DESCRIPTOR.values_by_number[port_num].name
-            if name in filtered:
-                logger.info(f"Processor for port_num {port_num} is filtered out")
-                return wrapped_class
             cls._registry[port_num] = wrapped_class
             return wrapped_class
 
@@ -164,6 +243,12 @@ class ProcessorRegistry:
     def get_processor(cls, port_num) -> Type[Processor]:
         return cls._registry.get(port_num, UnknownAppProcessor)
 
+    @classmethod
+    def sheddable_ports(cls) -> frozenset:
+        return frozenset(
+            port_num for port_num, klass in cls._registry.items() if klass.sheddable
+        )
+
 
 def _noop(
     port_num: int, message_cls: Optional[type] = None, name: Optional[str] = None
@@ -179,10 +264,16 @@ def _noop(
     label = name or PortNum.DESCRIPTOR.values_by_number[port_num].name
 
     class _NoopProcessor(Processor):
+        sheddable = True
         _label = label
         _message_cls = message_cls
 
-        def process(self, payload: bytes, client_details: ClientDetails):
+        def process(
+            self,
+            payload: bytes,
+            client_details: ClientDetails,
+            uow: Optional[UnitOfWork] = None,
+        ):
             if self._message_cls is not None:
                 _safe_parse(payload, self._message_cls, self._label)
 
@@ -198,300 +289,332 @@ def _noop(
 
 @ProcessorRegistry.register_processor(PortNum.UNKNOWN_APP)
 class UnknownAppProcessor(Processor):
-    def process(self, payload: bytes, client_details: ClientDetails):
+    def process(
+        self,
+        payload: bytes,
+        client_details: ClientDetails,
+        uow: Optional[UnitOfWork] = None,
+    ):
         return None
 
 
 @ProcessorRegistry.register_processor(PortNum.POSITION_APP)
 class PositionAppProcessor(Processor):
-    def process(self, payload: bytes, client_details: ClientDetails):
+    def process(
+        self,
+        payload: bytes,
+        client_details: ClientDetails,
+        uow: Optional[UnitOfWork] = None,
+    ):
         position = _safe_parse(payload, Position, "POSITION_APP")
         if position is None:
             return
         if position.latitude_i == 0 and position.longitude_i == 0:
             return
 
-        def db_op(cur, conn):
-            cur.execute(
-                """
-                UPDATE node_details
-                SET latitude   = %s,
-                    longitude  = %s,
-                    altitude   = %s,
-                    precision  = %s,
-                    updated_at = %s
-                WHERE node_id = %s
-                """,
-                (
-                    position.latitude_i,
-                    position.longitude_i,
-                    position.altitude,
-                    position.precision_bits,
-                    datetime.now(),
-                    client_details.node_id,
-                ),
-            )
-            conn.commit()
-
-        self.db_handler.execute_db_operation(db_op)
-
-        self.db_handler.store_node_position(
+        self.db_handler.update_node_details(
             client_details.node_id,
             {
                 "latitude": position.latitude_i,
                 "longitude": position.longitude_i,
-                "altitude": getattr(position, "altitude", 0),
-                "sats_in_view": getattr(position, "sats_in_view", 0),
-                "ground_speed": getattr(position, "ground_speed", 0),
-                "ground_track": getattr(position, "ground_track", 0),
-                "pdop": getattr(position, "PDOP", 0),
-                "hdop": getattr(position, "HDOP", 0),
-                "vdop": getattr(position, "VDOP", 0),
-                "precision_bits": getattr(position, "precision_bits", 0),
+                "altitude": position.altitude,
+                "precision": position.precision_bits,
             },
+            uow=uow,
+        )
+
+        self.db_handler.store_message(
+            NODE_POSITION, client_details.node_id, position, uow=uow
         )
 
 
 @ProcessorRegistry.register_processor(PortNum.NODEINFO_APP)
 class NodeInfoAppProcessor(Processor):
-    def process(self, payload: bytes, client_details: ClientDetails):
+    def process(
+        self,
+        payload: bytes,
+        client_details: ClientDetails,
+        uow: Optional[UnitOfWork] = None,
+    ):
         user = _safe_parse(payload, User, "NODEINFO_APP")
         if user is None:
             return
-        self.db_handler.execute_db_operation(
-            lambda cur, conn: self._upsert_user(cur, conn, user, client_details)
+        columns, defaults = self._user_columns(user)
+        self.db_handler.update_node_details(
+            client_details.node_id, columns, defaults, uow=uow
         )
-
-    @staticmethod
-    def _upsert_user(cur, conn, user: User, client_details: ClientDetails):
-        cur.execute(
-            "SELECT 1 FROM node_details WHERE node_id = %s",
-            (client_details.node_id,),
-        )
-        if cur.fetchone() is None:
-            cur.execute(
-                """
-                INSERT INTO node_details
-                    (node_id, short_name, long_name, hardware_model, role)
-                VALUES (%s, %s, %s, %s, %s)
-                """,
-                (
-                    client_details.node_id,
-                    user.short_name,
-                    user.long_name,
-                    ClientDetails.get_hardware_model_name_from_code(user.hw_model),
-                    ClientDetails.get_role_name_from_role(user.role),
+        if self.db_handler.node_cache is not None:
+            self.db_handler.node_cache.merge(
+                client_details.node_id,
+                short_name=user.short_name or None,
+                long_name=user.long_name or None,
+                hardware_model=(
+                    ClientDetails.get_hardware_model_name_from_code(user.hw_model)
+                    if user.hw_model != HardwareModel.UNSET
+                    else None
                 ),
+                role=ClientDetails.get_role_name_from_role(user.role),
             )
-            conn.commit()
-            return
 
-        updates: list[tuple[str, object]] = []
+    @staticmethod
+    def _user_columns(user: User):
+        # New nodes take the User as-is; known nodes only take the fields
+        # the User actually carries.
+        row = {
+            "short_name": user.short_name,
+            "long_name": user.long_name,
+            "hardware_model": ClientDetails.get_hardware_model_name_from_code(
+                user.hw_model
+            ),
+            "role": ClientDetails.get_role_name_from_role(user.role),
+        }
+        updates = ["role"]
         if user.short_name:
-            updates.append(("short_name", user.short_name))
+            updates.append("short_name")
         if user.long_name:
-            updates.append(("long_name", user.long_name))
+            updates.append("long_name")
         if user.hw_model != HardwareModel.UNSET:
-            updates.append(
-                (
-                    "hardware_model",
-                    ClientDetails.get_hardware_model_name_from_code(user.hw_model),
-                )
-            )
-        if user.role is not None:
-            updates.append(("role", ClientDetails.get_role_name_from_role(user.role)))
-
-        if not updates:
-            return
-
-        set_clause = ", ".join(f"{col} = %s" for col, _ in updates)
-        values = [v for _, v in updates] + [datetime.now(), client_details.node_id]
-        cur.execute(
-            f"UPDATE node_details SET {set_clause}, updated_at = %s WHERE node_id = %s",
-            values,
-        )
-        conn.commit()
+            updates.append("hardware_model")
+        columns = {column: row.pop(column) for column in updates}
+        return columns, row
 
 
 @ProcessorRegistry.register_processor(PortNum.PAXCOUNTER_APP)
 class PaxCounterAppProcessor(Processor):
-    def process(self, payload: bytes, client_details: ClientDetails):
+    def process(
+        self,
+        payload: bytes,
+        client_details: ClientDetails,
+        uow: Optional[UnitOfWork] = None,
+    ):
         paxcounter = _safe_parse(payload, Paxcount, "PAXCOUNTER_APP")
         if paxcounter is None:
             return
-        self.db_handler.store_pax_counter_metrics(
-            client_details.node_id,
-            {
-                "wifi_stations": getattr(paxcounter, "wifi", 0),
-                "ble_beacons": getattr(paxcounter, "ble", 0),
-                "uptime": getattr(paxcounter, "uptime", 0),
-            },
+        self.db_handler.store_message(
+            PAX_COUNTER, client_details.node_id, paxcounter, uow=uow
         )
 
 
 @ProcessorRegistry.register_processor(PortNum.TELEMETRY_APP)
 class TelemetryAppProcessor(Processor):
     _DISPATCH = (
-        ("device_metrics", DEVICE_METRIC_FIELDS, "store_device_metrics"),
-        ("environment_metrics", ENVIRONMENT_METRIC_FIELDS, "store_environment_metrics"),
-        ("air_quality_metrics", AIR_QUALITY_METRIC_FIELDS, "store_air_quality_metrics"),
-        ("power_metrics", POWER_METRIC_FIELDS, "store_power_metrics"),
-        ("local_stats", LOCAL_STATS_FIELDS, "store_local_stats"),
+        ("device_metrics", DEVICE_METRICS),
+        ("environment_metrics", ENVIRONMENT_METRICS),
+        ("air_quality_metrics", AIR_QUALITY_METRICS),
+        ("power_metrics", POWER_METRICS),
+        ("local_stats", LOCAL_STATS),
     )
 
-    def process(self, payload: bytes, client_details: ClientDetails):
+    def process(
+        self,
+        payload: bytes,
+        client_details: ClientDetails,
+        uow: Optional[UnitOfWork] = None,
+    ):
         telemetry = _safe_parse(payload, Telemetry, "TELEMETRY_APP")
         if telemetry is None:
             return
-        for field, columns, store_fn in self._DISPATCH:
+        for field, extractor in self._DISPATCH:
             if telemetry.HasField(field):
-                getattr(self.db_handler, store_fn)(
-                    client_details.node_id,
-                    _to_dict(getattr(telemetry, field), columns),
+                self.db_handler.store_message(
+                    extractor, client_details.node_id, getattr(telemetry, field), uow
                 )
         # local_stats and device_metrics share three columns (uptime,
         # ChUtil, AirUtilTX). When a packet carries local_stats, mirror
         # those columns into device_metrics so charts only ever read one
         # table for those values.
         if telemetry.HasField("local_stats"):
-            self.db_handler.store_device_metrics(
+            self.db_handler.store_message(
+                LOCAL_STATS_TO_DEVICE,
                 client_details.node_id,
-                _to_dict(telemetry.local_stats, LOCAL_STATS_TO_DEVICE_FIELDS),
+                telemetry.local_stats,
+                uow,
             )
 
 
 @ProcessorRegistry.register_processor(PortNum.NEIGHBORINFO_APP)
 class NeighborInfoAppProcessor(Processor):
-    def process(self, payload: bytes, client_details: ClientDetails):
+    """Replaces a node's neighbor set with each report, in one statement.
+
+    Nodes resend the same neighbors every broadcast interval, so the last
+    set written per node is kept and a report is skipped when it has the
+    same neighbors and every SNR is within ``NEIGHBOR_SNR_TOLERANCE`` dB.
+    A node's set is written again at least every
+    ``NEIGHBOR_REFRESH_SECONDS`` so a lost write doesn't stick.  A set is
+    only remembered once its write has committed.  At most
+    ``NEIGHBOR_CACHE_MAX_NODES`` nodes are remembered, least recently
+    written first out.
+    """
+
+    def __init__(self, db_pool: ConnectionPool, db_handler: Optional[DBHandler] = None):
+        super().__init__(db_pool, db_handler)
+        self.snr_tolerance = float(os.getenv("NEIGHBOR_SNR_TOLERANCE", 1.0))
+        self.refresh_seconds = float(os.getenv("NEIGHBOR_REFRESH_SECONDS", 3600))
+        self.max_nodes = max(1, int(os.getenv("NEIGHBOR_CACHE_MAX_NODES", 50_000)))
+        self._lock = threading.Lock()
+        # node_id -> (neighbor_id -> snr, written at)
+        self._last: "OrderedDict[int, Tuple[Dict[int, float], float]]" = OrderedDict()
+        self._skipped = 0
+
+    def process(
+        self,
+        payload: bytes,
+        client_details: ClientDetails,
+        uow: Optional[UnitOfWork] = None,
+    ):
         neighbor_info = _safe_parse(payload, NeighborInfo, "NEIGHBORINFO_APP")
         if neighbor_info is None:
             return
+        node_id = client_details.node_id
+        # A neighbor listed twice keeps its last SNR.
+        neighbors = {n.node_id: float(n.snr) for n in neighbor_info.neighbors}
+        if not self._changed(node_id, neighbors):
+            return
+        written_at = time.monotonic()
         self.db_handler.execute_db_operation(
-            lambda cur, conn: self._update(cur, conn, neighbor_info, client_details)
+            lambda cur, conn: self._update(cur, conn, node_id, neighbors), uow
         )
-
-    @staticmethod
-    def _update(cur, conn, neighbor_info: NeighborInfo, client_details: ClientDetails):
-        new_ids = [str(n.node_id) for n in neighbor_info.neighbors]
-        if new_ids:
-            placeholders = ",".join(["%s"] * len(new_ids))
-            cur.execute(
-                f"DELETE FROM node_neighbors WHERE node_id = %s AND neighbor_id NOT IN ({placeholders})",
-                (client_details.node_id, *new_ids),
-            )
+        if uow is None:
+            self._remember(node_id, neighbors, written_at)
         else:
-            cur.execute(
-                "DELETE FROM node_neighbors WHERE node_id = %s",
-                (client_details.node_id,),
-            )
-
-        for neighbor in neighbor_info.neighbors:
-            cur.execute(
-                """
-                WITH upsert AS (
-                    INSERT INTO node_neighbors (node_id, neighbor_id, snr)
-                    VALUES (%s, %s, %s)
-                    ON CONFLICT (node_id, neighbor_id)
-                    DO UPDATE SET snr = EXCLUDED.snr
-                    RETURNING node_id, neighbor_id
+            uow.after_commit(lambda: self._remember(node_id, neighbors, written_at))
+
+    def stats(self):
+        with self._lock:
+            return {"nodes": len(self._last), "skipped_total": self._skipped}
+
+    def _changed(self, node_id: int, neighbors: Dict[int, float]) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            last = self._last.get(node_id)
+            if (
+                last is not None
+                and now - last[1] < self.refresh_seconds
+                and last[0].keys() == neighbors.keys()
+                and all(
+                    abs(last[0][n] - snr) <= self.snr_tolerance
+                    for n, snr in neighbors.items()
                 )
+            ):
+                self._skipped += 1
+                return False
+            return True
+
+    def _remember(self, node_id: int, neighbors: Dict[int, float], written_at: float):
+        with self._lock:
+            self._last[node_id] = (neighbors, written_at)
+            self._last.move_to_end(node_id)
+            while len(self._last) > self.max_nodes:
+                self._last.popitem(last=False)
+
+    @staticmethod
+    def _update(cur, conn, node_id: int, neighbors: Dict[int, float]):
+        # Node rows first (RI checks run at the end of the statement, so
+        # the neighbor rows see them), then drop neighbors that are gone and
+        # upsert the rest.  An empty report clears the node's neighbors.
+        cur.execute(
+            """
+            WITH report AS (
+                SELECT * FROM unnest(%s::bigint[], %s::float8[])
+                    AS r(neighbor_id, snr)
+            ),
+            nodes AS (
                 INSERT INTO node_details (node_id)
-                SELECT node_id FROM upsert
-                WHERE NOT EXISTS (SELECT 1 FROM node_details WHERE node_id = upsert.node_id)
+                SELECT %s
                 UNION
-                SELECT neighbor_id FROM upsert
-                WHERE NOT EXISTS (SELECT 1 FROM node_details WHERE node_id = upsert.neighbor_id)
+                SELECT neighbor_id FROM report
                 ON CONFLICT (node_id) DO NOTHING
-                """,
-                (
-                    str(client_details.node_id),
-                    str(neighbor.node_id),
-                    float(neighbor.snr),
-                ),
+            ),
+            removed AS (
+                DELETE FROM node_neighbors
+                WHERE node_id = %s
+                  AND neighbor_id <> ALL (SELECT neighbor_id FROM report)
             )
+            INSERT INTO node_neighbors (node_id, neighbor_id, snr)
+            SELECT %s, neighbor_id, snr FROM report
+            ON CONFLICT (node_id, neighbor_id) DO UPDATE SET snr = EXCLUDED.snr
+            """,
+            (list(neighbors), list(neighbors.values()), node_id, node_id, node_id),
+        )
         conn.commit()
 
 
 @ProcessorRegistry.register_processor(PortNum.MAP_REPORT_APP)
 class MapReportAppProcessor(Processor):
-    def process(self, payload: bytes, client_details: ClientDetails):
+    def process(
+        self,
+        payload: bytes,
+        client_details: ClientDetails,
+        uow: Optional[UnitOfWork] = None,
+    ):
         map_report = _safe_parse(payload, MapReport, "MAP_REPORT_APP")
         if map_report is None:
             return
 
-        region = _enum_name(MapReport, "region", getattr(map_report, "region", 0))
-        modem_preset = _enum_name(
-            MapReport, "modem_preset", getattr(map_report, "modem_preset", 0)
+        region = enums.REGION_NAMES.get(getattr(map_report, "region", 0))
+        modem_preset = enums.MODEM_PRESET_NAMES.get(
+            getattr(map_report, "modem_preset", 0)
         )
 
-        row = (
-            client_details.node_id,
-            getattr(map_report, "short_name", "") or "Unknown",
-            getattr(map_report, "long_name", "") or "Unknown",
-            ClientDetails.get_hardware_model_name_from_code(
+        columns = {
+            "short_name": getattr(map_report, "short_name", "") or "Unknown",
+            "long_name": getattr(map_report, "long_name", "") or "Unknown",
+            "hardware_model": ClientDetails.get_hardware_model_name_from_code(
                 getattr(map_report, "hw_model", HardwareModel.UNSET)
             ),
-            ClientDetails.get_role_name_from_role(getattr(map_report, "role", 0)),
-            getattr(map_report, "latitude_i", 0),
-            getattr(map_report, "longitude_i", 0),
-            getattr(map_report, "altitude", 0),
-            getattr(map_report, "position_precision", 0),
-            getattr(map_report, "firmware_version", "") or None,
-            region,
-            modem_preset,
-            bool(getattr(map_report, "has_default_channel", False)),
-            int(getattr(map_report, "num_online_local_nodes", 0) or 0),
-            datetime.now(),
-        )
-
-        def db_op(cur, conn):
-            cur.execute(
-                """
-                INSERT INTO node_details (
-                    node_id, short_name, long_name, hardware_model, role,
-                    latitude, longitude, altitude, precision,
-                    firmware_version, region, modem_preset,
-                    has_default_channel, num_online_local, updated_at
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                ON CONFLICT (node_id) DO UPDATE SET
-                    short_name          = EXCLUDED.short_name,
-                    long_name           = EXCLUDED.long_name,
-                    hardware_model      = EXCLUDED.hardware_model,
-                    role                = EXCLUDED.role,
-                    latitude            = EXCLUDED.latitude,
-                    longitude           = EXCLUDED.longitude,
-                    altitude            = EXCLUDED.altitude,
-                    precision           = EXCLUDED.precision,
-                    firmware_version    = EXCLUDED.firmware_version,
-                    region              = EXCLUDED.region,
-                    modem_preset        = EXCLUDED.modem_preset,
-                    has_default_channel = EXCLUDED.has_default_channel,
-                    num_online_local    = EXCLUDED.num_online_local,
-                    updated_at          = EXCLUDED.updated_at
-                """,
-                row,
+            "role": ClientDetails.get_role_name_from_role(
+                getattr(map_report, "role", 0)
+            ),
+            "latitude": getattr(map_report, "latitude_i", 0),
+            "longitude": getattr(map_report, "longitude_i", 0),
+            "altitude": getattr(map_report, "altitude", 0),
+            "precision": getattr(map_report, "position_precision", 0),
+            "firmware_version": getattr(map_report, "firmware_version", "") or None,
+            "region": region,
+            "modem_preset": modem_preset,
+            "has_default_channel": bool(
+                getattr(map_report, "has_default_channel", False)
+            ),
+            "num_online_local": int(
+                getattr(map_report, "num_online_local_nodes", 0) or 0
+            ),
+        }
+        self.db_handler.update_node_details(client_details.node_id, columns, uow=uow)
+        if self.db_handler.node_cache is not None:
+            self.db_handler.node_cache.merge(
+                client_details.node_id,
+                short_name=columns["short_name"],
+                long_name=columns["long_name"],
+                hardware_model=columns["hardware_model"],
+                role=columns["role"],
             )
-            conn.commit()
-
-        self.db_handler.execute_db_operation(db_op)
 
 
 @ProcessorRegistry.register_processor(PortNum.ROUTING_APP)
 class RoutingAppProcessor(Processor):
-    def process(self, payload: bytes, client_details: ClientDetails):
+    def process(
+        self,
+        payload: bytes,
+        client_details: ClientDetails,
+        uow: Optional[UnitOfWork] = None,
+    ):
         _safe_parse(payload, Routing, "ROUTING_APP")
 
     @staticmethod
     def get_error_name_from_routing(error_code: int) -> str:
-        for name, value in Routing.Error.__dict__.items():
-            if isinstance(value, int) and value == error_code:
-                return name
-        return "UNKNOWN_ERROR"
+        return enums.routing_error_name(error_code)
 
 
 @ProcessorRegistry.register_processor(PortNum.TEXT_MESSAGE_COMPRESSED_APP)
 class TextMessageCompressedAppProcessor(Processor):
-    def process(self, payload: bytes, client_details: ClientDetails):
+    sheddable = True
+
+    def process(
+        self,
+        payload: bytes,
+        client_details: ClientDetails,
+        uow: Optional[UnitOfWork] = None,
+    ):
         try:
             unishox2.decompress(payload, len(payload))
         except Exception as e:
@@ -0,0 +1,385 @@
+"""Disk spool for hypertable rows the database can't take right now.
+
+When a :class:`~exporter.db_handler.BatchWriter` batch fails to COPY, or
+the writer is over ``max_pending``, the batch is appended to a
+:class:`Spool` instead of being dropped.  A :class:`SpoolReplayer`
+thread COPYs it back once the database answers again.  Rows keep the
+``time`` they were created with, so replayed data lands where it
+belongs in the hypertables.
+
+The spool is a directory of segment files ``<sequence>.seg``.  Each
+record is a little-endian ``(payload length as uint32, CRC-32 as uint32,
+spool time as float64, row count as uint32)`` header followed by a JSON
+``[table, columns, rows]`` payload.  Writes go to the newest segment.
+They are fsynced at most every ``sync_interval`` seconds, so a crash
+loses at most that much.  Once a segment passes ``segment_bytes``, or the
+replayer wants it, it is sealed and a new one is started.  Sealed
+segments are replayed oldest first, each in one transaction, and deleted
+once it commits.  A crash between that commit and the delete replays the
+segment again, so delivery is at-least-once.
+
+Once the spool holds ``max_bytes``, new batches are dropped and counted
+rather than filling the disk.
+"""
+
+import base64
+import json
+import logging
+import os
+import struct
+import threading
+import time
+import zlib
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+RECORD_HEADER = struct.Struct("<IIdI")
+SUFFIX = ".seg"
+REJECTED_SUFFIX = ".rejected"
+
+# (table, columns, rows), as handed to BatchWriter._copy.
+SpooledBatch = Tuple[str, Tuple[str, ...], List[tuple]]
+
+
+class _Segment:
+    __slots__ = ("path", "bytes", "rows", "first_at")
+
+    def __init__(self, path: str, size: int = 0, rows: int = 0, first_at=None):
+        self.path = path
+        self.bytes = size
+        self.rows = rows
+        self.first_at: Optional[float] = first_at
+
+
+class Spool:
+    def __init__(
+        self,
+        directory: str,
+        segment_bytes: int = 16 * 1024 * 1024,
+        max_bytes: int = 1024 * 1024 * 1024,
+        sync_interval: float = 1.0,
+    ):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.sync_interval = sync_interval
+        self._lock = threading.Lock()
+        self._sealed: List[_Segment] = []
+        self._active: Optional[_Segment] = None
+        self._file = None
+        self._synced_at = time.monotonic()
+        self._dirty = False
+        self._sequence = 0
+        self._appended = 0
+        self._dropped = 0
+        os.makedirs(directory, exist_ok=True)
+        self._recover()
+
+    def append(self, table: str, columns: Tuple[str, ...], rows: List[tuple]) -> bool:
+        """Spool one batch.  Returns False when the spool is full."""
+        payload = json.dumps(
+            [table, list(columns), rows], default=_encode, separators=(",", ":")
+        ).encode("utf-8")
+        now = time.time()
+        header = RECORD_HEADER.pack(len(payload), zlib.crc32(payload), now, len(rows))
+        size = len(header) + len(payload)
+        with self._lock:
+            if self.max_bytes and self._bytes() + size > self.max_bytes:
+                self._dropped += len(rows)
+                return False
+            if self._active is not None and (
+                self._active.bytes + size > self.segment_bytes
+            ):
+                self._seal()
+            if self._active is None:
+                self._open()
+            self._file.write(header)
+            self._file.write(payload)
+            segment = self._active
+            segment.bytes += size
+            segment.rows += len(rows)
+            if segment.first_at is None:
+                segment.first_at = now
+            self._appended += len(rows)
+            self._dirty = True
+            if time.monotonic() - self._synced_at >= self.sync_interval:
+                self._sync()
+        return True
+
+    def sync(self):
+        with self._lock:
+            self._sync()
+
+    def seal(self):
+        """Close the segment being written so the replayer can take it."""
+        with self._lock:
+            self._seal()
+
+    def sealed(self) -> List[str]:
+        with self._lock:
+            return [segment.path for segment in self._sealed]
+
+    def remove(self, path: str):
+        with self._lock:
+            self._sealed = [s for s in self._sealed if s.path != path]
+        os.remove(path)
+
+    def reject(self, path: str):
+        """Set aside a segment the database refuses, keeping it on disk
+        as ``<segment>.rejected`` for inspection."""
+        with self._lock:
+            self._sealed = [s for s in self._sealed if s.path != path]
+        os.replace(path, path + REJECTED_SUFFIX)
+
+    def empty(self) -> bool:
+        with self._lock:
+            return not self._sealed and (self._active is None or self._active.rows == 0)
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._sync()
+                self._file.close()
+                self._file = None
+            if self._active is not None:
+                if self._active.rows:
+                    self._sealed.append(self._active)
+                else:
+                    os.remove(self._active.path)
+                self._active = None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            segments = self._segments()
+            oldest = min(
+                (s.first_at for s in segments if s.first_at is not None), default=None
+            )
+            return {
+                "depth_rows": sum(s.rows for s in segments),
+                "bytes": self._bytes(),
+                "segments": len(segments),
+                "oldest_age_seconds": (
+                    round(time.time() - oldest, 1) if oldest is not None else 0
+                ),
+                "spooled_rows_total": self._appended,
+                "dropped_rows_total": self._dropped,
+            }
+
+    # ---------- internals ----------
+
+    def _segments(self) -> List[_Segment]:
+        if self._active is None:
+            return list(self._sealed)
+        return self._sealed + [self._active]
+
+    def _bytes(self) -> int:
+        return sum(s.bytes for s in self._segments())
+
+    def _recover(self):
+        """Pick up segments left by a previous run; all of them are sealed."""
+        names = sorted(n for n in os.listdir(self.directory) if n.endswith(SUFFIX))
+        for name in names:
+            path = os.path.join(self.directory, name)
+            self._sequence = max(self._sequence, int(name[: -len(SUFFIX)]))
+            rows, first_at = 0, None
+            for spooled_at, count, _ in _records(path, decode=False):
+                rows += count
+                if first_at is None:
+                    first_at = spooled_at
+            if rows == 0:
+                os.remove(path)
+                continue
+            self._sealed.append(_Segment(path, os.path.getsize(path), rows, first_at))
+        if self._sealed:
+            logger.info(
+                f"Spool {self.directory} holds "
+                f"{sum(s.rows for s in self._sealed)} rows from a previous run"
+            )
+
+    def _open(self):
+        self._sequence += 1
+        path = os.path.join(self.directory, f"{self._sequence:012d}{SUFFIX}")
+        self._active = _Segment(path)
+        self._file = open(self._active.path, "ab")
+
+    def _seal(self):
+        if self._active is None or self._active.rows == 0:
+            return
+        self._sync()
+        self._file.close()
+        self._file = None
+        self._sealed.append(self._active)
+        self._active = None
+
+    def _sync(self):
+        if self._file is not None and self._dirty:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._dirty = False
+        self._synced_at = time.monotonic()
+
+
+def read_segment(path: str) -> Iterator[SpooledBatch]:
+    """Yield the batches in a segment.  A record cut off by a crash, or
+    one whose checksum doesn't match, ends the iteration."""
+    for _, _, batch in _records(path, decode=True):
+        yield batch
+
+
+def _records(path: str, decode: bool):
+    with open(path, "rb") as f:
+        while True:
+            header = f.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                return
+            length, crc, spooled_at, rows = RECORD_HEADER.unpack(header)
+            payload = f.read(length)
+            if len(payload) < length or zlib.crc32(payload) != crc:
+                logger.warning(f"Spool segment {path} ends with a torn record")
+                return
+            batch = None
+            if decode:
+                table, columns, values = json.loads(payload, object_hook=_decode)
+                batch = (table, tuple(columns), [tuple(row) for row in values])
+            yield spooled_at, rows, batch
+
+
+def _encode(value: Any):
+    if isinstance(value, datetime):
+        return {"$datetime": value.isoformat()}
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return {"$bytes": base64.b64encode(bytes(value)).decode("ascii")}
+    raise TypeError(f"Can't spool {type(value).__name__}")
+
+
+def _decode(obj: Dict[str, Any]):
+    if "$datetime" in obj:
+        return datetime.fromisoformat(obj["$datetime"])
+    if "$bytes" in obj:
+        return base64.b64decode(obj["$bytes"])
+    return obj
+
+
+class SpoolReplayer:
+    """Drains a :class:`Spool` through ``replay``, a callable that writes
+    a segment's batches in one transaction (``BatchWriter.replay``).
+
+    While the database keeps failing the replayer backs off, doubling its
+    wait up to ``max_backoff``.  A segment that fails with an error
+    ``is_retryable`` rejects is set aside with :meth:`Spool.reject`, so
+    one bad row can't hold up the rest.  ``on_recovered`` is called after
+    each segment that replays successfully.
+    """
+
+    def __init__(
+        self,
+        spool: Spool,
+        replay: Callable[[List[SpooledBatch]], None],
+        interval: float = 5.0,
+        max_backoff: float = 60.0,
+        on_recovered: Optional[Callable[[], None]] = None,
+        is_retryable: Callable[[Exception], bool] = lambda error: True,
+    ):
+        self.spool = spool
+        self.replay = replay
+        self.interval = interval
+        self.max_backoff = max_backoff
+        self.on_recovered = on_recovered
+        self.is_retryable = is_retryable
+        self._wait = interval
+        self._lock = threading.Lock()
+        self._replayed = 0
+        self._segments = 0
+        self._failures = 0
+        self._rejected = 0
+        self._seconds = 0.0
+        self._last_rate = 0.0
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name="spool-replayer", daemon=True
+            )
+            self._thread.start()
+
+    def wake(self):
+        self._wake.set()
+
+    def close(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def drain(self) -> bool:
+        """Replay every segment now.  Returns False if one failed."""
+        self.spool.seal()
+        for path in self.spool.sealed():
+            if self._stop.is_set():
+                return True
+            if not self._replay_segment(path):
+                return False
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "replayed_rows_total": self._replayed,
+                "replayed_segments_total": self._segments,
+                "replay_failures_total": self._failures,
+                "rejected_segments_total": self._rejected,
+                "replay_seconds_total": round(self._seconds, 3),
+                "last_rows_per_second": round(self._last_rate, 1),
+            }
+
+    # ---------- internals ----------
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self._wait)
+            self._wake.clear()
+            if self._stop.is_set():
+                return
+            self.spool.sync()
+            if self.spool.empty():
+                self._wait = self.interval
+                continue
+            if self.drain():
+                self._wait = self.interval
+            else:
+                self._wait = min(self._wait * 2, self.max_backoff)
+
+    def _replay_segment(self, path: str) -> bool:
+        start = time.perf_counter()
+        try:
+            batches = list(read_segment(path))
+            self.replay(batches)
+        except Exception as e:
+            if not self.is_retryable(e):
+                logger.error(f"Setting aside spool segment {path}: {e}")
+                self.spool.reject(path)
+                with self._lock:
+                    self._rejected += 1
+                return True
+            with self._lock:
+                self._failures += 1
+            logger.warning(f"Failed to replay spool segment {path}: {e}")
+            return False
+        elapsed = time.perf_counter() - start
+        rows = sum(len(batch[2]) for batch in batches)
+        self.spool.remove(path)
+        with self._lock:
+            self._replayed += rows
+            self._segments += 1
+            self._seconds += elapsed
+            self._last_rate = rows / elapsed if elapsed > 0 else 0.0
+        logger.info(f"Replayed {rows} spooled rows in {elapsed:.2f}s")
+        if self.on_recovered is not None:
+            self.on_recovered()
+        return True
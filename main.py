@@ -1,5 +1,7 @@
 import logging
 import os
+import signal
+import time
 from logging.handlers import RotatingFileHandler
 
 import humanfriendly
@@ -11,13 +13,46 @@ from constants import callback_api_version_map, protocol_map
 try:
     from meshtastic.mesh_pb2 import MeshPacket
     from meshtastic.mqtt_pb2 import ServiceEnvelope
+    from meshtastic.portnums_pb2 import PortNum
 except ImportError:
     from meshtastic.protobuf.mesh_pb2 import MeshPacket
     from meshtastic.protobuf.mqtt_pb2 import ServiceEnvelope
+    from meshtastic.protobuf.portnums_pb2 import PortNum
 
 from psycopg_pool import ConnectionPool
 
+from exporter.admission import AdmissionController
+from exporter.capture import CaptureWriter
+from exporter.db_handler import BatchWriter
+from exporter.decode import ProcessDecoder, parse_envelope
+from exporter.dedup import PacketDeduplicator
+from exporter.freshness import Arrival, LagTracker, topic_root
+from exporter.ingest import BatchStage, IngestPipeline, Stage
+from exporter.metric import instruments
+from exporter.metric.prometheus import MetricsServer
+from exporter.metric.reporter import StatsReporter
+from exporter.node_cache import NodeCache
+from exporter.node_state import NodeStateWriter
+from exporter.processor.processor_base import MessageProcessor
+from exporter.processor.processors import ProcessorRegistry
+from exporter.spool import Spool, SpoolReplayer
+
 connection_pool = None
+processor = None
+pipeline = None
+deduplicator = None
+decoder = None
+writer = None
+reporter = None
+capture = None
+metrics_server = None
+lag_tracker = None
+admission = None
+node_state = None
+node_latest = None
+spool = None
+spool_replayer = None
+db_dedup = False
 
 
 def handle_connect(client, userdata, flags, reason_code, properties):
@@ -31,31 +66,50 @@ def handle_connect(client, userdata, flags, reason_code, properties):
 
 
 def update_node_status(node_number, status):
-    with connection_pool.connection() as conn:
-        with conn.cursor() as cur:
-            cur.execute(
-                "INSERT INTO node_details (node_id, mqtt_status, short_name, long_name) VALUES (%s, %s, %s, %s)"
-                "ON CONFLICT(node_id)"
-                "DO UPDATE SET mqtt_status = %s",
-                (node_number, status, "Unknown (MQTT)", "Unknown (MQTT)", status),
-            )
-            conn.commit()
+    processor.db_handler.update_node_details(
+        node_number,
+        {"mqtt_status": status},
+        {"short_name": "Unknown (MQTT)", "long_name": "Unknown (MQTT)"},
+        touch=False,
+    )
+
+
+def classify_topic(topic: str) -> str:
+    if "/json/" in topic:
+        return "json"
+    if "/stat/" in topic or "/tele/" in topic:
+        return "stat"
+    return "protobuf"
 
 
 def handle_message(client, userdata, message):
-    logging.debug(f"Received message on topic '{message.topic}'")
-    if "/json/" in message.topic:
+    # Runs on paho's network thread: hand the raw bytes to the ingest
+    # pipeline and return so the socket keeps being serviced.
+    start = time.perf_counter()
+    received_at = time.time()
+    if capture is not None:
+        capture.write(received_at, message.topic, message.payload)
+    pipeline.submit((message.topic, message.payload, received_at))
+    instruments.MQTT_CALLBACK.observe(time.perf_counter() - start)
+
+
+def parse_message(item):
+    topic, payload, received_at = item
+    logging.debug(f"Received message on topic '{topic}'")
+    kind = classify_topic(topic)
+    instruments.TOPIC_TYPES[kind].inc()
+    if kind == "json":
         try:
-            processor.process_json_mqtt(message)
+            processor.process_json_mqtt(payload)
         except Exception as e:
             logging.error(f"Failed to handle JSON message: {e}")
         # Ignore JSON messages as there are also protobuf messages sent on other topic
         # Source: https://github.com/meshtastic/firmware/blob/master/src/mqtt/MQTT.cpp#L448
-        return
+        return None
 
-    if "/stat/" in message.topic or "/tele/" in message.topic:
+    if kind == "stat":
         try:
-            user_id = message.topic.split("/")[-1]  # Hexadecimal user ID
+            user_id = topic.split("/")[-1]  # Hexadecimal user ID
             if user_id and user_id[0] == "!":
                 # MQTT topics from misbehaving clients sometimes contain NULs;
                 # strip non-hex characters before converting.
@@ -63,42 +117,321 @@ def handle_message(client, userdata, message):
                     c for c in user_id[1:] if c in "0123456789abcdefABCDEF"
                 )
                 if not hex_part:
-                    return
-                node_number = str(int(hex_part, 16))
-                update_node_status(
-                    node_number, message.payload.decode("utf-8", errors="replace")
-                )
-            return
+                    return None
+                node_number = int(hex_part, 16)
+                return ("stat", node_number, payload.decode("utf-8", errors="replace"))
         except Exception as e:
-            logging.debug(
-                f"Failed to handle user MQTT stat for topic {message.topic}: {e}"
-            )
-            return
+            logging.debug(f"Failed to handle user MQTT stat for topic {topic}: {e}")
+        return None
+
+    start = time.perf_counter()
+    envelope = parse_envelope(payload)
+    parsed = time.perf_counter()
+    instruments.PARSE.observe(parsed - start)
+    if envelope is None:
+        instruments.MALFORMED.inc()
+        return None
+    packet: MeshPacket = envelope.packet
+    arrival = Arrival(topic_root(topic), envelope.gateway_id, received_at)
+    # Every gateway's copy counts towards its own receive lag, including
+    # the ones dedup is about to drop.
+    lag_tracker.received(arrival, packet.rx_time)
+    # Other gateways rebroadcast the same packet; drop repeats before any
+    # AES or database work.
+    duplicate = deduplicator.is_duplicate(getattr(packet, "from"), packet.id)
+    instruments.DEDUP.observe(time.perf_counter() - parsed)
+    if duplicate:
+        instruments.DUPLICATE.inc()
+        logging.debug(f"Packet {packet.id} already processed")
+        return None
+    return ("packet", topic, envelope, packet, arrival)
+
+
+def decrypt_message(item):
+    if item[0] != "packet":
+        return item
+    packet: MeshPacket = item[3]
+    start = time.perf_counter()
+    decrypted = processor.decrypt(packet)
+    instruments.DECRYPT.observe(time.perf_counter() - start)
+    if not decrypted:
+        instruments.UNDECRYPTABLE.inc()
+        return None
+    return item
+
+
+def decode_messages(batch):
+    # Process-pool counterpart of parse_message + decrypt_message: the
+    # workers parse and decrypt, the parent only dedups and rebuilds the
+    # envelope for the process stage.
+    results = []
+    raw = []
+    for item in batch:
+        if classify_topic(item[0]) == "protobuf":
+            instruments.TOPIC_TYPES["protobuf"].inc()
+            raw.append(item)
+        else:
+            results.append(parse_message(item))
+    if not raw:
+        return results
+    start = time.perf_counter()
+    records = decoder.decode(raw)
+    instruments.DECODE.observe(time.perf_counter() - start)
+    for topic, sender, packet_id, received_at, envelope_bytes in records:
+        start = time.perf_counter()
+        duplicate = deduplicator.is_duplicate(sender, packet_id)
+        instruments.DEDUP.observe(time.perf_counter() - start)
+        if duplicate:
+            instruments.DUPLICATE.inc()
+            logging.debug(f"Packet {packet_id} already processed")
+            continue
+        envelope = ServiceEnvelope.FromString(envelope_bytes)
+        # Only packets that survive dedup are parsed here, so in this mode
+        # the receive lag covers the first gateway of each packet.
+        arrival = Arrival(topic_root(topic), envelope.gateway_id, received_at)
+        lag_tracker.received(arrival, envelope.packet.rx_time)
+        results.append(("packet", topic, envelope, envelope.packet, arrival))
+    return results
 
-    envelope = ServiceEnvelope()
+
+def process_message(item):
+    if item[0] == "stat":
+        _, node_number, status = item
+        try:
+            update_node_status(node_number, status)
+        except Exception as e:
+            instruments.DB_NODE_STATUS_ERRORS.inc()
+            logging.debug(f"Failed to update MQTT status of node {node_number}: {e}")
+        return None
+
+    _, topic, envelope, packet, arrival = item
     try:
-        envelope.ParseFromString(message.payload)
-        packet: MeshPacket = envelope.packet
-
-        with connection_pool.connection() as conn:
-            with conn.cursor() as cur:
-                cur.execute("SELECT id FROM messages WHERE id = %s", (str(packet.id),))
-                if cur.fetchone() is not None:
-                    logging.debug(f"Packet {packet.id} already processed")
-                    return
-
-                cur.execute(
-                    "INSERT INTO messages (id, received_at) VALUES (%s, NOW()) ON CONFLICT (id) DO NOTHING",
-                    (str(packet.id),),
-                )
-                conn.commit()
-        processor.process_mqtt(message.topic, envelope, packet)
-        processor.process(packet)
+        if db_dedup and not processor.db_handler.claim_message(
+            getattr(packet, "from"), packet.id
+        ):
+            instruments.DUPLICATE.inc()
+            logging.debug(f"Packet {packet.id} already processed by another exporter")
+            return None
+        processor.process_mqtt(topic, envelope, packet)
+        processor.process(packet, arrival)
     except Exception as e:
-        # Public MQTT carries a constant trickle of malformed / partially-
-        # encrypted packets; logging each one at ERROR floods the log.
         logging.debug(f"Failed to handle message: {e}")
-        return
+    return None
+
+
+def ingest_load() -> float:
+    """How full the ingest queues or the batch writer are, whichever is
+    fuller, as a 0..1 fraction."""
+    load = pipeline.fill()
+    if writer is not None:
+        load = max(load, writer.fill())
+    return load
+
+
+def build_pipeline() -> "IngestPipeline":
+    queue_size = int(os.getenv("INGEST_QUEUE_SIZE", 10000))
+    if decoder is not None:
+        # Two feeder threads per worker process so a batch is always
+        # waiting while the previous one's results are handed on.
+        front = [
+            BatchStage(
+                "decode",
+                decode_messages,
+                batch_size=int(os.getenv("INGEST_DECODE_BATCH_SIZE", 64)),
+                workers=2 * decoder.processes,
+                maxsize=queue_size,
+            )
+        ]
+    else:
+        front = [
+            Stage(
+                "parse",
+                parse_message,
+                workers=int(os.getenv("INGEST_PARSE_WORKERS", 1)),
+                maxsize=queue_size,
+            ),
+            Stage(
+                "decrypt",
+                decrypt_message,
+                workers=int(os.getenv("INGEST_DECRYPT_WORKERS", 1)),
+                maxsize=queue_size,
+            ),
+        ]
+    return IngestPipeline(
+        front
+        + [
+            Stage(
+                "process",
+                process_message,
+                workers=int(os.getenv("INGEST_WORKERS", 4)),
+                maxsize=queue_size,
+            )
+        ]
+    )
+
+
+def start_ingest(pool: ConnectionPool, track_lag: bool = True):
+    """Build the processor, dedup, ingest pipeline and stats reporter on
+    ``pool`` and start them.  Shared by the MQTT entry point below and
+    scripts/replay_capture.py so replayed traffic takes the same path.
+    ``track_lag=False`` keeps replayed traffic out of ``ingest_lag``."""
+    global connection_pool, processor, pipeline, deduplicator, decoder
+    global writer, reporter, metrics_server, lag_tracker, admission, db_dedup
+    global spool, spool_replayer, node_state, node_latest
+    connection_pool = pool
+    lag_tracker = LagTracker(
+        interval=float(os.getenv("INGEST_LAG_INTERVAL", 60)),
+        max_samples=int(os.getenv("INGEST_LAG_MAX_SAMPLES", 2000)),
+        enabled=track_lag,
+    )
+    batch_size = int(os.getenv("DB_BATCH_SIZE", 500))
+    writer = None
+    spool = spool_replayer = None
+    if batch_size > 0:
+        spool_dir = os.getenv("SPOOL_DIR")
+        if spool_dir:
+            spool = Spool(
+                spool_dir,
+                segment_bytes=humanfriendly.parse_size(
+                    os.getenv("SPOOL_SEGMENT_SIZE", "16MB")
+                ),
+                max_bytes=humanfriendly.parse_size(os.getenv("SPOOL_MAX_SIZE", "1GB")),
+                sync_interval=float(os.getenv("SPOOL_SYNC_INTERVAL", 1.0)),
+            )
+        writer = BatchWriter(
+            pool,
+            batch_size=batch_size,
+            max_delay=float(os.getenv("DB_BATCH_MAX_DELAY", 2.0)),
+            max_pending=int(os.getenv("DB_BATCH_MAX_PENDING", 50000)),
+            lag_tracker=lag_tracker,
+            spool=spool,
+        )
+        writer.start()
+        if spool is not None:
+            spool_replayer = SpoolReplayer(
+                spool,
+                writer.replay,
+                interval=float(os.getenv("SPOOL_REPLAY_INTERVAL", 5.0)),
+                on_recovered=writer.mark_healthy,
+                is_retryable=writer.is_unavailable,
+            )
+            spool_replayer.start()
+    node_cache = NodeCache(
+        ttl=float(os.getenv("NODE_CACHE_TTL_SECONDS", 3600)),
+        max_entries=int(os.getenv("NODE_CACHE_MAX_ENTRIES", 50000)),
+    )
+    node_state = None
+    node_state_interval = float(os.getenv("NODE_STATE_FLUSH_INTERVAL", 5.0))
+    if node_state_interval > 0:
+        node_state = NodeStateWriter(
+            pool,
+            interval=node_state_interval,
+            touch_interval=float(os.getenv("NODE_STATE_TOUCH_INTERVAL", 300)),
+            ttl=node_cache.ttl,
+        )
+        node_state.start()
+    # node_latest is only ever written through this writer; with a zero
+    # interval it writes each reading immediately.
+    node_latest = NodeStateWriter(
+        pool, interval=node_state_interval, ttl=node_cache.ttl, table="node_latest"
+    )
+    node_latest.start()
+    admission = AdmissionController(
+        ingest_load,
+        ProcessorRegistry.sheddable_ports(),
+        shed_at=float(os.getenv("INGEST_SHED_AT", 0.5)),
+        shed_packet_rows_at=float(os.getenv("INGEST_SHED_PACKET_ROWS_AT", 0.8)),
+        recover_ratio=float(os.getenv("INGEST_SHED_RECOVER_RATIO", 0.5)),
+    )
+    processor = MessageProcessor(
+        pool,
+        writer,
+        node_cache,
+        lag_tracker=lag_tracker,
+        admission=admission,
+        node_state=node_state,
+        node_latest=node_latest,
+    )
+    lag_tracker.sink = processor.db_handler.store_ingest_lag
+    lag_tracker.start()
+    try:
+        logging.info(f"Warmed node cache with {processor.warm_node_cache()} nodes")
+    except Exception as e:
+        logging.warning(f"Failed to warm node cache: {e}")
+    try:
+        logging.info(f"Wrote {processor.sync_port_names()} port names")
+    except Exception as e:
+        logging.warning(f"Failed to write port names: {e}")
+    deduplicator = PacketDeduplicator(
+        ttl=float(os.getenv("DEDUP_TTL_SECONDS", 300)),
+        max_entries=int(os.getenv("DEDUP_MAX_ENTRIES", 200000)),
+    )
+    db_dedup = os.getenv("DEDUP_DB_FALLBACK", "false").lower() == "true"
+    decoder = None
+    decode_processes = int(os.getenv("INGEST_DECODE_PROCESSES", 0))
+    if decode_processes > 0:
+        decoder = ProcessDecoder(processor.keyring, decode_processes)
+    pipeline = build_pipeline()
+    pipeline.start()
+    reporter = StatsReporter(float(os.getenv("INGEST_STATS_INTERVAL", 60)))
+    reporter.register("ingest", pipeline.stats)
+    reporter.register("dedup", deduplicator.stats)
+    reporter.register("node_cache", node_cache.stats)
+    reporter.register("unit_of_work", processor.unit_of_work_stats)
+    reporter.register("keyring", processor.keyring.stats)
+    reporter.register("ingest_lag", lag_tracker.stats)
+    reporter.register("admission", admission.stats)
+    reporter.register(
+        "neighbor_info",
+        processor.processor_registry.processor_for(PortNum.NEIGHBORINFO_APP).stats,
+    )
+    if writer is not None:
+        reporter.register("db_writer", writer.stats)
+    if node_state is not None:
+        reporter.register("node_state", node_state.stats)
+    reporter.register("node_latest", node_latest.stats)
+    if spool is not None:
+        reporter.register("spool", lambda: {**spool.stats(), **spool_replayer.stats()})
+    reporter.start()
+    metrics_port = int(os.getenv("METRICS_PORT", 9464))
+    metrics_server = None
+    if metrics_port > 0:
+        try:
+            metrics_server = MetricsServer(
+                lambda: instruments.REGISTRY.render(reporter.snapshot()), metrics_port
+            )
+        except OSError as e:
+            logging.warning(f"Failed to serve metrics on port {metrics_port}: {e}")
+        else:
+            metrics_server.start()
+            logging.info(f"Serving exporter metrics on :{metrics_port}/metrics")
+
+
+def stop_ingest():
+    """Drain everything :func:`start_ingest` started; every accepted
+    message is written before this returns."""
+    logging.info("Draining ingest pipeline")
+    pipeline.close()
+    if decoder is not None:
+        decoder.close()
+    if writer is not None:
+        # Commit what is buffered first so the last packets' commit lag
+        # is in the final lag rows.
+        writer.flush()
+    lag_tracker.close()
+    if node_state is not None:
+        node_state.close()
+    if node_latest is not None:
+        node_latest.close()
+    if writer is not None:
+        writer.close()
+    if spool is not None:
+        # Whatever is still spooled stays on disk for the next start.
+        spool_replayer.close()
+        spool.close()
+    reporter.stop()
+    if metrics_server is not None:
+        metrics_server.close()
 
 
 if __name__ == "__main__":
@@ -126,15 +459,10 @@ if __name__ == "__main__":
         format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
     )
 
-    # We have to load_dotenv before we can import MessageProcessor to allow filtering of message types
-    from exporter.processor.processor_base import MessageProcessor
-
     # Setup a connection pool
     connection_pool = ConnectionPool(os.getenv("DATABASE_URL"), max_size=100)
     # Node configuration is now handled by the database timestamps
 
-    # No need for Prometheus exporter anymore
-
     # Create an MQTT client
     mqtt_protocol = os.getenv("MQTT_PROTOCOL", "MQTTv5")
     mqtt_callback_api_version = os.getenv("MQTT_CALLBACK_API_VERSION", "VERSION2")
@@ -144,6 +472,21 @@ if __name__ == "__main__":
         ),
         protocol=protocol_map.get(mqtt_protocol, mqtt.MQTTv5),
     )
+    # Configure the Processor and the ingest pipeline before any message
+    # can arrive.
+    start_ingest(connection_pool)
+    capture_file = os.getenv("CAPTURE_FILE")
+    if capture_file:
+        capture = CaptureWriter(
+            capture_file,
+            max_bytes=humanfriendly.parse_size(
+                os.getenv("CAPTURE_FILE_MAX_SIZE", "100MB")
+            ),
+            backup_count=int(os.getenv("CAPTURE_FILE_BACKUP_COUNT", 5)),
+        )
+        reporter.register("capture", capture.stats)
+        logging.info(f"Capturing raw MQTT traffic to {capture_file}")
+
     mqtt_client.on_connect = handle_connect
     mqtt_client.on_message = handle_message
 
@@ -166,7 +509,15 @@ if __name__ == "__main__":
         logging.error(f"Failed to connect to MQTT broker: {e}")
         exit(1)
 
-    # Configure the Processor
-    processor = MessageProcessor(connection_pool)
-
-    mqtt_client.loop_forever()
+    # `docker stop` sends SIGTERM; disconnecting makes loop_forever()
+    # return so the pipeline can drain before we exit.
+    signal.signal(signal.SIGTERM, lambda *_: mqtt_client.disconnect())
+    try:
+        mqtt_client.loop_forever()
+    except KeyboardInterrupt:
+        mqtt_client.disconnect()
+    finally:
+        if capture is not None:
+            capture.close()
+        stop_ingest()
+        connection_pool.close()
@@ -55,6 +55,36 @@ def target(sql: str, refId: str = "A", fmt: str = "table") -> dict[str, Any]:
     }
 
 
+# Telemetry storage tiers, finest first: (table suffix, bucket width in ms,
+# retention in days).  Must match the continuous aggregates and retention
+# policies in docker/timescaledb/init.sql.
+TIERS = [("", 0, 30), ("_1h", 3_600_000, 180), ("_1d", 86_400_000, 1825)]
+
+
+def tiered(sql: str, table: str) -> str:
+    """Run a time-series query against the telemetry tier that suits the
+    panel. `sql` reads `{table}` and ANDs `{tier}` into its WHERE clause.
+
+    A tier is used when Grafana's `$__interval` is finer than the next
+    tier's buckets and the range starts inside the tier's retention. The
+    coarsest tier is the fallback. Every tier goes into one UNION ALL, and
+    the branch conditions are constants, so PostgreSQL only scans the
+    chosen tier.
+    """
+    fits = [
+        f"$__interval_ms < {TIERS[i + 1][1]} "
+        f"AND $__timeFrom() >= NOW() - INTERVAL '{days} days'"
+        for i, (_, _, days) in enumerate(TIERS[:-1])
+    ]
+    branches = []
+    for i, (suffix, _, _) in enumerate(TIERS):
+        conds = [f"NOT ({c})" for c in fits[:i]]
+        if i < len(fits):
+            conds.append(f"({fits[i]})")
+        branches.append(sql.format(table=table + suffix, tier=" AND ".join(conds)))
+    return "SELECT * FROM (" + " UNION ALL ".join(branches) + ") tiers ORDER BY 1"
+
+
 def _drill_override(field: str, dashboard_uid: str, var_name: str) -> dict:
     url = (
         f"/d/{dashboard_uid}?var-{var_name}="
@@ -380,6 +410,19 @@ T_NAMING = [
     {"color": "green", "value": 70},
 ]
 
+# portnum is a SMALLINT; group on the number and look the name up only for
+# the result rows.  The name is the only label column, so Grafana doesn't
+# plot the number as a series of its own.
+PORTNUM_TS_SQL = (
+    "SELECT t.time, COALESCE(p.name, t.portnum::text) AS metric, t.value "
+    "FROM (SELECT $__timeGroupAlias(bucket, $__interval), portnum, "
+    "             SUM(packets)::float AS value "
+    "      FROM mesh_packet_1m WHERE $__timeFilter(bucket) "
+    "      GROUP BY 1, portnum) t "
+    "LEFT JOIN port_names p ON p.portnum = t.portnum "
+    "ORDER BY 1"
+)
+
 
 def _overview_health_tiles() -> list:
     drill_traffic = f"/d/{DASH_UIDS['investigation']}?${{__url_time_range}}"
@@ -389,7 +432,7 @@ def _overview_health_tiles() -> list:
             2,
             "Active nodes (30m)",
             "SELECT COUNT(DISTINCT source_id) AS value "
-            "FROM mesh_packet_metrics WHERE time > NOW() - INTERVAL '30 minutes'",
+            "FROM mesh_packet_1m WHERE bucket > NOW() - INTERVAL '30 minutes'",
             grid(0, 1, 4, 4),
             {
                 "description": "Distinct nodes that sent any packet in the last 30 minutes.",
@@ -402,7 +445,7 @@ def _overview_health_tiles() -> list:
             3,
             "Total nodes seen",
             "SELECT COUNT(*) AS value FROM node_details "
-            "WHERE node_id NOT IN ('4294967295','1','0')",
+            "WHERE node_id NOT IN (4294967295,1,0)",
             grid(4, 1, 4, 4),
             {
                 "description": "All nodes ever observed (excluding broadcast).",
@@ -415,8 +458,8 @@ def _overview_health_tiles() -> list:
         stat_panel(
             4,
             "Packets / min (5m avg)",
-            "SELECT (COUNT(*)::float / 5.0) AS value "
-            "FROM mesh_packet_metrics WHERE time > NOW() - INTERVAL '5 minutes'",
+            "SELECT (COALESCE(SUM(packets), 0)::float / 5.0) AS value "
+            "FROM mesh_packet_1m WHERE bucket > NOW() - INTERVAL '5 minutes'",
             grid(8, 1, 4, 4),
             {
                 "description": "Packets/min over the last 5 minutes (RED-method 'Rate').",
@@ -428,12 +471,16 @@ def _overview_health_tiles() -> list:
         stat_panel(
             5,
             "Median ChUtil (1h)",
-            "SELECT PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY channel_utilization)::float AS value "
-            "FROM device_metrics "
-            "WHERE time > NOW() - INTERVAL '1 hour' AND channel_utilization > 0",
+            "SELECT PERCENTILE_CONT(0.5) WITHIN GROUP ("
+            "  ORDER BY channel_utilization_sum / channel_utilization_samples)::float AS value "
+            "FROM device_metrics_5m "
+            "WHERE bucket > NOW() - INTERVAL '1 hour' AND channel_utilization_sum > 0",
             grid(12, 1, 4, 4),
             {
-                "description": "Median channel utilization over the last hour. >25% = congested.",
+                "description": (
+                    "Median of each node's 5-minute average channel utilization over the last hour. "
+                    ">25% = congested."
+                ),
                 "unit": "percent",
                 "thresholds": T_CHUTIL,
             },
@@ -441,15 +488,14 @@ def _overview_health_tiles() -> list:
         stat_panel(
             6,
             "Median SNR (1h)",
-            "SELECT PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY rx_snr)::float AS value "
-            "FROM mesh_packet_metrics "
-            "WHERE time > NOW() - INTERVAL '1 hour' "
-            "  AND rx_snr IS NOT NULL AND rx_snr <> 0 "
-            "  AND destination_id NOT IN ('4294967295','1','0')",
+            "SELECT PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY snr_sum / snr_samples)::float AS value "
+            "FROM mesh_packet_1m "
+            "WHERE bucket > NOW() - INTERVAL '1 hour' AND NOT broadcast AND snr_samples > 0",
             grid(16, 1, 4, 4),
             {
                 "description": (
-                    "Median unicast SNR over the last hour. Excludes rx_snr=0 (firmware default / not measured). "
+                    "Median of per-sender 1-minute average unicast SNR over the last hour. "
+                    "Excludes rx_snr=0 (firmware default / not measured). "
                     "<-7 dB marginal, <-13 dB poor."
                 ),
                 "unit": "none",
@@ -461,7 +507,7 @@ def _overview_health_tiles() -> list:
             "Named nodes",
             "SELECT (100.0 * COUNT(*) FILTER (WHERE long_name IS NOT NULL "
             "  AND long_name <> 'Unknown')) / NULLIF(COUNT(*), 0) AS value "
-            "FROM node_details WHERE node_id NOT IN ('4294967295','1','0')",
+            "FROM node_details WHERE node_id NOT IN (4294967295,1,0)",
             grid(20, 1, 4, 4),
             {
                 "description": "Percent of nodes with a known long_name. Low = missing NodeInfo packets.",
@@ -473,32 +519,67 @@ def _overview_health_tiles() -> list:
 
 
 def _overview_activity_panels() -> list:
+    # Percentiles of different gateways can't be merged exactly; weighting
+    # each gateway's by its sample count is close enough for a trend line.
+    lag_sql = (
+        "SELECT $__timeGroupAlias(time, $__interval), "
+        "       SUM(p50_seconds * samples) FILTER (WHERE stage = 'gateway') "
+        "         / NULLIF(SUM(samples) FILTER (WHERE stage = 'gateway'), 0) "
+        '         AS "gateway → exporter p50", '
+        "       SUM(p95_seconds * samples) FILTER (WHERE stage = 'gateway') "
+        "         / NULLIF(SUM(samples) FILTER (WHERE stage = 'gateway'), 0) "
+        '         AS "gateway → exporter p95", '
+        "       SUM(p50_seconds * samples) FILTER (WHERE stage = 'commit') "
+        "         / NULLIF(SUM(samples) FILTER (WHERE stage = 'commit'), 0) "
+        '         AS "exporter → commit p50", '
+        "       SUM(p95_seconds * samples) FILTER (WHERE stage = 'commit') "
+        "         / NULLIF(SUM(samples) FILTER (WHERE stage = 'commit'), 0) "
+        '         AS "exporter → commit p95" '
+        "FROM ingest_lag WHERE $__timeFilter(time) "
+        "GROUP BY 1 ORDER BY 1"
+    )
     return [
         timeseries_panel(
             9,
             "Packets per minute",
-            "SELECT $__timeGroupAlias(time, $__interval), "
-            "       portnum AS metric, COUNT(*)::float AS value "
-            "FROM mesh_packet_metrics WHERE $__timeFilter(time) "
-            "GROUP BY 1, portnum ORDER BY 1",
-            grid(0, 6, 12, 7),
+            PORTNUM_TS_SQL,
+            grid(0, 6, 8, 7),
             {"description": "Mesh-wide packet rate broken out by portnum."},
         ),
+        timeseries_panel(
+            33,
+            "Ingest lag",
+            lag_sql,
+            grid(8, 6, 8, 7),
+            {
+                "description": (
+                    "How far behind the radio the data is. gateway → exporter runs from the "
+                    "gateway's rx_time to the MQTT message reaching the exporter (gateway clock, "
+                    "1 s resolution); exporter → commit runs until the packet's row is committed. "
+                    "Few packets with low lag = quiet mesh; rising lag = exporter or broker behind."
+                ),
+                "unit": "s",
+            },
+        ),
         piechart_panel(
             10,
             "Packet types",
-            "SELECT NOW() AS time, portnum AS metric, COUNT(*)::float AS value "
-            "FROM mesh_packet_metrics WHERE $__timeFilter(time) "
-            "GROUP BY portnum ORDER BY value DESC",
-            grid(12, 6, 6, 7),
+            "SELECT NOW() AS time, COALESCE(p.name, t.portnum::text) AS metric, "
+            "       t.value "
+            "FROM (SELECT portnum, SUM(packets)::float AS value "
+            "      FROM mesh_packet_1m WHERE $__timeFilter(bucket) "
+            "      GROUP BY portnum) t "
+            "LEFT JOIN port_names p ON p.portnum = t.portnum "
+            "ORDER BY value DESC",
+            grid(16, 6, 4, 7),
             {"description": "Distribution of packet types over the selected range."},
         ),
         stat_panel(
             30,
             "Data volume (range)",
-            "SELECT COALESCE(SUM(message_size_bytes),0)::float AS value "
-            "FROM mesh_packet_metrics WHERE $__timeFilter(time)",
-            grid(18, 6, 6, 4),
+            "SELECT COALESCE(SUM(bytes),0)::float AS value "
+            "FROM mesh_packet_1m WHERE $__timeFilter(bucket)",
+            grid(20, 6, 4, 4),
             {
                 "description": "Total bytes carried by mesh packets in the selected range (envelope size).",
                 "unit": "bytes",
@@ -509,9 +590,9 @@ def _overview_activity_panels() -> list:
         stat_panel(
             31,
             "Max hop_start",
-            "SELECT MAX(hop_start)::float AS value FROM mesh_packet_metrics "
-            "WHERE $__timeFilter(time) AND hop_start > 0",
-            grid(18, 10, 6, 3),
+            "SELECT MAX(max_hop_start)::float AS value FROM mesh_packet_1m "
+            "WHERE $__timeFilter(bucket)",
+            grid(20, 10, 4, 3),
             {
                 "description": "Highest hop_start TTL observed in the range. Higher means nodes set deeper relays.",
                 "thresholds": [
@@ -530,17 +611,19 @@ def _overview_quality_panels() -> list:
     # series in the legend to open Node Detail.
     top_util_sql = (
         "WITH top_nodes AS ("
-        "  SELECT node_id, AVG(channel_utilization) AS util "
-        "  FROM device_metrics "
-        "  WHERE $__timeFilter(time) AND channel_utilization > 0 "
+        "  SELECT node_id, "
+        "         SUM(channel_utilization_sum) / NULLIF(SUM(channel_utilization_samples), 0) AS util "
+        "  FROM device_metrics_5m "
+        "  WHERE $__timeFilter(bucket) AND channel_utilization_sum > 0 "
         "  GROUP BY node_id ORDER BY util DESC LIMIT 10"
         ") "
-        "SELECT $__timeGroupAlias(dm.time, $__interval), "
+        "SELECT $__timeGroupAlias(dm.bucket, $__interval), "
         "       dm.node_id AS metric, "
-        "       AVG(dm.channel_utilization) AS value "
-        "FROM device_metrics dm "
+        "       SUM(dm.channel_utilization_sum) "
+        "         / NULLIF(SUM(dm.channel_utilization_samples), 0) AS value "
+        "FROM device_metrics_5m dm "
         "JOIN top_nodes tn ON tn.node_id = dm.node_id "
-        "WHERE $__timeFilter(dm.time) GROUP BY 1, 2 ORDER BY 1"
+        "WHERE $__timeFilter(dm.bucket) GROUP BY 1, 2 ORDER BY 1"
     )
     panel = timeseries_panel(
         12,
@@ -560,10 +643,12 @@ def _overview_quality_panels() -> list:
         }
     ]
     avg_chutil_sql = (
-        "SELECT $__timeGroupAlias(time, $__interval), "
-        '       AVG(channel_utilization) AS "ChUtil", '
-        '       AVG(air_util_tx)         AS "AirUtilTX" '
-        "FROM device_metrics WHERE $__timeFilter(time) "
+        "SELECT $__timeGroupAlias(bucket, $__interval), "
+        "       SUM(channel_utilization_sum) / NULLIF(SUM(channel_utilization_samples), 0) "
+        '         AS "ChUtil", '
+        "       SUM(air_util_tx_sum) / NULLIF(SUM(air_util_tx_samples), 0) "
+        '         AS "AirUtilTX" '
+        "FROM device_metrics_5m WHERE $__timeFilter(bucket) "
         "GROUP BY 1 ORDER BY 1"
     )
     return [
@@ -584,12 +669,12 @@ def _overview_quality_panels() -> list:
 def _overview_directory() -> list:
     sql = (
         "SELECT m.source_id AS node_id, "
-        "       COALESCE(nd.long_name, nd.short_name, m.source_id) AS name, "
+        "       COALESCE(nd.long_name, nd.short_name, m.source_id::text) AS name, "
         "       nd.hardware_model AS hardware, nd.role AS role, "
-        "       COUNT(*) AS packets, MAX(m.time) AS last_seen "
-        "FROM mesh_packet_metrics m "
+        "       SUM(m.packets) AS packets, MAX(m.bucket) AS last_seen "
+        "FROM mesh_packet_1m m "
         "LEFT JOIN node_details nd ON nd.node_id = m.source_id "
-        "WHERE m.time > NOW() - INTERVAL '1 hour' "
+        "WHERE m.bucket > NOW() - INTERVAL '1 hour' "
         "GROUP BY m.source_id, nd.long_name, nd.short_name, nd.hardware_model, nd.role "
         "ORDER BY packets DESC LIMIT 50"
     )
@@ -613,14 +698,14 @@ def _overview_fleet_panels() -> list:
         "SELECT NOW() AS time, "
         "       COALESCE(NULLIF(hardware_model,''),'unknown') AS metric, "
         "       COUNT(*)::float AS value "
-        "FROM node_details WHERE node_id NOT IN ('4294967295','1','0') "
+        "FROM node_details WHERE node_id NOT IN (4294967295,1,0) "
         "GROUP BY 2 ORDER BY value DESC LIMIT 20"
     )
     role_sql = (
         "SELECT NOW() AS time, "
         "       COALESCE(NULLIF(role,''),'unknown') AS metric, "
         "       COUNT(*)::float AS value "
-        "FROM node_details WHERE node_id NOT IN ('4294967295','1','0') "
+        "FROM node_details WHERE node_id NOT IN (4294967295,1,0) "
         "GROUP BY 2 ORDER BY value DESC"
     )
     preset_sql = (
@@ -629,7 +714,7 @@ def _overview_fleet_panels() -> list:
         "            THEN 'unknown' ELSE modem_preset END AS metric, "
         "       COUNT(*)::float AS value "
         "FROM node_details "
-        "WHERE node_id NOT IN ('4294967295','1','0') "
+        "WHERE node_id NOT IN (4294967295,1,0) "
         "GROUP BY 2 ORDER BY value DESC"
     )
     return [
@@ -693,24 +778,34 @@ def build_overview() -> dict[str, Any]:
 
 def _node_header() -> dict:
     sql = (
-        "SELECT node_id, short_name, long_name, hardware_model, role, mqtt_status, "
-        "       latitude  * 1e-7 AS latitude, "
-        "       longitude * 1e-7 AS longitude, altitude, updated_at "
-        "FROM node_details WHERE node_id = '$nodeID' LIMIT 1"
+        "SELECT nd.node_id, nd.short_name, nd.long_name, nd.hardware_model, nd.role, "
+        "       nd.mqtt_status, "
+        "       nd.latitude  * 1e-7 AS latitude, "
+        "       nd.longitude * 1e-7 AS longitude, nd.altitude, nd.updated_at, "
+        "       nl.battery_level, nl.voltage, nl.temperature, "
+        "       GREATEST(nl.device_time, nl.environment_time) AS telemetry_at "
+        "FROM node_details nd "
+        "LEFT JOIN node_latest nl ON nl.node_id = nd.node_id "
+        "WHERE nd.node_id = '$nodeID' LIMIT 1"
     )
     return table_panel(
         1,
         "Node",
         sql,
         grid(0, 0, 12, 8),
-        {"description": "Latest known state for the selected node."},
+        {
+            "description": (
+                "Latest known state for the selected node, with its newest battery, "
+                "voltage and temperature readings (one node_latest row)."
+            )
+        },
     )
 
 
 def _node_map() -> dict:
     sql = (
         "SELECT node_id, "
-        "       COALESCE(NULLIF(long_name,'Unknown'), short_name, node_id) AS name, "
+        "       COALESCE(NULLIF(long_name,'Unknown'), short_name, node_id::text) AS name, "
         "       hardware_model, role, "
         "       longitude * 1e-7 AS longitude_norm, "
         "       latitude  * 1e-7 AS latitude_norm, altitude "
@@ -814,18 +909,24 @@ def _node_traffic_stats() -> list:
         piechart_panel(
             6,
             "Sent — by portnum",
-            "SELECT NOW() AS time, portnum AS metric, COUNT(*)::float AS value "
-            "FROM mesh_packet_metrics WHERE source_id = '$nodeID' "
-            "AND $__timeFilter(time) GROUP BY portnum",
+            "SELECT NOW() AS time, COALESCE(p.name, t.portnum::text) AS metric, "
+            "       t.value "
+            "FROM (SELECT portnum, COUNT(*)::float AS value "
+            "      FROM mesh_packet_metrics WHERE source_id = '$nodeID' "
+            "      AND $__timeFilter(time) GROUP BY portnum) t "
+            "LEFT JOIN port_names p ON p.portnum = t.portnum",
             grid(0, 13, 8, 8),
             {"description": "Packet types sent by this node."},
         ),
         piechart_panel(
             7,
             "Received — by portnum",
-            "SELECT NOW() AS time, portnum AS metric, COUNT(*)::float AS value "
-            "FROM mesh_packet_metrics WHERE destination_id = '$nodeID' "
-            "AND $__timeFilter(time) GROUP BY portnum",
+            "SELECT NOW() AS time, COALESCE(p.name, t.portnum::text) AS metric, "
+            "       t.value "
+            "FROM (SELECT portnum, COUNT(*)::float AS value "
+            "      FROM mesh_packet_metrics WHERE destination_id = '$nodeID' "
+            "      AND $__timeFilter(time) GROUP BY portnum) t "
+            "LEFT JOIN port_names p ON p.portnum = t.portnum",
             grid(8, 13, 8, 8),
             {"description": "Unicast packet types addressed to this node."},
         ),
@@ -838,9 +939,12 @@ def _node_telemetry() -> list:
         timeseries_panel(
             9,
             "Battery level",
-            "SELECT $__timeGroupAlias(time, $__interval), AVG(battery_level) AS battery "
-            "FROM device_metrics WHERE node_id = '$nodeID' AND $__timeFilter(time) "
-            "GROUP BY 1 ORDER BY 1",
+            tiered(
+                "SELECT $__timeGroupAlias(time, $__interval), AVG(battery_level) AS battery "
+                "FROM {table} WHERE {tier} AND node_id = '$nodeID' AND $__timeFilter(time) "
+                "GROUP BY 1",
+                "device_metrics",
+            ),
             grid(0, 22, 12, 7),
             {
                 "description": "Battery level reported via TELEMETRY_APP.",
@@ -851,9 +955,12 @@ def _node_telemetry() -> list:
         timeseries_panel(
             10,
             "Voltage",
-            "SELECT $__timeGroupAlias(time, $__interval), AVG(voltage) AS voltage "
-            "FROM device_metrics WHERE node_id = '$nodeID' AND $__timeFilter(time) "
-            "GROUP BY 1 ORDER BY 1",
+            tiered(
+                "SELECT $__timeGroupAlias(time, $__interval), AVG(voltage) AS voltage "
+                "FROM {table} WHERE {tier} AND node_id = '$nodeID' AND $__timeFilter(time) "
+                "GROUP BY 1",
+                "device_metrics",
+            ),
             grid(12, 22, 12, 7),
             {
                 "description": "Voltage reported via TELEMETRY_APP.",
@@ -864,11 +971,14 @@ def _node_telemetry() -> list:
         timeseries_panel(
             11,
             "Channel utilization & airtime",
-            "SELECT $__timeGroupAlias(time, $__interval), "
-            '       AVG(channel_utilization) AS "ChUtil", '
-            '       AVG(air_util_tx)         AS "AirUtilTX" '
-            "FROM device_metrics WHERE node_id = '$nodeID' AND $__timeFilter(time) "
-            "GROUP BY 1 ORDER BY 1",
+            tiered(
+                "SELECT $__timeGroupAlias(time, $__interval), "
+                '       AVG(channel_utilization) AS "ChUtil", '
+                '       AVG(air_util_tx)         AS "AirUtilTX" '
+                "FROM {table} WHERE {tier} AND node_id = '$nodeID' AND $__timeFilter(time) "
+                "GROUP BY 1",
+                "device_metrics",
+            ),
             grid(0, 29, 24, 7),
             {
                 "description": "ChUtil = receive-busy fraction. AirUtilTX = transmit duty cycle.",
@@ -881,14 +991,17 @@ def _node_telemetry() -> list:
 def _node_environment() -> list:
     base = (
         "SELECT $__timeGroupAlias(time, $__interval), AVG({col}) AS {alias} "
-        "FROM environment_metrics WHERE node_id = '$nodeID' AND $__timeFilter(time) "
-        "GROUP BY 1 ORDER BY 1"
+        "FROM {{table}} WHERE {{tier}} AND node_id = '$nodeID' AND $__timeFilter(time) "
+        "GROUP BY 1"
     )
     return [
         timeseries_panel(
             13,
             "Temperature",
-            base.format(col="temperature", alias="temperature"),
+            tiered(
+                base.format(col="temperature", alias="temperature"),
+                "environment_metrics",
+            ),
             grid(0, 37, 8, 7),
             {
                 "description": "Temperature reading from ENVIRONMENT_METRICS.",
@@ -899,7 +1012,10 @@ def _node_environment() -> list:
         timeseries_panel(
             14,
             "Humidity",
-            base.format(col="relative_humidity", alias="humidity"),
+            tiered(
+                base.format(col="relative_humidity", alias="humidity"),
+                "environment_metrics",
+            ),
             grid(8, 37, 8, 7),
             {
                 "description": "Relative humidity in percent.",
@@ -910,7 +1026,10 @@ def _node_environment() -> list:
         timeseries_panel(
             15,
             "Barometric pressure",
-            base.format(col="barometric_pressure", alias="pressure"),
+            tiered(
+                base.format(col="barometric_pressure", alias="pressure"),
+                "environment_metrics",
+            ),
             grid(16, 37, 8, 7),
             {
                 "description": "Barometric pressure in hPa.",
@@ -927,21 +1046,21 @@ def _node_power() -> list:
         '       AVG(ch1_{kind}) AS "Ch1", '
         '       AVG(ch2_{kind}) AS "Ch2", '
         '       AVG(ch3_{kind}) AS "Ch3" '
-        "FROM power_metrics WHERE node_id = '$nodeID' AND $__timeFilter(time) "
-        "GROUP BY 1 ORDER BY 1"
+        "FROM {{table}} WHERE {{tier}} AND node_id = '$nodeID' AND $__timeFilter(time) "
+        "GROUP BY 1"
     )
     return [
         timeseries_panel(
             17,
             "Channel current",
-            base.format(kind="current"),
+            tiered(base.format(kind="current"), "power_metrics"),
             grid(0, 45, 12, 7),
             {"description": "Current measured on power channels.", "unit": "amp"},
         ),
         timeseries_panel(
             18,
             "Channel voltage",
-            base.format(kind="voltage"),
+            tiered(base.format(kind="voltage"), "power_metrics"),
             grid(12, 45, 12, 7),
             {"description": "Voltage measured on power channels.", "unit": "volt"},
         ),
@@ -992,16 +1111,16 @@ def _node_topology() -> dict:
         "WITH peers AS ("
         "  SELECT destination_id AS node_id FROM mesh_packet_metrics "
         "  WHERE source_id = '$nodeID' "
-        "    AND destination_id NOT IN ('4294967295','1','0') "
+        "    AND destination_id NOT IN (4294967295,1,0) "
         "    AND $__timeFilter(time) "
         "  UNION SELECT source_id FROM mesh_packet_metrics "
         "  WHERE destination_id = '$nodeID' "
-        "    AND source_id NOT IN ('4294967295','1','0') "
+        "    AND source_id NOT IN (4294967295,1,0) "
         "    AND $__timeFilter(time) "
         "  UNION SELECT '$nodeID'"
         ") "
-        'SELECT cd.node_id AS "id", '
-        "       COALESCE(NULLIF(cd.long_name,'Unknown'), cd.short_name, cd.node_id) AS \"title\", "
+        'SELECT cd.node_id::text AS "id", '
+        "       COALESCE(NULLIF(cd.long_name,'Unknown'), cd.short_name, cd.node_id::text) AS \"title\", "
         '       cd.short_name AS "subtitle", '
         '       cd.hardware_model AS "detail__Hardware", '
         '       cd.role           AS "detail__Role", '
@@ -1013,13 +1132,13 @@ def _node_topology() -> dict:
     edges_sql = (
         "WITH ids AS ("
         "  SELECT destination_id AS node_id FROM mesh_packet_metrics "
-        "  WHERE source_id = '$nodeID' AND destination_id NOT IN ('4294967295','1','0') AND $__timeFilter(time) "
+        "  WHERE source_id = '$nodeID' AND destination_id NOT IN (4294967295,1,0) AND $__timeFilter(time) "
         "  UNION SELECT source_id FROM mesh_packet_metrics "
-        "  WHERE destination_id = '$nodeID' AND source_id NOT IN ('4294967295','1','0') AND $__timeFilter(time) "
+        "  WHERE destination_id = '$nodeID' AND source_id NOT IN (4294967295,1,0) AND $__timeFilter(time) "
         "  UNION SELECT '$nodeID'"
         ") "
         "SELECT source_id || '_' || destination_id AS id, "
-        '       source_id      AS "source", destination_id AS "target", '
+        '       source_id::text AS "source", destination_id::text AS "target", '
         '       ROUND(AVG(NULLIF(rx_snr,0))::numeric, 1) AS "mainstat", '
         '       COUNT(*) AS "secondarystat", '
         "       CASE WHEN AVG(NULLIF(rx_snr,0)) < -13 THEN '#E74C3C' "
@@ -1027,7 +1146,7 @@ def _node_topology() -> dict:
         "            ELSE '#2ECC71' END AS \"color\", "
         '       GREATEST(0.5, LEAST(4, LOG(COUNT(*) + 1))) AS "thickness" '
         "FROM mesh_packet_metrics "
-        "WHERE destination_id NOT IN ('4294967295','1','0') "
+        "WHERE destination_id NOT IN (4294967295,1,0) "
         "  AND source_id      IN (SELECT node_id FROM ids) "
         "  AND destination_id IN (SELECT node_id FROM ids) "
         "  AND $__timeFilter(time) "
@@ -1092,7 +1211,7 @@ def _node_neighbors() -> dict:
         "         MAX(time)::timestamptz AS last_seen "
         "  FROM mesh_packet_metrics "
         "  WHERE source_id = '$nodeID' "
-        "    AND destination_id NOT IN ('4294967295','1','0') "
+        "    AND destination_id NOT IN (4294967295,1,0) "
         "    AND $__timeFilter(time) "
         "  GROUP BY destination_id"
         "), incoming AS ("
@@ -1103,7 +1222,7 @@ def _node_neighbors() -> dict:
         "         MAX(time)::timestamptz AS last_seen "
         "  FROM mesh_packet_metrics "
         "  WHERE destination_id = '$nodeID' "
-        "    AND source_id NOT IN ('4294967295','1','0') "
+        "    AND source_id NOT IN (4294967295,1,0) "
         "    AND $__timeFilter(time) "
         "  GROUP BY source_id"
         "), traffic AS ("
@@ -1117,7 +1236,7 @@ def _node_neighbors() -> dict:
         "  FROM node_neighbors WHERE node_id = '$nodeID'"
         ") "
         "SELECT t.direction, t.peer_id AS node_id, "
-        "       COALESCE(NULLIF(nd.long_name,'Unknown'), nd.short_name, t.peer_id) AS name, "
+        "       COALESCE(NULLIF(nd.long_name,'Unknown'), nd.short_name, t.peer_id::text) AS name, "
         "       t.pkts, t.avg_snr, t.avg_rssi, t.last_seen "
         "FROM (SELECT * FROM traffic UNION ALL SELECT * FROM neighbors) t "
         "LEFT JOIN node_details nd ON nd.node_id = t.peer_id "
@@ -1150,10 +1269,10 @@ def _node_var() -> dict:
     return query_var(
         "nodeID",
         "Node",
-        "SELECT COALESCE(NULLIF(long_name,'Unknown'), short_name, node_id) "
+        "SELECT COALESCE(NULLIF(long_name,'Unknown'), short_name, node_id::text) "
         "       || ' (' || node_id || ')' AS __text, "
         "       node_id AS __value "
-        "FROM node_details WHERE node_id NOT IN ('4294967295','1','0') "
+        "FROM node_details WHERE node_id NOT IN (4294967295,1,0) "
         "ORDER BY long_name",
     )
 
@@ -1190,7 +1309,7 @@ def build_node_detail() -> dict[str, Any]:
 def _map_geomap() -> dict:
     sql = (
         "SELECT node_id, "
-        "       COALESCE(NULLIF(long_name,'Unknown'), short_name, node_id) AS name, "
+        "       COALESCE(NULLIF(long_name,'Unknown'), short_name, node_id::text) AS name, "
         "       hardware_model, role, mqtt_status, "
         "       longitude * 1e-7 AS longitude_norm, "
         "       latitude  * 1e-7 AS latitude_norm, altitude "
@@ -1283,12 +1402,12 @@ _RANKED_CTE = (
     "WITH appearances AS ("
     "  SELECT source_id      AS node_id FROM mesh_packet_metrics "
     "  WHERE time > NOW() - INTERVAL '1 hour' "
-    "    AND destination_id NOT IN ('4294967295','1','0') "
+    "    AND destination_id NOT IN (4294967295,1,0) "
     "    AND source_id <> destination_id "
     "  UNION ALL "
     "  SELECT destination_id AS node_id FROM mesh_packet_metrics "
     "  WHERE time > NOW() - INTERVAL '1 hour' "
-    "    AND destination_id NOT IN ('4294967295','1','0') "
+    "    AND destination_id NOT IN (4294967295,1,0) "
     "    AND source_id <> destination_id "
     "  UNION ALL SELECT node_id     FROM node_neighbors "
     "  UNION ALL SELECT neighbor_id FROM node_neighbors"
@@ -1301,7 +1420,7 @@ _RANKED_CTE = (
 
 def _map_nodegraph_nodes_sql() -> str:
     return (
-        _RANKED_CTE + 'SELECT cd.node_id AS "id", cd.long_name AS "title", '
+        _RANKED_CTE + 'SELECT cd.node_id::text AS "id", cd.long_name AS "title", '
         '       cd.short_name AS "subtitle", '
         '       cd.hardware_model AS "detail__Hardware", '
         '       cd.role           AS "detail__Role", '
@@ -1324,14 +1443,14 @@ def _map_nodegraph_edges_sql() -> str:
         "         AVG(NULLIF(rx_snr, 0)) AS avg_snr "
         "  FROM mesh_packet_metrics "
         "  WHERE time > NOW() - INTERVAL '1 hour' "
-        "    AND destination_id NOT IN ('4294967295','1','0') "
+        "    AND destination_id NOT IN (4294967295,1,0) "
         "    AND source_id <> destination_id "
         "    AND source_id      IN (SELECT node_id FROM ranked) "
         "    AND destination_id IN (SELECT node_id FROM ranked) "
         "  GROUP BY source_id, destination_id"
         ") "
         "SELECT source_id || '_' || destination_id AS id, "
-        '       source_id      AS "source", destination_id AS "target", '
+        '       source_id::text AS "source", destination_id::text AS "target", '
         '       ROUND(avg_snr::numeric, 1) AS "mainstat", pkts AS "secondarystat", '
         "       CASE WHEN avg_snr < -13 THEN '#E74C3C' "
         "            WHEN avg_snr <  -7 THEN '#F4D03F' "
@@ -1339,7 +1458,7 @@ def _map_nodegraph_edges_sql() -> str:
         '       GREATEST(0.5, LEAST(4, LOG(pkts + 1))) AS "thickness" '
         "FROM aggregated UNION ALL "
         "SELECT neighbor_id || '_' || node_id AS id, "
-        '       neighbor_id AS "source", node_id AS "target", '
+        '       neighbor_id::text AS "source", node_id::text AS "target", '
         '       snr AS "mainstat", NULL AS "secondarystat", '
         "       CASE WHEN snr < -13 THEN '#E74C3C' "
         "            WHEN snr <  -7 THEN '#F4D03F' "
@@ -1482,7 +1601,7 @@ def _pax_geomap() -> dict:
     sql = (
         "SELECT DISTINCT ON (p.node_id) "
         "       p.node_id, "
-        "       COALESCE(NULLIF(nd.long_name,'Unknown'), nd.short_name, p.node_id) AS name, "
+        "       COALESCE(NULLIF(nd.long_name,'Unknown'), nd.short_name, p.node_id::text) AS name, "
         "       p.wifi_stations, p.ble_beacons, "
         "       nd.longitude * 1e-7 AS longitude_norm, "
         "       nd.latitude  * 1e-7 AS latitude_norm "
@@ -1564,12 +1683,12 @@ def build_pax() -> dict[str, Any]:
         "SELECT $__timeGroupAlias(time, $__interval), "
         '       AVG(wifi_stations) AS "WiFi stations", '
         '       AVG(ble_beacons)   AS "BLE beacons" '
-        "FROM pax_counter_metrics WHERE $__timeFilter(time) "
-        "GROUP BY 1 ORDER BY 1"
+        "FROM {table} WHERE {tier} AND $__timeFilter(time) "
+        "GROUP BY 1"
     )
     table_sql = (
         "SELECT DISTINCT ON (p.node_id) p.node_id, "
-        "       COALESCE(nd.long_name, nd.short_name, p.node_id) AS name, "
+        "       COALESCE(nd.long_name, nd.short_name, p.node_id::text) AS name, "
         "       p.wifi_stations, p.ble_beacons, p.uptime, p.time AS last_reading "
         "FROM pax_counter_metrics p "
         "LEFT JOIN node_details nd ON nd.node_id = p.node_id "
@@ -1579,7 +1698,7 @@ def build_pax() -> dict[str, Any]:
         timeseries_panel(
             5,
             "WiFi & BLE counts over time",
-            trends_sql,
+            tiered(trends_sql, "pax_counter_metrics"),
             grid(0, 4, 24, 9),
             {"description": "Per-node trends from PAX_COUNTER packets."},
         ),
@@ -1638,16 +1757,17 @@ def _investigation_recent() -> dict:
     sql = (
         'SELECT m.time AS "time", '
         "       m.source_id AS node_id, "
-        "       COALESCE(nd.long_name, nd.short_name, m.source_id) AS source_name, "
-        "       CASE WHEN m.destination_id IN ('4294967295','1','0') THEN 'BROADCAST' "
-        "            ELSE m.destination_id END AS destination_id, "
-        "       m.portnum, m.channel, "
+        "       COALESCE(nd.long_name, nd.short_name, m.source_id::text) AS source_name, "
+        "       CASE WHEN m.destination_id IN (4294967295,1,0) THEN 'BROADCAST' "
+        "            ELSE m.destination_id::text END AS destination_id, "
+        "       COALESCE(p.name, m.portnum::text) AS portnum, m.channel, "
         "       ROUND(m.rx_snr::numeric,  1) AS rx_snr, "
         "       ROUND(m.rx_rssi::numeric, 0) AS rx_rssi, "
         "       m.hop_start, m.hop_limit, "
         "       m.message_size_bytes AS bytes, m.via_mqtt "
         "FROM mesh_packet_metrics m "
         "LEFT JOIN node_details nd ON nd.node_id = m.source_id "
+        "LEFT JOIN port_names p ON p.portnum = m.portnum "
         "WHERE $__timeFilter(m.time) "
         "ORDER BY m.time DESC LIMIT 200"
     )
@@ -1677,23 +1797,19 @@ def _investigation_recent() -> dict:
 
 
 def _investigation_traffic_breakdown() -> list:
-    portnum_ts_sql = (
-        "SELECT $__timeGroupAlias(time, $__interval), "
-        "       portnum AS metric, COUNT(*)::float AS value "
-        "FROM mesh_packet_metrics WHERE $__timeFilter(time) "
-        "GROUP BY 1, portnum ORDER BY 1"
-    )
     totals_sql = (
-        "SELECT m.source_id AS node_id, m.portnum, COUNT(*) AS packets "
-        "FROM mesh_packet_metrics m "
-        "WHERE $__timeFilter(m.time) "
-        "GROUP BY m.source_id, m.portnum ORDER BY packets DESC LIMIT 200"
+        "SELECT t.node_id, COALESCE(p.name, t.portnum::text) AS portnum, t.packets "
+        "FROM (SELECT source_id AS node_id, portnum, SUM(packets) AS packets "
+        "      FROM mesh_packet_1m WHERE $__timeFilter(bucket) "
+        "      GROUP BY source_id, portnum ORDER BY packets DESC LIMIT 200) t "
+        "LEFT JOIN port_names p ON p.portnum = t.portnum "
+        "ORDER BY t.packets DESC"
     )
     return [
         timeseries_panel(
             2,
             "Packets per minute by portnum",
-            portnum_ts_sql,
+            PORTNUM_TS_SQL,
             grid(0, 13, 12, 9),
             {
                 "description": "Per-portnum packet rate. Sustained spikes can indicate a misbehaving node or a routing storm."
@@ -1719,27 +1835,26 @@ def _investigation_traffic_breakdown() -> list:
 def _investigation_quality() -> list:
     snr_sql = (
         "SELECT m.source_id AS node_id, "
-        "       COALESCE(nd.long_name, nd.short_name, m.source_id) AS name, "
-        "       ROUND(AVG(m.rx_snr)::numeric,  1) AS avg_snr, "
-        "       ROUND(AVG(m.rx_rssi)::numeric, 0) AS avg_rssi, "
-        "       MIN(m.rx_snr) AS min_snr, MAX(m.rx_snr) AS max_snr, "
-        "       COUNT(*)      AS packets "
-        "FROM mesh_packet_metrics m "
+        "       COALESCE(nd.long_name, nd.short_name, m.source_id::text) AS name, "
+        "       ROUND((SUM(m.snr_sum)  / SUM(m.snr_samples))::numeric, 1) AS avg_snr, "
+        "       ROUND((SUM(m.rssi_sum) / NULLIF(SUM(m.rssi_samples), 0))::numeric, 0) AS avg_rssi, "
+        "       MIN(m.snr_min) AS min_snr, MAX(m.snr_max) AS max_snr, "
+        "       SUM(m.snr_samples) AS packets "
+        "FROM mesh_packet_1m m "
         "LEFT JOIN node_details nd ON nd.node_id = m.source_id "
-        "WHERE $__timeFilter(m.time) AND m.rx_snr IS NOT NULL AND m.rx_snr <> 0 "
-        "  AND m.destination_id NOT IN ('4294967295','1','0') "
+        "WHERE $__timeFilter(m.bucket) AND NOT m.broadcast "
         "GROUP BY m.source_id, nd.long_name, nd.short_name "
-        "HAVING COUNT(*) > 2 ORDER BY avg_snr ASC LIMIT 50"
+        "HAVING SUM(m.snr_samples) > 2 ORDER BY avg_snr ASC LIMIT 50"
     )
     hops_sql = (
         "SELECT m.source_id AS node_id, "
-        "       COALESCE(nd.long_name, nd.short_name, m.source_id) AS name, "
-        "       MAX(m.hop_start)               AS max_hop_start, "
-        "       MAX(m.hop_start - m.hop_limit) AS max_hops_taken, "
-        "       COUNT(*)                       AS packets "
-        "FROM mesh_packet_metrics m "
+        "       COALESCE(nd.long_name, nd.short_name, m.source_id::text) AS name, "
+        "       MAX(m.max_hop_start)  AS max_hop_start, "
+        "       MAX(m.max_hops_taken) AS max_hops_taken, "
+        "       SUM(m.hopped_packets) AS packets "
+        "FROM mesh_packet_1m m "
         "LEFT JOIN node_details nd ON nd.node_id = m.source_id "
-        "WHERE $__timeFilter(m.time) AND m.hop_start > 0 "
+        "WHERE $__timeFilter(m.bucket) AND m.hopped_packets > 0 "
         "GROUP BY m.source_id, nd.long_name, nd.short_name "
         "ORDER BY max_hops_taken DESC LIMIT 50"
     )
@@ -1790,13 +1905,13 @@ def _investigation_fleet() -> list:
     hw_sql = (
         "SELECT NOW() AS time, COALESCE(hardware_model,'unknown') AS metric, "
         "       COUNT(*)::float AS value "
-        "FROM node_details WHERE node_id NOT IN ('4294967295','1','0') "
+        "FROM node_details WHERE node_id NOT IN (4294967295,1,0) "
         "GROUP BY 2 ORDER BY value DESC"
     )
     role_sql = (
         "SELECT NOW() AS time, COALESCE(role,'unknown') AS metric, "
         "       COUNT(*)::float AS value "
-        "FROM node_details WHERE node_id NOT IN ('4294967295','1','0') "
+        "FROM node_details WHERE node_id NOT IN (4294967295,1,0) "
         "  AND role IS NOT NULL GROUP BY 2 ORDER BY value DESC"
     )
     return [
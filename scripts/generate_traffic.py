@@ -0,0 +1,423 @@
+#!/usr/bin/env python3
+"""
+Synthetic mesh traffic for load testing the exporter.
+
+Models N nodes scattered around a city: positions, radio neighbours,
+firmware-default broadcast cadences and a set of MQTT gateways.  Every
+packet is published once for each gateway that hears it, just as the
+public broker sees real rebroadcasts.  Mesh traffic is encrypted with the
+default LongFast key.  MapReports go out unencrypted on the map topic.
+
+Write a capture file for scripts/replay_capture.py:
+
+    python3 scripts/generate_traffic.py --nodes 10000 --duration 3600 \\
+        --capture sim-10k.bin
+
+Or feed main.handle_message directly against the database in DATABASE_URL,
+as fast as the pipeline accepts it, and print throughput, per-stage
+timings and peak memory:
+
+    python3 scripts/generate_traffic.py --nodes 1000 --direct
+
+The same --seed always produces the same traffic.
+"""
+
+from __future__ import annotations
+
+import argparse
+import heapq
+import math
+import random
+import sys
+from dataclasses import dataclass, field
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Iterator
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from cryptography.hazmat.primitives.ciphers import (  # noqa: E402
+    Cipher,
+    algorithms,
+    modes,
+)
+
+from exporter.capture import CaptureWriter  # noqa: E402
+from exporter.keyring import DEFAULT_PSK, channel_hash  # noqa: E402
+
+try:
+    from meshtastic.config_pb2 import Config
+    from meshtastic.mesh_pb2 import (
+        Data,
+        HardwareModel,
+        MeshPacket,
+        NeighborInfo,
+        Position,
+        User,
+    )
+    from meshtastic.mqtt_pb2 import MapReport, ServiceEnvelope
+    from meshtastic.portnums_pb2 import PortNum
+    from meshtastic.telemetry_pb2 import DeviceMetrics, EnvironmentMetrics, Telemetry
+except ImportError:
+    from meshtastic.protobuf.config_pb2 import Config
+    from meshtastic.protobuf.mesh_pb2 import (
+        Data,
+        HardwareModel,
+        MeshPacket,
+        NeighborInfo,
+        Position,
+        User,
+    )
+    from meshtastic.protobuf.mqtt_pb2 import MapReport, ServiceEnvelope
+    from meshtastic.protobuf.portnums_pb2 import PortNum
+    from meshtastic.protobuf.telemetry_pb2 import (
+        DeviceMetrics,
+        EnvironmentMetrics,
+        Telemetry,
+    )
+
+BROADCAST = 0xFFFFFFFF
+CHANNEL = "LongFast"
+CENTER = (32.0853, 34.7818)
+# Roughly one LoRa hop in a city; nodes in the same or adjacent cell can
+# hear each other.
+CELL_DEGREES = 0.05
+
+# Firmware default broadcast intervals, seconds.
+CADENCES = {
+    "nodeinfo": 3 * 3600,
+    "position": 15 * 60,
+    "device": 30 * 60,
+    "environment": 30 * 60,
+    "neighbors": 6 * 3600,
+    "map": 3600,
+    "text": 2 * 3600,
+}
+
+HARDWARE = [
+    (HardwareModel.HELTEC_V3, 30),
+    (HardwareModel.TBEAM, 20),
+    (HardwareModel.RAK4631, 25),
+    (HardwareModel.T_ECHO, 10),
+    (HardwareModel.STATION_G2, 5),
+    (HardwareModel.TRACKER_T1000_E, 10),
+]
+ROLES = [
+    (Config.DeviceConfig.Role.CLIENT, 75),
+    (Config.DeviceConfig.Role.CLIENT_MUTE, 10),
+    (Config.DeviceConfig.Role.ROUTER, 5),
+    (Config.DeviceConfig.Role.TRACKER, 5),
+    (Config.DeviceConfig.Role.SENSOR, 5),
+]
+
+
+@dataclass
+class SimNode:
+    num: int
+    short_name: str
+    long_name: str
+    hw_model: int
+    role: int
+    lat: float
+    lon: float
+    altitude: int
+    mobile: bool
+    kinds: list[str]
+    neighbors: list[tuple[int, float]] = field(default_factory=list)
+    gateways: list[int] = field(default_factory=list)
+    battery: float = 100.0
+
+
+def _weighted(rng: random.Random, choices):
+    values, weights = zip(*choices)
+    return rng.choices(values, weights)[0]
+
+
+class MeshModel:
+    def __init__(
+        self,
+        nodes: int,
+        gateway_ratio: float = 0.05,
+        root: str = "msh/sim",
+        seed: int = 1,
+    ):
+        self.rng = random.Random(seed)
+        self.root = root
+        self.channel_hash = channel_hash(CHANNEL, DEFAULT_PSK)
+        self.nodes = self._place(nodes)
+        self.by_num = {n.num: n for n in self.nodes}
+        self._link(max(1, int(nodes * gateway_ratio)))
+
+    def _place(self, count: int) -> list[SimNode]:
+        rng = self.rng
+        nums: set[int] = set()
+        while len(nums) < count:
+            num = rng.randrange(0x10000000, 0xFFFFFFFE)
+            nums.add(num)
+        # A denser core with a sparse tail; 100k nodes cover ~60km.
+        spread = 0.03 * math.sqrt(count / 1000)
+        nodes = []
+        for num in sorted(nums):
+            kinds = ["nodeinfo", "position", "device"]
+            if rng.random() < 0.2:
+                kinds.append("environment")
+            if rng.random() < 0.3:
+                kinds.append("neighbors")
+            if rng.random() < 0.4:
+                kinds.append("map")
+            if rng.random() < 0.1:
+                kinds.append("text")
+            nodes.append(
+                SimNode(
+                    num=num,
+                    short_name=f"{num & 0xFFFF:04x}",
+                    long_name=f"Sim {num:08x}",
+                    hw_model=_weighted(rng, HARDWARE),
+                    role=_weighted(rng, ROLES),
+                    lat=CENTER[0] + rng.gauss(0, spread),
+                    lon=CENTER[1] + rng.gauss(0, spread),
+                    altitude=int(rng.uniform(0, 120)),
+                    mobile=rng.random() < 0.1,
+                    kinds=kinds,
+                    battery=rng.uniform(20, 100),
+                )
+            )
+        return nodes
+
+    def _link(self, gateway_count: int):
+        rng = self.rng
+        cells: dict[tuple[int, int], list[SimNode]] = {}
+        gateway_cells: dict[tuple[int, int], list[int]] = {}
+        gateways = rng.sample(self.nodes, gateway_count)
+        for node in self.nodes:
+            cells.setdefault(self._cell(node), []).append(node)
+        for gateway in gateways:
+            gateway_cells.setdefault(self._cell(gateway), []).append(gateway.num)
+        for node in self.nodes:
+            cx, cy = self._cell(node)
+            around = [(cx + dx, cy + dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)]
+            # Sample per cell instead of listing every node in range: the
+            # core cells hold thousands of nodes at 100k.
+            for _ in range(rng.randint(1, 8)):
+                cell = cells.get(rng.choice(around))
+                if cell:
+                    other = rng.choice(cell)
+                    if other.num != node.num:
+                        node.neighbors.append(
+                            (other.num, round(rng.uniform(-15, 10), 2))
+                        )
+            heard_by = [num for cell in around for num in gateway_cells.get(cell, ())]
+            rng.shuffle(heard_by)
+            node.gateways = heard_by[: rng.randint(1, 4)] or [rng.choice(gateways).num]
+
+    @staticmethod
+    def _cell(node: SimNode) -> tuple[int, int]:
+        return int(node.lat // CELL_DEGREES), int(node.lon // CELL_DEGREES)
+
+    def events(
+        self, duration: float, start: float = 1_700_000_000.0
+    ) -> Iterator[tuple[float, str, bytes]]:
+        """Yield ``(time, topic, payload)`` in time order for ``duration``
+        simulated seconds, one entry per gateway copy."""
+        rng = self.rng
+        due = [
+            (start + rng.uniform(0, CADENCES[kind]), node.num, kind)
+            for node in self.nodes
+            for kind in node.kinds
+        ]
+        heapq.heapify(due)
+        end = start + duration
+        while due and due[0][0] < end:
+            at, num, kind = heapq.heappop(due)
+            node = self.by_num[num]
+            yield from self._publish(node, kind, at)
+            heapq.heappush(
+                due, (at + CADENCES[kind] * rng.uniform(0.9, 1.1), num, kind)
+            )
+
+    def _publish(self, node: SimNode, kind: str, at: float):
+        rng = self.rng
+        if kind == "map":
+            packet = self._packet(node, BROADCAST, at)
+            packet.decoded.portnum = PortNum.MAP_REPORT_APP
+            packet.decoded.payload = self._map_report(node).SerializeToString()
+            gateway = node.gateways[0]
+            topic = f"{self.root}/2/map/"
+            yield at, topic, self._envelope(packet, gateway)
+            return
+
+        to = BROADCAST
+        if kind == "text" and node.neighbors and rng.random() < 0.3:
+            to = node.neighbors[0][0]
+        portnum, payload = self._payload(node, kind, at)
+        packet = self._packet(node, to, at)
+        packet.channel = self.channel_hash
+        packet.encrypted = self._encrypt(
+            packet, Data(portnum=portnum, payload=payload).SerializeToString()
+        )
+        for gateway in node.gateways:
+            hops = 0 if gateway == node.num else rng.randint(1, 2)
+            packet.hop_limit = packet.hop_start - hops
+            packet.rx_snr = round(rng.uniform(-18, 12), 2)
+            packet.rx_rssi = rng.randint(-125, -40)
+            topic = f"{self.root}/2/e/{CHANNEL}/!{gateway:08x}"
+            yield at, topic, self._envelope(packet, gateway)
+
+    def _packet(self, node: SimNode, to: int, at: float) -> MeshPacket:
+        packet = MeshPacket(
+            to=to,
+            id=self.rng.getrandbits(32),
+            rx_time=int(at),
+            hop_start=3,
+            hop_limit=3,
+        )
+        setattr(packet, "from", node.num)
+        return packet
+
+    def _payload(self, node: SimNode, kind: str, at: float) -> tuple[int, bytes]:
+        rng = self.rng
+        if kind == "nodeinfo":
+            user = User(
+                id=f"!{node.num:08x}",
+                long_name=node.long_name,
+                short_name=node.short_name,
+                hw_model=node.hw_model,
+                role=node.role,
+            )
+            return PortNum.NODEINFO_APP, user.SerializeToString()
+        if kind == "position":
+            if node.mobile:
+                node.lat += rng.gauss(0, 0.002)
+                node.lon += rng.gauss(0, 0.002)
+            position = Position(
+                latitude_i=int(node.lat * 1e7),
+                longitude_i=int(node.lon * 1e7),
+                altitude=node.altitude,
+                time=int(at),
+                sats_in_view=rng.randint(4, 14),
+                precision_bits=32,
+            )
+            return PortNum.POSITION_APP, position.SerializeToString()
+        if kind == "device":
+            node.battery = max(5.0, node.battery - rng.uniform(0, 1.5))
+            telemetry = Telemetry(
+                time=int(at),
+                device_metrics=DeviceMetrics(
+                    battery_level=int(node.battery),
+                    voltage=round(3.3 + node.battery / 100, 3),
+                    channel_utilization=round(rng.uniform(2, 35), 2),
+                    air_util_tx=round(rng.uniform(0, 6), 2),
+                    uptime_seconds=int(at) % 864000,
+                ),
+            )
+            return PortNum.TELEMETRY_APP, telemetry.SerializeToString()
+        if kind == "environment":
+            telemetry = Telemetry(
+                time=int(at),
+                environment_metrics=EnvironmentMetrics(
+                    temperature=round(rng.gauss(24, 4), 2),
+                    relative_humidity=round(rng.uniform(30, 90), 2),
+                    barometric_pressure=round(rng.gauss(1013, 5), 2),
+                ),
+            )
+            return PortNum.TELEMETRY_APP, telemetry.SerializeToString()
+        if kind == "neighbors":
+            info = NeighborInfo(
+                node_id=node.num,
+                node_broadcast_interval_secs=CADENCES["neighbors"],
+            )
+            for num, snr in node.neighbors:
+                neighbor = info.neighbors.add()
+                neighbor.node_id = num
+                neighbor.snr = round(snr + rng.uniform(-1, 1), 2)
+            return PortNum.NEIGHBORINFO_APP, info.SerializeToString()
+        return PortNum.TEXT_MESSAGE_APP, f"hello from {node.short_name}".encode()
+
+    def _map_report(self, node: SimNode) -> MapReport:
+        return MapReport(
+            long_name=node.long_name,
+            short_name=node.short_name,
+            role=node.role,
+            hw_model=node.hw_model,
+            firmware_version="2.5.0.sim",
+            region=Config.LoRaConfig.RegionCode.EU_868,
+            has_default_channel=True,
+            latitude_i=int(node.lat * 1e7),
+            longitude_i=int(node.lon * 1e7),
+            altitude=node.altitude,
+            position_precision=14,
+            num_online_local_nodes=len(node.neighbors),
+        )
+
+    @staticmethod
+    def _encrypt(packet: MeshPacket, plain: bytes) -> bytes:
+        nonce = packet.id.to_bytes(8, "little") + getattr(packet, "from").to_bytes(
+            8, "little"
+        )
+        encryptor = Cipher(algorithms.AES(DEFAULT_PSK), modes.CTR(nonce)).encryptor()
+        return encryptor.update(plain) + encryptor.finalize()
+
+    @staticmethod
+    def _envelope(packet: MeshPacket, gateway: int) -> bytes:
+        envelope = ServiceEnvelope(channel_id=CHANNEL, gateway_id=f"!{gateway:08x}")
+        envelope.packet.CopyFrom(packet)
+        return envelope.SerializeToString()
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--nodes", type=int, default=1000)
+    parser.add_argument(
+        "--duration", type=float, default=3600, help="simulated seconds"
+    )
+    parser.add_argument(
+        "--gateway-ratio",
+        type=float,
+        default=0.05,
+        help="fraction of nodes that uplink to MQTT (default: 0.05)",
+    )
+    parser.add_argument("--root", default="msh/sim", help="MQTT topic root")
+    parser.add_argument("--seed", type=int, default=1)
+    out = parser.add_mutually_exclusive_group(required=True)
+    out.add_argument("--capture", help="write a capture file")
+    out.add_argument(
+        "--direct",
+        action="store_true",
+        help="feed main.handle_message against DATABASE_URL",
+    )
+    parser.add_argument("--json", action="store_true", help="print the summary as JSON")
+    return parser.parse_args(argv)
+
+
+def run(argv: list[str] | None = None):
+    args = parse_args(argv)
+    model = MeshModel(args.nodes, args.gateway_ratio, args.root, args.seed)
+    events = model.events(args.duration)
+
+    if args.capture:
+        writer = CaptureWriter(args.capture)
+        count = 0
+        for at, topic, payload in events:
+            writer.write(at, topic, payload)
+            count += 1
+        writer.close()
+        print(f"wrote {count} messages for {args.nodes} nodes to {args.capture}")
+        return
+
+    import main
+    import replay_capture
+
+    def feed() -> int:
+        count = 0
+        for _, topic, payload in events:
+            main.handle_message(
+                None, None, SimpleNamespace(topic=topic, payload=payload)
+            )
+            count += 1
+        return count
+
+    replay_capture.print_summary(replay_capture.ingest(feed), args.json)
+
+
+if __name__ == "__main__":
+    run()
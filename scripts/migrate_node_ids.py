@@ -0,0 +1,392 @@
+#!/usr/bin/env python3
+"""
+Convert a database created with VARCHAR node ids to BIGINT node ids,
+and VARCHAR port numbers to SMALLINT.
+
+Node ids used to be stored as the decimal string of the node number, and
+``mesh_packet_metrics.portnum`` as the port's name.  init.sql now creates
+them as BIGINT and SMALLINT, with the names in ``port_names``, but it
+can't change the columns of an existing volume.  This script does that,
+against DATABASE_URL, from the repo root:
+
+    python3 scripts/migrate_node_ids.py status
+    python3 scripts/migrate_node_ids.py backfill     # exporter still running
+    python3 scripts/migrate_node_ids.py switch       # exporter stopped
+    python3 scripts/migrate_node_ids.py drop-old     # once you're happy
+
+``backfill`` is the online part.  It fills ``port_names`` from the
+protobufs, then for every hypertable it creates a copy
+``<table>_bigint`` with the new column types and the same indexes, and
+copies the rows
+into it one ``--window`` at a time, committing after each window, while
+the old exporter keeps writing to the original.  Progress is kept in
+``node_id_migration``, so it can be stopped and re-run; each run copies
+up to the time it started.
+
+``switch`` needs the old exporter stopped (it can't write BIGINT ids and
+the new one can't write VARCHAR ones).  It refuses to run while
+``<table>_varchar`` tables from an earlier migration are still there.
+In one transaction it copies the
+rows that arrived since the backfill, re-copying the last ``--recheck``
+so rows replayed late from the spool aren't missed, converts the small
+state tables in place, and swaps the tables: ``<table>`` becomes
+``<table>_varchar`` and ``<table>_bigint`` becomes ``<table>``.  The new
+exporter can be started as soon as that commits.  The script then
+re-applies init.sql, which recreates the continuous aggregates and the
+policies on the new tables.
+
+The aggregates are rebuilt from the raw rows, which are kept 30 days.
+Rollup rows older than that in the hourly and daily tiers are lost, so
+migrate when upgrading, before the tiers hold more history than the raw
+tables.
+
+The ``<table>_varchar`` tables keep their retention policies and age
+out on their own; ``drop-old`` drops them right away.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import re
+import sys
+import time
+from datetime import timedelta
+from pathlib import Path
+
+import psycopg
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from exporter import enums  # noqa: E402
+from exporter.db_handler import upsert_port_names  # noqa: E402
+
+INIT_SQL = Path(__file__).resolve().parent.parent / "docker/timescaledb/init.sql"
+
+# Hypertables and their columns that used to be VARCHAR, copied by
+# ``backfill``.
+HYPERTABLES = {
+    "device_metrics": ("node_id",),
+    "environment_metrics": ("node_id",),
+    "air_quality_metrics": ("node_id",),
+    "power_metrics": ("node_id",),
+    "pax_counter_metrics": ("node_id",),
+    "mesh_packet_metrics": ("source_id", "destination_id", "portnum"),
+    "local_stats": ("node_id",),
+    "node_position_metrics": ("node_id",),
+}
+
+# Plain tables, converted in place by ``switch``.
+STATE_TABLES = {
+    "node_details": ("node_id",),
+    "node_neighbors": ("node_id", "neighbor_id"),
+    "node_configurations": ("node_id",),
+    "node_latest": ("node_id",),
+}
+
+# Converted columns that aren't node ids: (type, value from the old column).
+CONVERSIONS = {
+    "portnum": (
+        "SMALLINT",
+        "(SELECT p.portnum FROM port_names p WHERE p.name = {column})",
+    ),
+}
+
+PROGRESS_TABLE = "node_id_migration"
+
+
+def varchar_columns(conn, tables: dict) -> dict:
+    """The node id columns of ``tables`` that are still VARCHAR."""
+    rows = conn.execute(
+        "SELECT table_name, column_name FROM information_schema.columns "
+        "WHERE table_schema = current_schema() AND table_name = ANY(%s) "
+        "AND data_type = 'character varying'",
+        (list(tables),),
+    ).fetchall()
+    pending = {}
+    for table, column in rows:
+        if column in tables[table]:
+            pending.setdefault(table, []).append(column)
+    return pending
+
+
+def table_exists(conn, table: str) -> bool:
+    return conn.execute("SELECT to_regclass(%s) IS NOT NULL", (table,)).fetchone()[0]
+
+
+def columns_of(conn, table: str) -> list[str]:
+    return [
+        row[0]
+        for row in conn.execute(
+            "SELECT column_name FROM information_schema.columns "
+            "WHERE table_schema = current_schema() AND table_name = %s "
+            "ORDER BY ordinal_position",
+            (table,),
+        )
+    ]
+
+
+def indexes_of(conn, table: str) -> list[tuple[str, str]]:
+    return conn.execute(
+        "SELECT indexname, indexdef FROM pg_indexes "
+        "WHERE schemaname = current_schema() AND tablename = %s",
+        (table,),
+    ).fetchall()
+
+
+def column_type(column: str) -> str:
+    return CONVERSIONS[column][0] if column in CONVERSIONS else "BIGINT"
+
+
+def converted(table: str, column: str) -> str:
+    """SQL converting ``column`` of a ``table`` row to its new type."""
+    if column in CONVERSIONS:
+        return CONVERSIONS[column][1].format(column=f"{table}.{column}")
+    return f"{column}::bigint"
+
+
+def copy_sql(table: str, shadow: str, columns: list[str], ids) -> str:
+    """INSERT ... SELECT of one time range from ``table`` into ``shadow``."""
+    names = ", ".join(columns)
+    values = ", ".join(converted(table, c) if c in ids else c for c in columns)
+    return (
+        f"INSERT INTO {shadow} ({names}) SELECT {values} FROM {table} "
+        "WHERE time >= %s AND time < %s"
+    )
+
+
+def create_shadow(conn, table: str, ids) -> str:
+    """Create ``<table>_bigint`` with the new types of the ``ids`` columns
+    and ``table``'s indexes."""
+    shadow = f"{table}_bigint"
+    if table_exists(conn, shadow):
+        return shadow
+    conn.execute(f"CREATE TABLE {shadow} (LIKE {table} INCLUDING DEFAULTS)")
+    for column in ids:
+        # The shadow is empty; USING can't hold the port_names subquery.
+        conn.execute(
+            f"ALTER TABLE {shadow} ALTER COLUMN {column} "
+            f"TYPE {column_type(column)} USING NULL"
+        )
+    conn.execute(
+        "SELECT create_hypertable(%s, 'time', chunk_time_interval => INTERVAL '1 day')",
+        (shadow,),
+    )
+    for name, definition in indexes_of(conn, table):
+        if name == f"{table}_time_idx":
+            continue  # create_hypertable made the shadow's own
+        definition = definition.replace(
+            f"INDEX {name} ON ", f"INDEX {name.replace(table, shadow, 1)} ON ", 1
+        )
+        conn.execute(re.sub(rf"\b{table}\b", shadow, definition, count=1))
+    return shadow
+
+
+def backfill(conn, window: float):
+    conn.execute(
+        f"CREATE TABLE IF NOT EXISTS {PROGRESS_TABLE} "
+        "(table_name TEXT PRIMARY KEY, copied_until TIMESTAMPTZ NOT NULL)"
+    )
+    with conn.cursor() as cur:
+        cur.execute(
+            "CREATE TABLE IF NOT EXISTS port_names "
+            "(portnum SMALLINT PRIMARY KEY, name VARCHAR NOT NULL)"
+        )
+        upsert_port_names(cur, enums.numbers(enums.PORT_NAMES))
+    conn.commit()
+    until = conn.execute("SELECT NOW()").fetchone()[0]
+    for table, ids in varchar_columns(conn, HYPERTABLES).items():
+        shadow = create_shadow(conn, table, ids)
+        row = conn.execute(
+            f"SELECT copied_until FROM {PROGRESS_TABLE} WHERE table_name = %s",
+            (table,),
+        ).fetchone()
+        if row is None:
+            row = conn.execute(
+                f"INSERT INTO {PROGRESS_TABLE} "
+                f"SELECT %s, COALESCE(MIN(time), NOW()) FROM {table} "
+                "RETURNING copied_until",
+                (table,),
+            ).fetchone()
+        start = row[0]
+        conn.commit()
+        sql = copy_sql(table, shadow, columns_of(conn, table), ids)
+        copied = 0
+        started = time.perf_counter()
+        while start < until:
+            end = min(start + timedelta(hours=window), until)
+            with conn.transaction():
+                copied += conn.execute(sql, (start, end)).rowcount
+                conn.execute(
+                    f"INSERT INTO {PROGRESS_TABLE} VALUES (%s, %s) "
+                    "ON CONFLICT (table_name) DO UPDATE "
+                    "SET copied_until = EXCLUDED.copied_until",
+                    (table, end),
+                )
+            start = end
+        print(
+            f"{table}: copied {copied} rows into {shadow} "
+            f"in {time.perf_counter() - started:.1f}s"
+        )
+
+
+def switch(conn, recheck: float):
+    hypertables = varchar_columns(conn, HYPERTABLES)
+    state = varchar_columns(conn, STATE_TABLES)
+    if not hypertables and not state:
+        print("node ids are already BIGINT and port numbers SMALLINT")
+        return
+    leftover = [t for t in hypertables if table_exists(conn, f"{t}_varchar")]
+    if leftover:
+        sys.exit(
+            "run drop-old first; still there: "
+            + ", ".join(f"{t}_varchar" for t in leftover)
+        )
+    progress = {}
+    if table_exists(conn, PROGRESS_TABLE):
+        progress = dict(conn.execute(f"SELECT * FROM {PROGRESS_TABLE}").fetchall())
+    missing = [t for t in hypertables if t not in progress]
+    if missing:
+        sys.exit(f"run backfill first; not copied yet: {', '.join(missing)}")
+    conn.commit()
+
+    started = time.perf_counter()
+    with conn.transaction():
+        for table in list(hypertables) + list(state):
+            conn.execute(f"LOCK TABLE {table} IN SHARE ROW EXCLUSIVE MODE")
+        for table, ids in hypertables.items():
+            shadow = f"{table}_bigint"
+            since = progress[table] - timedelta(hours=recheck)
+            conn.execute(f"DELETE FROM {shadow} WHERE time >= %s", (since,))
+            tail = conn.execute(
+                copy_sql(table, shadow, columns_of(conn, table), ids),
+                (since, "infinity"),
+            ).rowcount
+            print(f"{table}: copied {tail} rows since {since:%Y-%m-%d %H:%M}")
+
+        # Everything that reads the old columns is recreated by init.sql.
+        for (view,) in conn.execute(
+            "SELECT view_name FROM timescaledb_information.continuous_aggregates "
+            "WHERE hypertable_name = ANY(%s)",
+            (list(hypertables),),
+        ).fetchall():
+            conn.execute(f"DROP MATERIALIZED VIEW {view}")
+        conn.execute("DROP VIEW IF EXISTS node_telemetry, mesh_packets")
+
+        if state:
+            foreign_keys = conn.execute(
+                "SELECT conname FROM pg_constraint "
+                "WHERE conrelid = 'node_neighbors'::regclass AND contype = 'f'"
+            ).fetchall()
+            for (name,) in foreign_keys:
+                conn.execute(f"ALTER TABLE node_neighbors DROP CONSTRAINT {name}")
+            for table, ids in state.items():
+                conn.execute(
+                    f"ALTER TABLE {table} "
+                    + ", ".join(
+                        f"ALTER COLUMN {c} TYPE BIGINT USING {c}::bigint" for c in ids
+                    )
+                )
+            conn.execute(
+                "ALTER TABLE node_neighbors "
+                "ADD FOREIGN KEY (node_id) REFERENCES node_details (node_id), "
+                "ADD FOREIGN KEY (neighbor_id) REFERENCES node_details (node_id)"
+            )
+
+        for table in hypertables:
+            rename(conn, table, f"{table}_varchar")
+            rename(conn, f"{table}_bigint", table)
+        conn.execute(f"DROP TABLE IF EXISTS {PROGRESS_TABLE}")
+    print(f"switched in {time.perf_counter() - started:.1f}s; start the exporter")
+
+    started = time.perf_counter()
+    apply_init_sql(conn)
+    print(f"re-applied init.sql in {time.perf_counter() - started:.1f}s")
+
+
+def rename(conn, table: str, new: str):
+    """Rename ``table`` and the indexes named after it."""
+    for name, _ in indexes_of(conn, table):
+        if table in name:
+            conn.execute(f"ALTER INDEX {name} RENAME TO {name.replace(table, new, 1)}")
+    conn.execute(f"ALTER TABLE {table} RENAME TO {new}")
+
+
+def split_statements(sql: str) -> list[str]:
+    """Split init.sql into statements.  Dollar-quoted bodies can hold
+    semicolons; comment lines are dropped."""
+    statements, current, quoted = [], [], False
+    for line in sql.splitlines():
+        if not quoted and line.lstrip().startswith("--"):
+            continue
+        current.append(line)
+        quoted ^= line.count("$$") % 2 == 1
+        if not quoted and line.rstrip().endswith(";"):
+            statements.append("\n".join(current).strip())
+            current = []
+    if "\n".join(current).strip():
+        statements.append("\n".join(current).strip())
+    return statements
+
+
+def apply_init_sql(conn):
+    # Continuous aggregates can't be created inside a transaction block.
+    conn.autocommit = True
+    for statement in split_statements(INIT_SQL.read_text()):
+        conn.execute(statement)
+    conn.autocommit = False
+
+
+def drop_old(conn):
+    for table in HYPERTABLES:
+        if table_exists(conn, f"{table}_varchar"):
+            conn.execute(f"DROP TABLE {table}_varchar")
+            print(f"dropped {table}_varchar")
+    conn.commit()
+
+
+def status(conn):
+    for tables in (STATE_TABLES, HYPERTABLES):
+        pending = varchar_columns(conn, tables)
+        for table in tables:
+            state = (
+                "VARCHAR " + ", ".join(pending[table]) if table in pending else "done"
+            )
+            if table_exists(conn, f"{table}_bigint"):
+                state += ", backfilling"
+            print(f"{table}: {state}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("command", choices=["status", "backfill", "switch", "drop-old"])
+    parser.add_argument(
+        "--window",
+        type=float,
+        default=24,
+        help="hours of rows copied per backfill transaction (default 24)",
+    )
+    parser.add_argument(
+        "--recheck",
+        type=float,
+        default=24,
+        help="hours before the backfill mark re-copied by switch (default 24)",
+    )
+    return parser.parse_args(argv)
+
+
+def run(argv=None):
+    args = parse_args(argv)
+    with psycopg.connect(os.environ["DATABASE_URL"]) as conn:
+        if args.command == "status":
+            status(conn)
+        elif args.command == "backfill":
+            backfill(conn, args.window)
+        elif args.command == "switch":
+            switch(conn, args.recheck)
+        else:
+            drop_old(conn)
+
+
+if __name__ == "__main__":
+    run()
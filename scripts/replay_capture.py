@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Replay a raw MQTT capture through the exporter, with no broker.
+
+Record a capture by running the exporter with CAPTURE_FILE set.  Then
+replay it against the database in DATABASE_URL, from the repo root:
+
+    python3 scripts/replay_capture.py capture.bin [capture.bin.1 ...]
+    python3 scripts/replay_capture.py capture.bin --speed 10
+
+Every record is fed to main.handle_message, so it takes the same ingest
+pipeline, MessageProcessor and batch writer path as live traffic, with
+the same .env settings.  By default records are replayed as fast as the
+pipeline accepts them.  --speed N keeps the captured inter-arrival gaps
+divided by N.  When the run ends the pipeline is drained and the writer
+flushed, and the script prints throughput and per-stage timings.
+
+Replayed packets carry the gateways' rx_time from when they were
+captured, so ingest lag is not tracked during a replay and nothing is
+written to ingest_lag.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import os
+import resource
+import sys
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from dotenv import load_dotenv  # noqa: E402
+from psycopg_pool import ConnectionPool  # noqa: E402
+
+import main  # noqa: E402
+from exporter.capture import read_capture  # noqa: E402
+
+
+def replay(paths: list[str], speed: float, limit: int) -> int:
+    count = 0
+    first_at = None
+    started = time.perf_counter()
+    for path in paths:
+        for received_at, topic, payload in read_capture(path):
+            if limit and count >= limit:
+                return count
+            if speed > 0:
+                if first_at is None:
+                    first_at = received_at
+                due = (received_at - first_at) / speed
+                delay = due - (time.perf_counter() - started)
+                if delay > 0:
+                    time.sleep(delay)
+            main.handle_message(
+                None, None, SimpleNamespace(topic=topic, payload=payload)
+            )
+            count += 1
+    return count
+
+
+def summarize(count: int, elapsed: float) -> dict:
+    stages = {}
+    for name, stats in main.pipeline.stats().items():
+        handled = stats["dequeued_total"] or 1
+        stages[name] = {
+            "handled": stats["dequeued_total"],
+            "failed": stats["failed_total"],
+            "busy_seconds": stats["busy_seconds_total"],
+            "blocked_seconds": stats["blocked_seconds_total"],
+            "avg_ms": round(stats["busy_seconds_total"] / handled * 1000, 4),
+        }
+    summary = {
+        "messages": count,
+        "elapsed_seconds": round(elapsed, 3),
+        "messages_per_sec": round(count / elapsed, 1) if elapsed else None,
+        "stages": stages,
+        "dedup": main.deduplicator.stats(),
+        "unit_of_work": main.processor.unit_of_work_stats(),
+        "admission": main.admission.stats(),
+        # ru_maxrss is in KiB on Linux.
+        "max_rss_mb": round(
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1
+        ),
+    }
+    if main.writer is not None:
+        summary["db_writer"] = main.writer.stats()
+    return summary
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("captures", nargs="+", help="capture files, oldest first")
+    parser.add_argument(
+        "--speed",
+        type=float,
+        default=0,
+        help="replay at N times the captured rate (default: as fast as possible)",
+    )
+    parser.add_argument("--limit", type=int, default=0, help="stop after N records")
+    parser.add_argument("--json", action="store_true", help="print the summary as JSON")
+    return parser.parse_args(argv)
+
+
+def ingest(feed) -> dict:
+    """Start the exporter on DATABASE_URL, run ``feed()`` (which returns the
+    number of messages it handed to main.handle_message), drain, and
+    return the summary.  The fed traffic is not live, so its lag is not
+    tracked."""
+    load_dotenv()
+    logging.basicConfig(
+        level=getattr(logging, os.getenv("LOG_LEVEL", "WARNING").upper(), logging.INFO),
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+    pool = ConnectionPool(os.getenv("DATABASE_URL"), max_size=100)
+    main.start_ingest(pool, track_lag=False)
+    started = time.perf_counter()
+    count = 0
+    try:
+        count = feed()
+    finally:
+        main.stop_ingest()
+        elapsed = time.perf_counter() - started
+        pool.close()
+    return summarize(count, elapsed)
+
+
+def run(argv: list[str] | None = None) -> dict:
+    args = parse_args(argv)
+    summary = ingest(lambda: replay(args.captures, args.speed, args.limit))
+    print_summary(summary, args.json)
+    return summary
+
+
+def print_summary(summary: dict, as_json: bool = False):
+    if as_json:
+        print(json.dumps(summary, indent=2))
+    else:
+        print(
+            f"ingested {summary['messages']} messages in "
+            f"{summary['elapsed_seconds']}s ({summary['messages_per_sec']} msg/s)"
+        )
+        uow = summary["unit_of_work"]
+        print(
+            f"stored {uow['packets_total']} packets, "
+            f"{uow['statements_per_packet']} statements / "
+            f"{uow['round_trips_per_packet']} round trips per packet"
+        )
+        for name, stage in summary["stages"].items():
+            print(
+                f"  {name:8s} handled {stage['handled']:>8}  "
+                f"avg {stage['avg_ms']:.3f} ms  busy {stage['busy_seconds']:.2f}s  "
+                f"blocked {stage['blocked_seconds']:.2f}s  failed {stage['failed']}"
+            )
+        print(f"peak RSS {summary['max_rss_mb']} MB")
+
+
+if __name__ == "__main__":
+    run()
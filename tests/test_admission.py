@@ -0,0 +1,131 @@
+"""Unit tests for `exporter.admission` — shedding levels, hysteresis and
+which ports may be shed."""
+
+import pytest
+
+try:
+    from meshtastic.portnums_pb2 import PortNum
+except ImportError:
+    try:
+        from meshtastic.protobuf.portnums_pb2 import PortNum
+    except ImportError:
+        pytest.skip("meshtastic protobuf modules unavailable", allow_module_level=True)
+
+from exporter.admission import (
+    NORMAL,
+    SHED_LOW_PRIORITY,
+    SHED_PACKET_ROWS,
+    AdmissionController,
+)
+from exporter.processor.processors import ProcessorRegistry
+
+
+class FakeLoad:
+    def __init__(self):
+        self.value = 0.0
+
+    def __call__(self):
+        return self.value
+
+
+def _controller(load, **kwargs):
+    return AdmissionController(
+        load, ProcessorRegistry.sheddable_ports(), check_interval=0, **kwargs
+    )
+
+
+def test_sheddable_ports_are_the_ones_nothing_is_stored_for():
+    ports = ProcessorRegistry.sheddable_ports()
+    assert PortNum.TEXT_MESSAGE_COMPRESSED_APP in ports
+    assert PortNum.TRACEROUTE_APP in ports
+    assert PortNum.TELEMETRY_APP not in ports
+    assert PortNum.NEIGHBORINFO_APP not in ports
+
+
+def test_levels_follow_load_with_hysteresis():
+    load = FakeLoad()
+    controller = _controller(load)
+    assert controller.level == NORMAL
+
+    load.value = 0.6
+    assert controller.level == SHED_LOW_PRIORITY
+    load.value = 0.9
+    assert controller.level == SHED_PACKET_ROWS
+
+    # Below the 0.8 watermark but above 0.8 * 0.5: stays put.
+    load.value = 0.45
+    assert controller.level == SHED_PACKET_ROWS
+    load.value = 0.3
+    assert controller.level == SHED_LOW_PRIORITY
+    load.value = 0.2
+    assert controller.level == NORMAL
+    assert controller.stats()["transitions_total"] == 4
+
+
+def test_recovery_skips_straight_to_normal_when_idle():
+    load = FakeLoad()
+    controller = _controller(load)
+    load.value = 1.0
+    assert controller.level == SHED_PACKET_ROWS
+    load.value = 0.0
+    assert controller.level == NORMAL
+
+
+def test_a_zero_watermark_disables_its_level():
+    load = FakeLoad()
+    controller = _controller(load, shed_at=0)
+    load.value = 0.6
+    assert controller.level == NORMAL
+    load.value = 0.9
+    assert controller.level == SHED_PACKET_ROWS
+
+
+def test_low_priority_ports_are_shed_and_counted():
+    load = FakeLoad()
+    controller = _controller(load)
+    assert controller.admit(PortNum.TRACEROUTE_APP)
+
+    load.value = 0.6
+    assert not controller.admit(PortNum.TRACEROUTE_APP)
+    assert controller.admit(PortNum.TELEMETRY_APP)
+    assert controller.admit(PortNum.NEIGHBORINFO_APP)
+    assert controller.store_packet_row(PortNum.NEIGHBORINFO_APP)
+
+    stats = controller.stats()
+    assert stats["TRACEROUTE_APP"]["shed_packets_total"] == 1
+    assert "TELEMETRY_APP" not in stats
+
+
+def test_packet_rows_are_shed_for_everything_but_telemetry():
+    load = FakeLoad()
+    controller = _controller(load)
+    load.value = 0.95
+    assert controller.store_packet_row(PortNum.TELEMETRY_APP)
+    assert not controller.store_packet_row(PortNum.POSITION_APP)
+    assert not controller.store_packet_row(PortNum.NEIGHBORINFO_APP)
+    # Protected ports are still admitted.
+    assert controller.admit(PortNum.POSITION_APP)
+    assert controller.admit(PortNum.NODEINFO_APP)
+    assert controller.stats()["POSITION_APP"]["shed_packet_rows_total"] == 1
+
+
+def test_position_and_nodeinfo_are_admitted_without_their_packet_rows():
+    """Deliberate: only telemetry keeps its mesh_packet_metrics row at
+    SHED_PACKET_ROWS, the other protected ports only keep their payload."""
+    load = FakeLoad()
+    controller = _controller(load)
+    load.value = 0.95
+    for port in (PortNum.POSITION_APP, PortNum.NODEINFO_APP):
+        assert controller.admit(port)
+        assert not controller.store_packet_row(port)
+    stats = controller.stats()
+    assert stats["NODEINFO_APP"]["shed_packet_rows_total"] == 1
+    assert stats["NODEINFO_APP"]["shed_packets_total"] == 0
+
+
+def test_a_failing_load_probe_keeps_the_current_level():
+    def load():
+        raise RuntimeError("queue gone")
+
+    controller = _controller(load)
+    assert controller.level == NORMAL
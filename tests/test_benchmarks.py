@@ -0,0 +1,26 @@
+"""The micro-benchmark runner: every case must run against the stub pool,
+and the comparison must flag slowdowns past the margin only."""
+
+import pytest
+
+pytest.importorskip("meshtastic")
+
+from benchmarks.run import CASES, compare
+
+
+@pytest.mark.parametrize("name", sorted(CASES))
+def test_case_runs(name):
+    CASES[name]()()
+
+
+def test_compare_flags_only_cases_past_the_margin():
+    baseline = {"fast": 100.0, "slow": 100.0}
+    results = {"fast": 120.0, "slow": 130.0, "unbaselined": 5.0}
+    regressions = compare(results, baseline, 0.25)
+    assert len(regressions) == 1
+    assert regressions[0].startswith("slow:")
+
+
+def test_compare_margin_is_configurable():
+    assert compare({"a": 120.0}, {"a": 100.0}, 0.1)
+    assert not compare({"a": 120.0}, {"a": 100.0}, 0.5)
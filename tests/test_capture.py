@@ -0,0 +1,94 @@
+"""Unit tests for `exporter.capture` — the raw MQTT capture file."""
+
+import os
+
+import pytest
+
+from exporter.capture import MAGIC, CaptureWriter, read_capture
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / "cap.bin")
+    writer = CaptureWriter(path)
+    writer.write(1.5, "msh/test/2/e/LongFast/!aabbccdd", b"\x00\x01binary")
+    writer.write(2.25, "msh/test/2/stat/!aabbccdd", b"online")
+    writer.close()
+
+    assert list(read_capture(path)) == [
+        (1.5, "msh/test/2/e/LongFast/!aabbccdd", b"\x00\x01binary"),
+        (2.25, "msh/test/2/stat/!aabbccdd", b"online"),
+    ]
+    assert writer.stats()["records_total"] == 2
+
+
+def test_rotation_keeps_backup_count_files(tmp_path):
+    path = str(tmp_path / "cap.bin")
+    writer = CaptureWriter(path, max_bytes=200, backup_count=2)
+    for i in range(40):
+        writer.write(float(i), "t", b"x" * 20)
+    writer.close()
+
+    assert os.path.exists(path + ".1")
+    assert os.path.exists(path + ".2")
+    assert not os.path.exists(path + ".3")
+    assert writer.stats()["rotations_total"] > 2
+    records = [r for p in (path + ".2", path + ".1", path) for r in read_capture(p)]
+    times = [r[0] for r in records]
+    assert times == sorted(times)
+    assert times[-1] == 39.0
+
+
+def test_rotation_counts_topic_and_payload(tmp_path):
+    path = str(tmp_path / "cap.bin")
+    record = 14 + len("t") + 20
+    # Room for the second record's header but not for all of it.
+    writer = CaptureWriter(path, max_bytes=len(MAGIC) + 2 * record - 1, backup_count=1)
+    writer.write(1.0, "t", b"x" * 20)
+    writer.write(2.0, "t", b"x" * 20)
+    writer.close()
+
+    assert writer.stats()["rotations_total"] == 1
+    assert [r[0] for r in read_capture(path + ".1")] == [1.0]
+    assert [r[0] for r in read_capture(path)] == [2.0]
+    for p in (path, path + ".1"):
+        assert os.path.getsize(p) <= writer.max_bytes
+
+
+def test_oversized_record_does_not_rotate_an_empty_file(tmp_path):
+    path = str(tmp_path / "cap.bin")
+    writer = CaptureWriter(path, max_bytes=32)
+    writer.write(1.0, "t", b"x" * 100)
+    writer.close()
+
+    assert writer.stats()["rotations_total"] == 0
+    assert [r[0] for r in read_capture(path)] == [1.0]
+
+
+def test_truncated_record_ends_iteration(tmp_path):
+    path = str(tmp_path / "cap.bin")
+    writer = CaptureWriter(path)
+    writer.write(1.0, "t", b"complete")
+    writer.write(2.0, "t", b"cut off by a crash")
+    writer.close()
+    with open(path, "r+b") as f:
+        f.truncate(os.path.getsize(path) - 5)
+
+    assert [r[2] for r in read_capture(path)] == [b"complete"]
+
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / "not-a-capture"
+    path.write_bytes(b"hello")
+    with pytest.raises(ValueError):
+        list(read_capture(str(path)))
+
+
+def test_appends_to_existing_capture(tmp_path):
+    path = str(tmp_path / "cap.bin")
+    for i in range(2):
+        writer = CaptureWriter(path)
+        writer.write(float(i), "t", b"p")
+        writer.close()
+    with open(path, "rb") as f:
+        assert f.read(len(MAGIC)) == MAGIC
+    assert len(list(read_capture(path))) == 2
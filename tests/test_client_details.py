@@ -28,13 +28,13 @@ class TestClientDetails:
             assert ClientDetails.get_role_name_from_role(v.number) == v.name
 
     def test_default_constructor_uses_unknown_labels(self):
-        cd = ClientDetails(node_id="42")
+        cd = ClientDetails(node_id=42)
         assert cd.short_name == "Unknown"
         assert cd.long_name == "Unknown"
-        assert cd.node_id == "42"
+        assert cd.node_id == 42
 
     def test_to_dict_contains_expected_keys(self):
-        cd = ClientDetails(node_id="42")
+        cd = ClientDetails(node_id=42)
         d = cd.to_dict()
         assert set(d) == {
             "node_id",
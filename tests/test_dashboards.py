@@ -4,6 +4,7 @@ These run against the JSON files on disk — no Grafana required.
 """
 
 import json
+import re
 from pathlib import Path
 
 import pytest
@@ -98,3 +99,61 @@ def test_timeseries_use_timegroup_macro(path, doc):
                 f"uses time_bucket($__interval, ...) which Grafana cannot "
                 f"template against postgres; use $__timeGroupAlias instead"
             )
+
+
+def test_continuous_aggregates_exist_in_schema():
+    """Every continuous aggregate a panel reads must be created by
+    init.sql."""
+    init_sql = (
+        Path(__file__).resolve().parent.parent / "docker" / "timescaledb" / "init.sql"
+    ).read_text()
+    created = set(re.findall(r"CREATE MATERIALIZED VIEW IF NOT EXISTS (\w+)", init_sql))
+    assert created
+    for path, doc in _all_dashboards():
+        for panel in _walk(doc.get("panels", [])):
+            for tg in panel.get("targets", []) or []:
+                for view in re.findall(r"FROM (\w+_\d+[mhd])\b", tg.get("rawSql", "")):
+                    assert view in created, (
+                        f"{path.name} panel {panel.get('id')} reads {view}, "
+                        f"which init.sql doesn't create"
+                    )
+
+
+def test_tier_selection_matches_retention_policies():
+    """A tiered query may only pick a tier for ranges that tier still
+    holds, so its cut-offs must match the retention policies in init.sql."""
+    init_sql = (
+        Path(__file__).resolve().parent.parent / "docker" / "timescaledb" / "init.sql"
+    ).read_text()
+    retention = dict(
+        re.findall(r"add_retention_policy\('(\w+)',\s+INTERVAL '(\d+) days'", init_sql)
+    )
+    tiered = 0
+    for path, doc in _all_dashboards():
+        for panel in _walk(doc.get("panels", [])):
+            for tg in panel.get("targets", []) or []:
+                sql = tg.get("rawSql", "")
+                if ") tiers ORDER BY" not in sql:
+                    continue
+                tiered += 1
+                tables = re.findall(r"FROM (\w+) WHERE", sql)
+                assert len(tables) == 3, f"{path.name} panel {panel.get('id')}"
+                # The coarsest tier is the fallback and has no cut-off.
+                for table in tables[:-1]:
+                    cutoff = f"NOW() - INTERVAL '{retention[table]} days'"
+                    assert cutoff in sql, (
+                        f"{path.name} panel {panel.get('id')} doesn't limit "
+                        f"{table} to its {retention[table]}-day retention"
+                    )
+    assert tiered
+
+
+def test_node_ids_compare_as_numbers():
+    """Node ids are BIGINT; quoted literals like '4294967295' only work by
+    implicit coercion and hide type mistakes."""
+    for path, doc in _all_dashboards():
+        for panel in _walk(doc.get("panels", [])):
+            for tg in panel.get("targets", []) or []:
+                assert "'4294967295'" not in tg.get(
+                    "rawSql", ""
+                ), f"{path.name} panel {panel.get('id')} quotes a node id"
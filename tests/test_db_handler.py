@@ -5,9 +5,12 @@ require a running TimescaleDB. The intent is to pin down the SQL produced
 by each `store_*` helper.
 """
 
+import threading
 from unittest.mock import MagicMock
 
-from exporter.db_handler import DBHandler
+import pytest
+
+from exporter.db_handler import BatchWriter, DBHandler, UnitOfWork
 
 
 def _make_pool():
@@ -49,7 +52,7 @@ class TestDBHandlerWriteHelpers:
         h = DBHandler(pool)
 
         h.store_device_metrics(
-            "12345",
+            12345,
             {"battery_level": 80.0, "voltage": 4.2, "uptime_seconds": 3600},
         )
 
@@ -61,14 +64,14 @@ class TestDBHandlerWriteHelpers:
             assert col in sql
         # The placeholder count must equal the values count.
         assert sql.count("%s") == len(values)
-        assert "12345" in values
+        assert 12345 in values
         assert 80.0 in values
 
     def test_store_environment_metrics_skips_when_empty(self):
         pool, _, cur = _make_pool()
         h = DBHandler(pool)
 
-        h.store_environment_metrics("99", {})
+        h.store_environment_metrics(99, {})
 
         # No SQL should have run because there were no metrics.
         cur.execute.assert_not_called()
@@ -78,7 +81,7 @@ class TestDBHandlerWriteHelpers:
         h = DBHandler(pool)
 
         h.store_pax_counter_metrics(
-            "11", {"wifi_stations": 5, "ble_beacons": 7, "uptime": 600}
+            11, {"wifi_stations": 5, "ble_beacons": 7, "uptime": 600}
         )
 
         sql = _last_sql(cur)
@@ -96,9 +99,9 @@ class TestDBHandlerWriteHelpers:
         h = DBHandler(pool)
 
         h.store_mesh_packet_metrics(
-            "11",
-            "22",
-            {"portnum": "TELEMETRY_APP", "packet_id": 123, "channel": 0},
+            11,
+            22,
+            {"portnum": 67, "packet_id": 123, "channel": 0},
         )
 
         executed = [c.args[0] for c in cur.execute.call_args_list]
@@ -112,9 +115,9 @@ class TestDBHandlerWriteHelpers:
         cur.fetchone.side_effect = [None, None]
         h = DBHandler(pool)
         h.store_mesh_packet_metrics(
-            "11",
-            "4294967295",
-            {"portnum": "POSITION_APP"},
+            11,
+            4294967295,
+            {"portnum": 3},
         )
         broadcast_inserts = [
             c
@@ -123,3 +126,296 @@ class TestDBHandlerWriteHelpers:
             and "Broadcast" in (c.args[1] or ())
         ]
         assert broadcast_inserts, "broadcast destination should be tagged Broadcast"
+
+    def test_telemetry_updates_node_latest_family_columns(self):
+        pool, _, _ = _make_pool()
+        node_latest = MagicMock()
+        writer = BatchWriter(pool, batch_size=1)
+        h = DBHandler(pool, writer=writer, node_latest=node_latest)
+
+        h.store_power_metrics(11, {"ch1_voltage": 5.1})
+
+        (node_id, columns), kwargs = node_latest.update.call_args
+        assert node_id == 11
+        assert set(columns) == {"power_time", "ch1_voltage"}
+        assert kwargs == {"touch": False}
+
+    def test_node_latest_keeps_last_known_values_for_unset_fields(self):
+        pool, _, _ = _make_pool()
+        node_latest = MagicMock()
+        h = DBHandler(pool, node_latest=node_latest)
+
+        h.store_device_metrics(11, {"battery_level": 80, "voltage": None})
+
+        (_, columns), _ = node_latest.update.call_args
+        assert set(columns) == {"device_time", "battery_level"}
+
+    def test_node_latest_waits_for_the_batch_to_commit(self):
+        pool, _, cur = _make_pool()
+        node_latest = MagicMock()
+        writer = BatchWriter(pool, batch_size=2)
+        h = DBHandler(pool, writer=writer, node_latest=node_latest)
+
+        h.store_device_metrics(11, {"battery_level": 80})
+        node_latest.update.assert_not_called()
+
+        cur.copy.side_effect = RuntimeError("db down")
+        h.store_device_metrics(12, {"battery_level": 70})
+        node_latest.update.assert_not_called()
+
+        cur.copy.side_effect = None
+        h.store_device_metrics(13, {"battery_level": 60})
+        writer.close()
+        assert [c.args[0] for c in node_latest.update.call_args_list] == [13]
+
+    def test_node_latest_waits_for_the_unit_of_work_to_commit(self):
+        pool, _, _ = _make_pool()
+        node_latest = MagicMock()
+        h = DBHandler(pool, node_latest=node_latest)
+
+        with pytest.raises(RuntimeError):
+            with UnitOfWork(pool) as uow:
+                h.store_device_metrics(11, {"battery_level": 80}, uow=uow)
+                raise RuntimeError("processor failed")
+        node_latest.update.assert_not_called()
+
+        with UnitOfWork(pool) as uow:
+            h.store_device_metrics(12, {"battery_level": 70}, uow=uow)
+            node_latest.update.assert_not_called()
+        assert node_latest.update.call_args.args[0] == 12
+
+    def test_node_latest_skips_tables_outside_its_families(self):
+        pool, _, cur = _make_pool()
+        node_latest = MagicMock()
+        h = DBHandler(pool, writer=MagicMock(), node_latest=node_latest)
+
+        h.store_pax_counter_metrics(11, {"wifi_stations": 5})
+
+        node_latest.update.assert_not_called()
+
+    def test_node_latest_is_left_alone_without_its_writer(self):
+        pool, _, cur = _make_pool()
+        h = DBHandler(pool)
+
+        h.store_device_metrics(12345, {"battery_level": 80.0})
+
+        assert cur.execute.call_count == 1
+        assert "INSERT INTO device_metrics" in _last_sql(cur)
+
+    def test_store_port_names_upserts_in_one_statement(self):
+        pool, conn, cur = _make_pool()
+        h = DBHandler(pool)
+
+        assert h.store_port_names({1: "TEXT_MESSAGE_APP", 3: "POSITION_APP"}) == 2
+
+        assert cur.execute.call_count == 1
+        assert "ON CONFLICT (portnum) DO UPDATE" in _last_sql(cur)
+        assert _last_values(cur) == ([1, 3], ["TEXT_MESSAGE_APP", "POSITION_APP"])
+        conn.commit.assert_called_once()
+
+
+class TestDBHandlerDedup:
+    def test_claim_message_keys_on_sender_and_id(self):
+        pool, conn, cur = _make_pool()
+        cur.fetchall = MagicMock(return_value=[(5,), (6,)])
+        h = DBHandler(pool)
+
+        assert h.claim_message(11, 123) is True
+        sql = _last_sql(cur)
+        assert "INSERT INTO packet_dedup" in sql
+        assert "ON CONFLICT DO NOTHING RETURNING" in sql
+        assert "s % 3" in sql % _last_values(cur)  # a bare % breaks psycopg
+        assert _last_values(cur) == (11, 123)
+        conn.commit.assert_called_once()
+
+    def test_claim_message_returns_false_when_already_claimed(self):
+        pool, _, cur = _make_pool()
+        cur.fetchall = MagicMock(return_value=[])
+        h = DBHandler(pool)
+        assert h.claim_message(11, 123) is False
+
+    def test_claim_message_in_the_next_slot_is_a_duplicate(self):
+        """The previous slot's claim already holds this slot's row."""
+        pool, _, cur = _make_pool()
+        cur.fetchall = MagicMock(return_value=[(7,)])
+        h = DBHandler(pool)
+        assert h.claim_message(11, 123) is False
+
+
+def _copied_rows(cursor):
+    copy = cursor.copy.return_value.__enter__.return_value
+    return [c.args[0] for c in copy.write_row.call_args_list]
+
+
+class TestBatchWriter:
+    def test_rows_are_buffered_until_batch_fills(self):
+        pool, conn, cur = _make_pool()
+        writer = BatchWriter(pool, batch_size=3)
+        h = DBHandler(pool, writer)
+
+        h.store_device_metrics(1, {"battery_level": 80.0})
+        h.store_device_metrics(2, {"battery_level": 70.0})
+        cur.copy.assert_not_called()
+
+        h.store_device_metrics(3, {"battery_level": 60.0})
+
+        sql = cur.copy.call_args.args[0]
+        assert sql == "COPY device_metrics (time, node_id, battery_level) FROM STDIN"
+        rows = _copied_rows(cur)
+        assert [r[1] for r in rows] == [1, 2, 3]
+        conn.commit.assert_called_once()
+        assert writer.stats()["device_metrics"]["rows_total"] == 3
+
+    def test_different_column_sets_are_batched_separately(self):
+        pool, _, cur = _make_pool()
+        writer = BatchWriter(pool, batch_size=10)
+        h = DBHandler(pool, writer)
+
+        h.store_device_metrics(1, {"battery_level": 80.0})
+        h.store_device_metrics(1, {"uptime_seconds": 60})
+        writer.close()
+
+        assert cur.copy.call_count == 2
+
+    def test_close_flushes_partial_batches(self):
+        pool, _, cur = _make_pool()
+        writer = BatchWriter(pool, batch_size=100)
+        DBHandler(pool, writer).store_pax_counter_metrics(1, {"wifi_stations": 2})
+
+        writer.close()
+
+        assert len(_copied_rows(cur)) == 1
+        assert writer.stats()["pending"] == 0
+
+    def test_flush_older_than_keeps_fresh_batches(self):
+        pool, _, cur = _make_pool()
+        writer = BatchWriter(pool, batch_size=100)
+        DBHandler(pool, writer).store_power_metrics(1, {"ch1_voltage": 5.0})
+
+        writer.flush(older_than=60)
+        cur.copy.assert_not_called()
+        writer.flush(older_than=0)
+        cur.copy.assert_called_once()
+
+    def test_max_pending_forces_synchronous_flush(self):
+        pool, _, cur = _make_pool()
+        writer = BatchWriter(pool, batch_size=5, max_pending=5)
+        h = DBHandler(pool, writer)
+        for i in range(3):
+            h.store_device_metrics(str(i), {"voltage": 4.0})
+            h.store_power_metrics(str(i), {"ch1_voltage": 5.0})
+
+        assert cur.copy.call_count == 2
+        assert writer.stats()["pending"] == 1
+
+    def test_started_writer_flushes_on_its_own_thread(self):
+        pool, _, cur = _make_pool()
+        flushed_on = []
+        done = threading.Event()
+
+        def record(*args):
+            flushed_on.append(threading.current_thread().name)
+            done.set()
+            return MagicMock()
+
+        cur.copy.side_effect = record
+        writer = BatchWriter(pool, batch_size=2, max_delay=60)
+        writer.start()
+        h = DBHandler(pool, writer)
+        h.store_device_metrics(1, {"voltage": 4.0})
+        h.store_device_metrics(2, {"voltage": 4.1})
+
+        assert done.wait(5)
+        writer.close()
+        assert flushed_on == ["db-batch-writer"]
+
+    def test_mesh_packet_flush_ensures_nodes_in_one_statement(self):
+        pool, _, cur = _make_pool()
+        writer = BatchWriter(pool, batch_size=2)
+        h = DBHandler(pool, writer)
+
+        h.store_mesh_packet_metrics(11, 4294967295, {"portnum": 3})
+        h.store_mesh_packet_metrics(22, 11, {"portnum": 67})
+
+        assert cur.execute.call_count == 1
+        sql = _last_sql(cur)
+        ids, short_names, _, hardware, _ = _last_values(cur)
+        assert "INSERT INTO node_details" in sql and "unnest" in sql
+        assert ids == [11, 22, 4294967295]
+        assert short_names[ids.index(4294967295)] == "Broadcast"
+        assert hardware[ids.index(11)] is None
+        assert "COPY mesh_packet_metrics" in cur.copy.call_args.args[0]
+
+    def test_failed_flush_is_counted_and_dropped(self):
+        pool, _, cur = _make_pool()
+        cur.copy.side_effect = RuntimeError("db down")
+        writer = BatchWriter(pool, batch_size=1)
+
+        DBHandler(pool, writer).store_device_metrics(1, {"voltage": 4.0})
+
+        stats = writer.stats()
+        assert stats["device_metrics"]["failed_rows_total"] == 1
+        assert stats["pending"] == 0
+
+
+class TestUnitOfWork:
+    def test_statements_share_one_connection_and_commit(self):
+        pool, conn, cur = _make_pool()
+        h = DBHandler(pool)
+
+        with UnitOfWork(pool) as uow:
+            h.store_device_metrics(1, {"voltage": 4.0}, uow=uow)
+            h.store_mesh_packet_metrics(1, 2, {"portnum": 1}, uow=uow)
+            h.execute_db_operation(
+                lambda c, cn: (c.execute("UPDATE node_details SET x = 1"), cn.commit()),
+                uow,
+            )
+
+        pool.connection.assert_called_once()
+        conn.pipeline.assert_called_once()
+        conn.commit.assert_called_once()
+        assert uow.statements == 4
+        assert uow.round_trips == 1
+
+    def test_reads_count_as_round_trips(self):
+        pool, _, cur = _make_pool()
+        cur.fetchone = MagicMock(return_value=(1,))
+
+        with UnitOfWork(pool) as uow:
+            assert uow.fetchone("SELECT 1") == (1,)
+
+        assert uow.statements == 1
+        assert uow.round_trips == 2
+
+    def test_empty_unit_of_work_never_borrows_a_connection(self):
+        pool, _, _ = _make_pool()
+        with UnitOfWork(pool) as uow:
+            pass
+        pool.connection.assert_not_called()
+        assert uow.round_trips == 0
+
+    def test_exception_skips_commit(self):
+        pool, conn, _ = _make_pool()
+        with pytest.raises(RuntimeError):
+            with UnitOfWork(pool) as uow:
+                uow.execute("INSERT INTO x VALUES (1)")
+                raise RuntimeError("processor failed")
+        conn.commit.assert_not_called()
+        # The pool's connection context sees the exception and rolls back.
+        assert RuntimeError in conn.__exit__.call_args.args
+
+    def test_after_commit_callbacks_run_only_on_success(self):
+        pool, conn, _ = _make_pool()
+        done = []
+        with UnitOfWork(pool) as uow:
+            uow.execute("INSERT INTO x VALUES (1)")
+            uow.after_commit(lambda: done.append(1))
+            assert done == []
+        assert done == [1]
+
+        conn.commit.side_effect = RuntimeError("rolled back")
+        with pytest.raises(RuntimeError):
+            with UnitOfWork(pool) as uow:
+                uow.execute("INSERT INTO x VALUES (1)")
+                uow.after_commit(lambda: done.append(2))
+        assert done == [1]
@@ -0,0 +1,93 @@
+"""Tests for `exporter.decode` — the in-process and process-pool decode
+paths must produce identical envelopes."""
+
+import pytest
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+
+try:
+    from meshtastic.mesh_pb2 import Data, MeshPacket, Position
+    from meshtastic.mqtt_pb2 import ServiceEnvelope
+    from meshtastic.portnums_pb2 import PortNum
+except ImportError:
+    try:
+        from meshtastic.protobuf.mesh_pb2 import Data, MeshPacket, Position
+        from meshtastic.protobuf.mqtt_pb2 import ServiceEnvelope
+        from meshtastic.protobuf.portnums_pb2 import PortNum
+    except ImportError:
+        pytest.skip("meshtastic protobuf not installed", allow_module_level=True)
+
+from exporter.decode import ProcessDecoder, decrypt_packet, parse_envelope
+from exporter.keyring import DEFAULT_PSK, ChannelKeyring, channel_hash
+
+TOPIC = "msh/test/2/e/LongFast/!aabbccdd"
+
+
+def _envelope(packet_id, channel="LongFast", psk=DEFAULT_PSK, encrypt=True):
+    data = Data(
+        portnum=PortNum.POSITION_APP,
+        payload=Position(
+            latitude_i=321234567, longitude_i=348765432
+        ).SerializeToString(),
+    )
+    packet = MeshPacket(id=packet_id, to=0xFFFFFFFF, rx_snr=6.5, hop_limit=3)
+    setattr(packet, "from", 0x0A0B0C0D)
+    packet.channel = channel_hash(channel, psk)
+    if encrypt:
+        nonce = packet_id.to_bytes(8, "little") + (0x0A0B0C0D).to_bytes(8, "little")
+        encryptor = Cipher(algorithms.AES(psk), modes.CTR(nonce)).encryptor()
+        packet.encrypted = (
+            encryptor.update(data.SerializeToString()) + encryptor.finalize()
+        )
+    else:
+        packet.decoded.CopyFrom(data)
+    envelope = ServiceEnvelope(channel_id=channel, gateway_id="!aabbccdd")
+    envelope.packet.CopyFrom(packet)
+    return envelope.SerializeToString()
+
+
+def _payloads():
+    return [
+        (TOPIC, _envelope(1), 1001.0),
+        (TOPIC, _envelope(2, encrypt=False), 1002.0),
+        (TOPIC, _envelope(3, channel="Private", psk=bytes(range(16))), 1003.0),
+        (TOPIC, b"\xff\xff not a protobuf", 1004.0),
+        (TOPIC, _envelope(4), 1005.0),
+    ]
+
+
+def _decode_in_process(items, keyring):
+    out = []
+    for topic, payload, received_at in items:
+        envelope = parse_envelope(payload)
+        if envelope is None or not decrypt_packet(envelope.packet, keyring):
+            continue
+        packet = envelope.packet
+        out.append(
+            (
+                topic,
+                getattr(packet, "from"),
+                packet.id,
+                received_at,
+                envelope.SerializeToString(),
+            )
+        )
+    return out
+
+
+def test_process_pool_matches_in_process_path():
+    local = ChannelKeyring([("LongFast", DEFAULT_PSK)])
+    expected = _decode_in_process(_payloads(), local)
+
+    pooled = ChannelKeyring([("LongFast", DEFAULT_PSK)])
+    decoder = ProcessDecoder(pooled, processes=2)
+    try:
+        records = decoder.decode(_payloads())
+    finally:
+        decoder.close()
+
+    assert records == expected
+    assert [r[2] for r in records] == [1, 2, 4]
+    assert [r[3] for r in records] == [1001.0, 1002.0, 1005.0]
+    decoded = ServiceEnvelope.FromString(records[0][4]).packet
+    assert decoded.decoded.portnum == PortNum.POSITION_APP
+    assert pooled.stats() == local.stats()
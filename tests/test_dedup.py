@@ -0,0 +1,54 @@
+"""Unit tests for `exporter.dedup.PacketDeduplicator`."""
+
+from exporter.dedup import PacketDeduplicator
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestPacketDeduplicator:
+    def test_second_sighting_is_duplicate(self):
+        d = PacketDeduplicator()
+        assert d.is_duplicate(11, 1234) is False
+        assert d.is_duplicate(11, 1234) is True
+
+    def test_key_includes_sender(self):
+        d = PacketDeduplicator()
+        assert d.is_duplicate(11, 1234) is False
+        assert d.is_duplicate(22, 1234) is False
+
+    def test_entries_expire_after_ttl(self):
+        clock = _Clock()
+        d = PacketDeduplicator(ttl=300, clock=clock)
+        d.is_duplicate(11, 1)
+        clock.now = 299
+        assert d.is_duplicate(11, 1) is True
+        clock.now = 301
+        assert d.is_duplicate(11, 1) is False
+        assert d.stats()["expired_total"] == 1
+
+    def test_capacity_evicts_oldest(self):
+        d = PacketDeduplicator(max_entries=2)
+        d.is_duplicate(1, 1)
+        d.is_duplicate(1, 2)
+        d.is_duplicate(1, 3)
+
+        stats = d.stats()
+        assert stats["entries"] == 2
+        assert stats["evictions_total"] == 1
+        # (1, 1) was evicted so it is treated as new again.
+        assert d.is_duplicate(1, 1) is False
+
+    def test_hit_and_miss_counters(self):
+        d = PacketDeduplicator()
+        d.is_duplicate(1, 1)
+        d.is_duplicate(1, 1)
+        d.is_duplicate(1, 1)
+        stats = d.stats()
+        assert stats["misses_total"] == 1
+        assert stats["hits_total"] == 2
@@ -0,0 +1,64 @@
+"""Coverage tests for the precomputed lookups in `exporter.enums` against
+the installed meshtastic protobufs."""
+
+import pytest
+
+try:
+    from exporter import enums
+    from meshtastic.config_pb2 import Config
+    from meshtastic.mesh_pb2 import HardwareModel, Routing
+    from meshtastic.portnums_pb2 import PortNum
+except ImportError:
+    try:
+        from exporter import enums
+        from meshtastic.protobuf.config_pb2 import Config
+        from meshtastic.protobuf.mesh_pb2 import HardwareModel, Routing
+        from meshtastic.protobuf.portnums_pb2 import PortNum
+    except ImportError:
+        pytest.skip("meshtastic protobuf not installed", allow_module_level=True)
+
+from exporter.client_details import ClientDetails
+from exporter.processor import processor_base
+from exporter.processor.processor_base import MessageProcessor
+from exporter.processor.processors import RoutingAppProcessor
+
+TABLES = [
+    (PortNum.DESCRIPTOR, enums.PORT_NAMES),
+    (Config.DeviceConfig.Role.DESCRIPTOR, enums.ROLE_NAMES),
+    (HardwareModel.DESCRIPTOR, enums.HARDWARE_MODEL_NAMES),
+    (Routing.Error.DESCRIPTOR, enums.ROUTING_ERROR_NAMES),
+]
+
+
+@pytest.mark.parametrize(
+    "descriptor,table", TABLES, ids=[d.full_name for d, _ in TABLES]
+)
+def test_table_covers_every_value(descriptor, table):
+    for value in descriptor.values:
+        assert table[value.number] == descriptor.values_by_number[value.number].name
+        assert table[value.name] == value.name
+
+
+def test_names_are_interned():
+    name = enums.port_name(PortNum.TEXT_MESSAGE_APP)
+    assert name is enums.port_name("TEXT_MESSAGE_APP")
+
+
+def test_callers_use_the_tables():
+    assert MessageProcessor.get_port_name_from_portnum(PortNum.POSITION_APP) == (
+        "POSITION_APP"
+    )
+    assert MessageProcessor.get_port_name_from_portnum(65534) == "UNKNOWN_PORT"
+    assert ClientDetails.get_hardware_model_name_from_code("TBEAM") == "TBEAM"
+    assert ClientDetails.get_role_name_from_role(None) == "UNKNOWN_ROLE"
+    assert (
+        RoutingAppProcessor.get_error_name_from_routing(Routing.Error.NO_ROUTE)
+        == "NO_ROUTE"
+    )
+    assert RoutingAppProcessor.get_error_name_from_routing(999) == "UNKNOWN_ERROR"
+
+
+def test_numbers_cover_every_port():
+    numbers = enums.numbers(enums.PORT_NAMES)
+    assert numbers == {v.number: v.name for v in PortNum.DESCRIPTOR.values}
+    assert max(numbers) <= processor_base.PORTNUM_MAX
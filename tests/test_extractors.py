@@ -0,0 +1,82 @@
+"""Unit tests for `exporter.extractors` — column order, cached SQL and
+field presence."""
+
+from unittest.mock import MagicMock
+
+import pytest
+
+try:
+    from meshtastic.mesh_pb2 import Position
+    from meshtastic.telemetry_pb2 import DeviceMetrics, LocalStats
+except ImportError:
+    try:
+        from meshtastic.protobuf.mesh_pb2 import Position
+        from meshtastic.protobuf.telemetry_pb2 import DeviceMetrics, LocalStats
+    except ImportError:
+        pytest.skip("meshtastic protobuf modules unavailable", allow_module_level=True)
+
+from exporter.db_handler import DBHandler
+from exporter.extractors import RowExtractor
+from exporter.processor.processors import NODE_POSITION
+
+
+def test_columns_and_sql_are_fixed_at_build_time():
+    extractor = RowExtractor(
+        "device_metrics", DeviceMetrics, ("voltage", "battery_level")
+    )
+    assert extractor.columns == ("time", "node_id", "voltage", "battery_level")
+    assert extractor.sql == (
+        "INSERT INTO device_metrics (time, node_id, voltage, battery_level) "
+        "VALUES (%s, %s, %s, %s)"
+    )
+
+
+def test_unset_optional_fields_are_null_and_set_zeroes_are_kept():
+    extractor = RowExtractor(
+        "device_metrics", DeviceMetrics, ("battery_level", "voltage", "uptime_seconds")
+    )
+    assert extractor.values(DeviceMetrics(battery_level=0, voltage=4.0)) == (
+        0,
+        4.0,
+        None,
+    )
+
+
+def test_fields_without_presence_keep_their_zero():
+    extractor = RowExtractor(
+        "local_stats", LocalStats, ("num_packets_tx", "num_rx_dupe")
+    )
+    assert extractor.values(LocalStats(num_packets_tx=3)) == (3, 0)
+
+
+def test_renamed_and_unknown_fields():
+    extractor = RowExtractor(
+        "device_metrics", DeviceMetrics, (("battery", "battery_level"), "no_such_field")
+    )
+    assert extractor.columns[2:] == ("battery", "no_such_field")
+    assert extractor.values(DeviceMetrics(battery_level=50)) == (50, None)
+
+
+def test_single_field_extractor_returns_a_tuple():
+    extractor = RowExtractor("device_metrics", DeviceMetrics, ("voltage",))
+    assert extractor.values(DeviceMetrics(voltage=3.5)) == (3.5,)
+
+
+def test_position_maps_to_node_position_metrics_columns():
+    position = Position(latitude_i=1, longitude_i=2, PDOP=150, sats_in_view=7)
+    row = dict(zip(NODE_POSITION.columns[2:], NODE_POSITION.values(position)))
+    assert row["latitude"] == 1
+    assert row["pdop"] == 150
+    assert row["altitude"] is None
+    assert row["sats_in_view"] == 7
+
+
+def test_store_message_hands_the_value_tuple_to_the_writer():
+    extractor = RowExtractor("device_metrics", DeviceMetrics, ("battery_level",))
+    writer = MagicMock()
+    DBHandler(MagicMock(), writer=writer).store_message(
+        extractor, 7, DeviceMetrics(battery_level=90)
+    )
+    table, columns, values = writer.add_values.call_args.args
+    assert (table, columns) == ("device_metrics", extractor.columns)
+    assert values[1:] == (7, 90)
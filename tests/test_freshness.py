@@ -0,0 +1,108 @@
+"""Unit tests for `exporter.freshness` — per-minute gateway and commit lag
+percentiles, and their hand-off from the batch writer."""
+
+import random
+from datetime import datetime, timezone
+from unittest.mock import MagicMock
+
+from exporter.db_handler import BatchWriter
+from exporter.freshness import Arrival, LagTracker, percentile, topic_root
+
+MINUTE = 1_700_000_040.0  # a whole minute
+
+
+def _arrival(offset=0.0, gateway="!gw1"):
+    return Arrival("msh/EU_868", gateway, MINUTE + offset)
+
+
+def test_topic_root():
+    assert topic_root("msh/EU_868/2/e/LongFast/!aabbccdd") == "msh/EU_868"
+    assert topic_root("msh/US/CA/2/map/") == "msh/US/CA"
+    assert topic_root("custom/feed/x") == "custom/feed"
+
+
+def test_percentile_is_nearest_rank():
+    ordered = [float(i) for i in range(1, 101)]
+    assert percentile(ordered, 0.5) == 50.0
+    assert percentile(ordered, 0.95) == 95.0
+    assert percentile([3.0], 0.99) == 3.0
+
+
+def test_rows_per_minute_gateway_and_stage():
+    tracker = LagTracker()
+    for i in range(10):
+        tracker.received(_arrival(i), rx_time=int(MINUTE + i) - (i + 1))
+    tracker.received(_arrival(1, gateway="!gw2"), rx_time=int(MINUTE) - 30)
+    tracker.received(_arrival(2), rx_time=0)  # no rx_time: skipped
+    tracker.committed([_arrival(5), _arrival(6)], MINUTE + 8.0)
+
+    rows = {(r["gateway_id"], r["stage"]): r for r in tracker.drain()}
+    assert set(rows) == {("!gw1", "gateway"), ("!gw2", "gateway"), ("!gw1", "commit")}
+
+    gateway = rows[("!gw1", "gateway")]
+    assert gateway["time"] == datetime.fromtimestamp(MINUTE, timezone.utc)
+    assert gateway["topic_root"] == "msh/EU_868"
+    assert gateway["samples"] == 10
+    assert gateway["p50_seconds"] == 5.0
+    assert gateway["max_seconds"] == 10.0
+    assert rows[("!gw2", "gateway")]["p99_seconds"] == 31.0
+    assert rows[("!gw1", "commit")]["p50_seconds"] == 2.0
+    assert tracker.drain() == []
+
+
+def test_drain_keeps_minutes_inside_the_grace_period():
+    tracker = LagTracker(grace=30)
+    tracker.committed([_arrival(10)], MINUTE + 11)
+    assert tracker.drain(now=MINUTE + 75) == []
+    assert len(tracker.drain(now=MINUTE + 95)) == 1
+
+
+def test_reservoir_bounds_samples_but_keeps_counts_and_max():
+    random.seed(1)
+    tracker = LagTracker(max_samples=50)
+    for i in range(1000):
+        tracker.committed([_arrival()], MINUTE + i / 100)
+    (row,) = tracker.drain()
+    assert row["samples"] == 1000
+    assert abs(row["max_seconds"] - 9.99) < 1e-6
+    assert 2.0 < row["p50_seconds"] < 8.0
+
+
+def test_close_hands_everything_to_the_sink():
+    sink = MagicMock()
+    tracker = LagTracker(sink=sink)
+    tracker.committed([_arrival()], MINUTE + 1)
+    tracker.close()
+    (rows,), _ = sink.call_args
+    assert len(rows) == 1
+    assert tracker.stats()["rows_total"] == 1
+
+
+def test_disabled_tracker_records_nothing():
+    sink = MagicMock()
+    tracker = LagTracker(sink=sink, enabled=False)
+    tracker.received(_arrival(), rx_time=int(MINUTE) - 86400)
+    tracker.committed([_arrival()], MINUTE + 1)
+    tracker.close()
+    sink.assert_not_called()
+    assert tracker.stats()["gateway_samples_total"] == 0
+    assert tracker.stats()["commit_samples_total"] == 0
+
+
+def test_batch_writer_reports_commit_lag_after_copy():
+    pool = MagicMock()
+    tracker = LagTracker()
+    writer = BatchWriter(pool, batch_size=2, lag_tracker=tracker)
+    writer.add("mesh_packet_metrics", {"source_id": 1}, _arrival())
+    assert tracker.stats()["commit_samples_total"] == 0
+    writer.add("mesh_packet_metrics", {"source_id": 2}, _arrival())
+    assert tracker.stats()["commit_samples_total"] == 2
+
+
+def test_batch_writer_drops_lag_of_failed_batches():
+    pool = MagicMock()
+    pool.connection.side_effect = RuntimeError("down")
+    tracker = LagTracker()
+    writer = BatchWriter(pool, batch_size=1, lag_tracker=tracker)
+    writer.add("device_metrics", {"node_id": 1}, _arrival())
+    assert tracker.stats()["commit_samples_total"] == 0
@@ -0,0 +1,193 @@
+"""Unit tests for `exporter.ingest` — the staged, bounded-queue pipeline
+between the MQTT callback and the database work."""
+
+import threading
+import time
+
+from exporter.ingest import BatchStage, IngestPipeline, Stage
+from exporter.metric.reporter import StatsReporter, flatten
+
+
+def _collector():
+    seen = []
+    lock = threading.Lock()
+
+    def handler(item):
+        with lock:
+            seen.append(item)
+
+    return seen, handler
+
+
+class TestIngestPipeline:
+    def test_items_flow_through_every_stage(self):
+        seen, sink = _collector()
+        pipeline = IngestPipeline(
+            [
+                Stage("parse", lambda item: item * 2, workers=2),
+                Stage("process", sink, workers=3),
+            ]
+        )
+        pipeline.start()
+        for i in range(100):
+            pipeline.submit(i)
+        pipeline.close()
+
+        assert sorted(seen) == [i * 2 for i in range(100)]
+
+    def test_none_result_drops_item(self):
+        seen, sink = _collector()
+        pipeline = IngestPipeline(
+            [
+                Stage("parse", lambda item: item if item % 2 else None),
+                Stage("process", sink),
+            ]
+        )
+        pipeline.start()
+        for i in range(10):
+            pipeline.submit(i)
+        pipeline.close()
+
+        assert sorted(seen) == [1, 3, 5, 7, 9]
+        stats = pipeline.stats()
+        assert stats["parse"]["dequeued_total"] == 10
+        assert stats["process"]["enqueued_total"] == 5
+
+    def test_handler_exception_is_counted_not_raised(self):
+        def boom(item):
+            raise ValueError("bad packet")
+
+        pipeline = IngestPipeline([Stage("parse", boom)])
+        pipeline.start()
+        pipeline.submit(1)
+        pipeline.submit(2)
+        pipeline.close()
+
+        assert pipeline.stats()["parse"]["failed_total"] == 2
+
+    def test_close_drains_queued_items(self):
+        seen, sink = _collector()
+
+        def slow(item):
+            time.sleep(0.001)
+            return item
+
+        pipeline = IngestPipeline(
+            [Stage("parse", slow, maxsize=5), Stage("process", sink, maxsize=5)]
+        )
+        pipeline.start()
+        for i in range(50):
+            pipeline.submit(i)
+        pipeline.close()
+
+        assert len(seen) == 50
+        for stage in pipeline.stats().values():
+            assert stage["depth"] == 0
+
+    def test_full_queue_blocks_producer_and_records_time(self):
+        release = threading.Event()
+
+        def gated(item):
+            release.wait()
+
+        stage = Stage("process", gated, maxsize=1)
+        pipeline = IngestPipeline([stage])
+        pipeline.start()
+        pipeline.submit(1)  # picked up by the worker, which then waits
+        pipeline.submit(2)  # fills the queue
+
+        producer = threading.Thread(target=pipeline.submit, args=(3,))
+        producer.start()
+        time.sleep(0.05)
+        release.set()
+        producer.join()
+        pipeline.close()
+
+        stats = pipeline.stats()["process"]
+        assert stats["enqueued_total"] == 3
+        assert stats["blocked_seconds_total"] > 0
+
+
+class TestStatsReporter:
+    def test_flatten_nested_sources(self):
+        snap = {"ingest": {"parse": {"depth": 1}, "process": {"depth": 2}}}
+        assert flatten(snap) == {
+            "ingest.parse": {"depth": 1},
+            "ingest.process": {"depth": 2},
+        }
+
+    def test_report_logs_rates_for_counters(self, caplog):
+        counter = {"enqueued_total": 0, "depth": 0}
+        reporter = StatsReporter(interval=0)
+        reporter.register("ingest", lambda: dict(counter))
+
+        with caplog.at_level("INFO"):
+            reporter.report()
+            counter["enqueued_total"] = 10
+            reporter.report()
+
+        assert "enqueued_per_sec=" in caplog.records[-1].getMessage()
+
+
+class TestBatchStage:
+    def test_batches_are_handled_and_fanned_out(self):
+        seen, sink = _collector()
+        sizes = []
+
+        def double_all(batch):
+            sizes.append(len(batch))
+            return [item * 2 for item in batch]
+
+        pipeline = IngestPipeline(
+            [
+                BatchStage("decode", double_all, batch_size=8, workers=2),
+                Stage("process", sink),
+            ]
+        )
+        pipeline.start()
+        for i in range(100):
+            pipeline.submit(i)
+        pipeline.close()
+
+        assert sorted(seen) == [i * 2 for i in range(100)]
+        assert max(sizes) <= 8
+        stats = pipeline.stats()["decode"]
+        assert stats["dequeued_total"] == 100
+        assert stats["batches_total"] == len(sizes)
+
+    def test_failed_batch_counts_every_item(self):
+        def boom(batch):
+            raise ValueError("worker died")
+
+        stage = BatchStage("decode", boom, batch_size=4)
+        pipeline = IngestPipeline([stage])
+        pipeline.start()
+        for i in range(3):
+            pipeline.submit(i)
+        pipeline.close()
+
+        assert pipeline.stats()["decode"]["failed_total"] == 3
+
+    def test_generator_failing_part_way_counts_only_the_rest(self):
+        seen, sink = _collector()
+
+        def decode(batch):
+            for item in batch:
+                if item == 2:
+                    raise ValueError("bad payload")
+                yield item
+
+        pipeline = IngestPipeline(
+            [BatchStage("decode", decode, batch_size=4), Stage("process", sink)]
+        )
+        for i in range(4):
+            pipeline.submit(i)
+        pipeline.start()
+        pipeline.close()
+
+        stats = pipeline.stats()
+        assert sorted(seen) == [0, 1]
+        assert stats["decode"]["failed_total"] == 2
+        assert stats["process"]["dequeued_total"] == (
+            stats["decode"]["dequeued_total"] - stats["decode"]["failed_total"]
+        )
@@ -0,0 +1,121 @@
+"""Unit tests for `exporter.keyring` — channel-hash-indexed decryption."""
+
+import base64
+
+import pytest
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+
+try:
+    from meshtastic.mesh_pb2 import Data, MeshPacket
+    from meshtastic.portnums_pb2 import PortNum
+except ImportError:
+    try:
+        from meshtastic.protobuf.mesh_pb2 import Data, MeshPacket
+        from meshtastic.protobuf.portnums_pb2 import PortNum
+    except ImportError:
+        pytest.skip("meshtastic protobuf not installed", allow_module_level=True)
+
+from exporter.keyring import (
+    DEFAULT_CHANNEL_NAMES,
+    DEFAULT_PSK,
+    ChannelKeyring,
+    channel_hash,
+    expand_psk,
+    parse_channel_keys,
+)
+
+PRIVATE_KEY = bytes(range(32))
+
+
+def _encrypted_packet(name: str, psk: bytes, payload: bytes = b"hello"):
+    packet = MeshPacket()
+    setattr(packet, "from", 0x1234ABCD)
+    packet.id = 42
+    packet.channel = channel_hash(name, psk)
+    data = Data(portnum=PortNum.TEXT_MESSAGE_APP, payload=payload)
+    nonce = packet.id.to_bytes(8, "little") + (0x1234ABCD).to_bytes(8, "little")
+    encryptor = Cipher(algorithms.AES(expand_psk(psk)), modes.CTR(nonce)).encryptor()
+    packet.encrypted = encryptor.update(data.SerializeToString()) + encryptor.finalize()
+    return packet
+
+
+class TestChannelHash:
+    def test_matches_firmware_hashes_for_default_presets(self):
+        assert channel_hash("LongFast", DEFAULT_PSK) == 8
+        assert channel_hash("MediumFast", DEFAULT_PSK) == 31
+
+    def test_simple_psk_expands_from_default_key(self):
+        assert expand_psk(b"\x01") == DEFAULT_PSK
+        assert expand_psk(b"\x02")[:-1] == DEFAULT_PSK[:-1]
+        assert expand_psk(b"\x02")[-1] == DEFAULT_PSK[-1] + 1
+
+    def test_parse_channel_keys(self):
+        spec = f" Ops=AQ== , Team={base64.b64encode(PRIVATE_KEY).decode()} ,"
+        assert parse_channel_keys(spec) == [("Ops", b"\x01"), ("Team", PRIVATE_KEY)]
+        with pytest.raises(ValueError):
+            parse_channel_keys("no-equals-sign")
+
+
+class TestChannelKeyring:
+    def test_decrypts_with_the_key_for_the_channel_hash(self):
+        keyring = ChannelKeyring([("LongFast", DEFAULT_PSK), ("Team", PRIVATE_KEY)])
+
+        data = keyring.decrypt(_encrypted_packet("Team", PRIVATE_KEY))
+
+        assert data.payload == b"hello"
+        stats = keyring.stats()
+        assert stats["Team"]["hits_total"] == 1
+        assert stats["LongFast"]["hits_total"] == 0
+
+    def test_unknown_channel_is_skipped_without_decrypting(self):
+        keyring = ChannelKeyring([("LongFast", DEFAULT_PSK)])
+        packet = _encrypted_packet("Secret", PRIVATE_KEY)
+        assert packet.channel != channel_hash("LongFast", DEFAULT_PSK)
+
+        assert keyring.decrypt(packet) is None
+        stats = keyring.stats()
+        assert stats["skipped_total"] == 1
+        assert stats["LongFast"]["failures_total"] == 0
+
+    def test_later_key_for_same_name_replaces_earlier(self):
+        keyring = ChannelKeyring([("Team", DEFAULT_PSK), ("Team", PRIVATE_KEY)])
+        assert keyring.stats()["keys"] == 1
+        assert keyring.decrypt(_encrypted_packet("Team", PRIVATE_KEY)) is not None
+
+    def test_rejects_bad_key_length(self):
+        with pytest.raises(ValueError):
+            ChannelKeyring([("Team", b"short")])
+
+    def test_from_env_registers_server_key_for_presets(self, monkeypatch):
+        monkeypatch.delenv("MQTT_SERVER_KEY", raising=False)
+        monkeypatch.setenv(
+            "MQTT_CHANNEL_KEYS", f"Team={base64.b64encode(PRIVATE_KEY).decode()}"
+        )
+        keyring = ChannelKeyring.from_env()
+
+        assert keyring.decrypt(_encrypted_packet("MediumFast", DEFAULT_PSK))
+        assert keyring.decrypt(_encrypted_packet("Team", PRIVATE_KEY))
+        assert "LongFast" in keyring.stats()
+
+    def test_custom_channel_name_with_the_server_key_uses_the_fallback(
+        self, monkeypatch
+    ):
+        monkeypatch.delenv("MQTT_SERVER_KEY", raising=False)
+        monkeypatch.delenv("MQTT_SERVER_KEY_FALLBACK", raising=False)
+        keyring = ChannelKeyring.from_env()
+        packet = _encrypted_packet("Neighbourhood", DEFAULT_PSK)
+        assert packet.channel not in {
+            channel_hash(name, DEFAULT_PSK) for name in DEFAULT_CHANNEL_NAMES
+        }
+
+        assert keyring.decrypt(packet).payload == b"hello"
+        stats = keyring.stats()
+        assert stats["fallback_hits_total"] == 1
+        assert stats["skipped_total"] == 0
+
+    def test_fallback_can_be_turned_off(self, monkeypatch):
+        monkeypatch.setenv("MQTT_SERVER_KEY_FALLBACK", "false")
+        keyring = ChannelKeyring.from_env()
+
+        assert keyring.decrypt(_encrypted_packet("Neighbourhood", DEFAULT_PSK)) is None
+        assert keyring.stats()["skipped_total"] == 1
@@ -0,0 +1,81 @@
+"""Unit tests for `exporter.metric.prometheus` — the histograms, counters
+and `/metrics` endpoint for the exporter's own health."""
+
+import urllib.error
+import urllib.request
+
+import pytest
+
+from exporter.metric.prometheus import MetricsServer, Registry
+
+
+def _lines(text):
+    return [line for line in text.splitlines() if not line.startswith("#")]
+
+
+class TestInstruments:
+    def test_histogram_buckets_are_cumulative(self):
+        registry = Registry("test")
+        series = registry.histogram("seconds", "Doc.", buckets=(0.1, 1.0)).labels()
+        for value in (0.05, 0.1, 0.5, 2.0):
+            series.observe(value)
+
+        lines = _lines(registry.render())
+        assert 'test_seconds_bucket{le="0.1"} 2' in lines
+        assert 'test_seconds_bucket{le="1.0"} 3' in lines
+        assert 'test_seconds_bucket{le="+Inf"} 4' in lines
+        assert "test_seconds_count 4" in lines
+        assert "test_seconds_sum 2.65" in lines
+
+    def test_counter_series_per_label(self):
+        registry = Registry("test")
+        family = registry.counter("packets_total", "Doc.", labels=("outcome",))
+        family.labels("stored").inc()
+        family.labels("stored").inc(2)
+        family.labels("duplicate").inc()
+
+        lines = _lines(registry.render())
+        assert 'test_packets_total{outcome="stored"} 3' in lines
+        assert 'test_packets_total{outcome="duplicate"} 1' in lines
+
+    def test_labels_are_resolved_once(self):
+        family = Registry("test").counter("x_total", "Doc.", labels=("port",))
+        assert family.labels("TEXT") is family.labels("TEXT")
+        with pytest.raises(ValueError):
+            family.labels()
+
+    def test_label_values_are_escaped(self):
+        registry = Registry("test")
+        registry.counter("x_total", "Doc.", labels=("topic",)).labels('a"b\\').inc()
+        assert 'test_x_total{topic="a\\"b\\\\"} 1' in registry.render()
+
+    def test_stats_snapshot_becomes_gauges_and_counters(self):
+        text = Registry("test").render(
+            {
+                "ingest": {"parse": {"depth": 3, "dequeued_total": 10}},
+                "keyring": {"keys": 2, "note": "ignored"},
+            }
+        )
+        assert "# TYPE test_ingest_parse_depth gauge" in text
+        assert "# TYPE test_ingest_parse_dequeued_total counter" in text
+        assert "test_ingest_parse_dequeued_total 10" in text
+        assert "test_keyring_keys 2" in text
+        assert "ignored" not in text
+
+
+class TestMetricsServer:
+    def test_serves_metrics_and_404s_elsewhere(self):
+        registry = Registry("test")
+        registry.counter("up_total", "Doc.").labels().inc()
+        server = MetricsServer(registry.render, port=0, host="127.0.0.1")
+        server.start()
+        try:
+            base = f"http://127.0.0.1:{server.port}"
+            with urllib.request.urlopen(f"{base}/metrics") as response:
+                assert response.headers["Content-Type"].startswith("text/plain")
+                assert "test_up_total 1" in response.read().decode()
+            with pytest.raises(urllib.error.HTTPError) as excinfo:
+                urllib.request.urlopen(f"{base}/")
+            assert excinfo.value.code == 404
+        finally:
+            server.close()
@@ -0,0 +1,114 @@
+"""Unit tests for `exporter.node_cache.NodeCache` and the read-through
+lookup in `MessageProcessor._get_client_details`."""
+
+from unittest.mock import MagicMock
+
+from exporter.client_details import ClientDetails
+from exporter.db_handler import UnitOfWork
+from exporter.node_cache import NodeCache
+from exporter.processor.processor_base import MessageProcessor
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _pool(fetchone=None):
+    cur = MagicMock(name="cursor")
+    cur.__enter__ = MagicMock(return_value=cur)
+    cur.__exit__ = MagicMock(return_value=False)
+    cur.fetchone = MagicMock(return_value=fetchone)
+    conn = MagicMock(name="conn")
+    conn.cursor.return_value = cur
+    conn.__enter__ = MagicMock(return_value=conn)
+    conn.__exit__ = MagicMock(return_value=False)
+    pool = MagicMock(name="pool")
+    pool.connection.return_value = conn
+    return pool, cur
+
+
+class TestNodeCache:
+    def test_put_then_get(self):
+        cache = NodeCache()
+        cache.put(ClientDetails(node_id=42, short_name="AB"))
+        assert cache.get(42).short_name == "AB"
+        assert cache.get(43) is None
+        assert cache.stats()["hits_total"] == 1
+        assert cache.stats()["misses_total"] == 1
+
+    def test_entries_expire(self):
+        clock = _Clock()
+        cache = NodeCache(ttl=10, clock=clock)
+        cache.put(ClientDetails(node_id=42))
+        clock.now = 11
+        assert cache.get(42) is None
+        assert cache.stats()["entries"] == 0
+
+    def test_least_recently_used_is_evicted(self):
+        cache = NodeCache(max_entries=2)
+        cache.put(ClientDetails(node_id=1))
+        cache.put(ClientDetails(node_id=2))
+        cache.get(1)
+        cache.put(ClientDetails(node_id=3))
+        assert cache.get(2) is None
+        assert cache.get(1) is not None
+        assert cache.stats()["evictions_total"] == 1
+
+    def test_merge_replaces_only_given_fields(self):
+        cache = NodeCache()
+        original = ClientDetails(node_id=42, short_name="AB", long_name="Alpha")
+        cache.put(original)
+        cache.merge(42, short_name="CD", long_name=None)
+
+        merged = cache.get(42)
+        assert merged.short_name == "CD"
+        assert merged.long_name == "Alpha"
+        # Callers may still hold the old object; it must not change.
+        assert original.short_name == "AB"
+
+    def test_merge_ignores_uncached_nodes(self):
+        cache = NodeCache()
+        cache.merge(42, short_name="CD")
+        assert cache.get(42) is None
+
+    def test_warm_keeps_most_important_rows(self):
+        cache = NodeCache(max_entries=2)
+        n = cache.warm(
+            [
+                (1, "A", "Alpha", "TBEAM", "CLIENT"),
+                (2, "B", "Bravo", "TBEAM", "CLIENT"),
+                (3, "C", "Charlie", "TBEAM", "CLIENT"),
+            ]
+        )
+        assert n == 2
+        assert cache.get(1).long_name == "Alpha"
+        assert cache.get(3) is None
+
+
+class TestClientDetailsLookup:
+    def test_known_node_needs_no_database(self):
+        pool, cur = _pool(fetchone=(42, "AB", "Alpha", "TBEAM", "CLIENT"))
+        mp = MessageProcessor(pool)
+
+        with UnitOfWork(pool) as uow:
+            first = mp._get_client_details(42, uow)
+            second = mp._get_client_details(42, uow)
+
+        assert first.long_name == "Alpha"
+        assert second is first
+        assert cur.execute.call_count == 1
+
+    def test_broadcast_is_upserted_once(self):
+        pool, cur = _pool()
+        mp = MessageProcessor(pool)
+
+        for _ in range(3):
+            with UnitOfWork(pool) as uow:
+                details = mp._get_client_details(4294967295, uow)
+
+        assert details.short_name == "Broadcast"
+        assert cur.execute.call_count == 1
@@ -0,0 +1,138 @@
+"""Unit tests for `exporter.node_state` — coalescing, no-op skipping and
+the multi-row upsert."""
+
+from unittest.mock import MagicMock
+
+from exporter.db_handler import DBHandler
+from exporter.node_state import NodeStateWriter, upsert_nodes
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def _writer(**kwargs):
+    pool = MagicMock()
+    clock = FakeClock()
+    writer = NodeStateWriter(pool, clock=clock, **kwargs)
+    cur = pool.connection.return_value.__enter__.return_value.cursor.return_value
+    return writer, clock, cur.__enter__.return_value
+
+
+def test_updates_coalesce_last_write_wins_per_column():
+    writer, _, cur = _writer()
+    writer.update(1, {"latitude": 10, "longitude": 20})
+    writer.update(1, {"latitude": 11})
+    writer.update(1, {"mqtt_status": "online"}, touch=False)
+    writer.flush()
+
+    (sql, params), _ = cur.execute.call_args
+    assert sql.count("INSERT INTO node_details") == 1
+    assert "(node_id, latitude, longitude, mqtt_status, updated_at)" in sql
+    assert params[:4] == [1, 11, 20, "online"]
+    assert writer.stats()["rows_total"] == 1
+
+
+def test_unchanged_values_are_skipped_until_the_touch_interval():
+    writer, clock, cur = _writer(touch_interval=300)
+    writer.update(1, {"latitude": 10})
+    writer.flush()
+    cur.execute.reset_mock()
+
+    writer.update(1, {"latitude": 10})
+    writer.flush()
+    cur.execute.assert_not_called()
+    assert writer.stats()["skipped_total"] == 1
+
+    clock.now += 301
+    writer.update(1, {"latitude": 10})
+    writer.flush()
+    (sql, _), _ = cur.execute.call_args
+    assert "(node_id, updated_at)" in sql
+
+
+def test_untouched_updates_skip_without_a_timestamp():
+    writer, clock, cur = _writer()
+    writer.update(1, {"mqtt_status": "online"}, touch=False)
+    writer.flush()
+    cur.execute.reset_mock()
+    clock.now += 301  # past the touch interval
+    writer.update(1, {"mqtt_status": "online"}, touch=False)
+    writer.flush()
+    cur.execute.assert_not_called()
+
+
+def test_known_values_expire_after_ttl():
+    writer, clock, cur = _writer(ttl=60)
+    writer.update(1, {"mqtt_status": "online"}, touch=False)
+    writer.flush()
+    cur.execute.reset_mock()
+    clock.now += 61
+    writer.update(1, {"mqtt_status": "online"}, touch=False)
+    writer.flush()
+    cur.execute.assert_called_once()
+
+
+def test_failed_flush_keeps_dirty_nodes_and_newer_values_win():
+    writer, _, cur = _writer()
+    cur.execute.side_effect = RuntimeError("down")
+    writer.update(1, {"latitude": 10, "altitude": 5}, touch=False)
+    writer.flush()
+    writer.update(1, {"latitude": 12}, touch=False)
+    assert writer.stats()["dirty"] == 1
+
+    cur.execute.side_effect = None
+    writer.flush()
+    (_, params), _ = cur.execute.call_args
+    assert params == [1, 5, 12]
+    assert writer.stats()["failed_flushes_total"] == 1
+
+
+def test_upsert_groups_by_column_set_and_only_updates_columns():
+    cur = MagicMock()
+    upsert_nodes(
+        cur,
+        {
+            1: ({"mqtt_status": "online"}, {"short_name": "Unknown (MQTT)"}),
+            2: ({"mqtt_status": "offline"}, {"short_name": "Unknown (MQTT)"}),
+            3: ({"latitude": 1}, {}),
+        },
+    )
+    assert cur.execute.call_count == 2
+    sql, params = cur.execute.call_args_list[0].args
+    assert "VALUES (%s, %s, %s), (%s, %s, %s)" in sql
+    assert sql.endswith("DO UPDATE SET mqtt_status = EXCLUDED.mqtt_status")
+    assert params == [1, "online", "Unknown (MQTT)", 2, "offline", "Unknown (MQTT)"]
+
+
+def test_writer_upserts_into_its_table():
+    writer, _, cur = _writer(table="node_latest")
+    writer.update(1, {"device_time": 1, "battery_level": 80}, touch=False)
+    writer.flush()
+    (sql, _), _ = cur.execute.call_args
+    assert sql.startswith(
+        "INSERT INTO node_latest (node_id, battery_level, device_time)"
+    )
+
+
+def test_zero_interval_writes_each_update_immediately():
+    writer, _, cur = _writer(interval=0)
+    writer.start()
+    assert writer._thread is None
+    writer.update(1, {"latitude": 10})
+    cur.execute.assert_called_once()
+    assert writer.stats()["dirty"] == 0
+
+
+def test_db_handler_writes_through_without_a_node_state_writer():
+    pool = MagicMock()
+    handler = DBHandler(pool)
+    handler.update_node_details(7, {"role": "CLIENT"})
+    cur = pool.connection.return_value.__enter__.return_value.cursor.return_value
+    (sql, params), _ = cur.__enter__.return_value.execute.call_args
+    assert "(node_id, role, updated_at)" in sql
+    assert params[:2] == [7, "CLIENT"]
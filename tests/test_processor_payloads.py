@@ -12,7 +12,8 @@ try:
         EnvironmentMetrics,
         Telemetry,
     )
-    from meshtastic.mesh_pb2 import NeighborInfo, Position
+    from meshtastic.mesh_pb2 import NeighborInfo, Position, User
+    from meshtastic.portnums_pb2 import PortNum
 except ImportError:
     try:
         from meshtastic.protobuf.paxcount_pb2 import Paxcount
@@ -21,20 +22,25 @@ except ImportError:
             EnvironmentMetrics,
             Telemetry,
         )
-        from meshtastic.protobuf.mesh_pb2 import NeighborInfo, Position
+        from meshtastic.protobuf.mesh_pb2 import NeighborInfo, Position, User
+        from meshtastic.protobuf.portnums_pb2 import PortNum
     except ImportError:
         pytest.skip("meshtastic protobuf modules unavailable", allow_module_level=True)
 
 from exporter.client_details import ClientDetails
+from exporter.db_handler import DBHandler, UnitOfWork
 from exporter.processor.processors import (
     NeighborInfoAppProcessor,
+    NodeInfoAppProcessor,
     PaxCounterAppProcessor,
     PositionAppProcessor,
+    ProcessorRegistry,
     TelemetryAppProcessor,
+    UnknownAppProcessor,
 )
 
 
-def _client(node_id="42"):
+def _client(node_id=42):
     return ClientDetails(node_id=node_id, short_name="x", long_name="y")
 
 
@@ -52,10 +58,11 @@ class TestPaxCounterAppProcessor:
 
         proc.process(payload, client_details=_client())
 
-        proc.db_handler.store_pax_counter_metrics.assert_called_once()
-        node_id, metrics = proc.db_handler.store_pax_counter_metrics.call_args.args
-        assert node_id == "42"
-        assert metrics == {"wifi_stations": 5, "ble_beacons": 7, "uptime": 600}
+        proc.db_handler.store_message.assert_called_once()
+        extractor, node_id, message = proc.db_handler.store_message.call_args.args
+        assert extractor.table == "pax_counter_metrics"
+        assert node_id == 42
+        assert extractor.values(message) == (5, 7, 600)
 
 
 class TestTelemetryAppProcessor:
@@ -73,12 +80,13 @@ class TestTelemetryAppProcessor:
         proc = _processor(TelemetryAppProcessor)
         proc.process(payload, client_details=_client())
 
-        proc.db_handler.store_device_metrics.assert_called_once()
-        proc.db_handler.store_environment_metrics.assert_not_called()
-        node_id, metrics = proc.db_handler.store_device_metrics.call_args.args
-        assert node_id == "42"
-        assert metrics["battery_level"] == 80
-        assert metrics["uptime_seconds"] == 3600
+        proc.db_handler.store_message.assert_called_once()
+        extractor, node_id, message, _ = proc.db_handler.store_message.call_args.args
+        assert extractor.table == "device_metrics"
+        assert node_id == 42
+        row = dict(zip(extractor.columns[2:], extractor.values(message)))
+        assert row["battery_level"] == 80
+        assert row["uptime_seconds"] == 3600
 
     def test_environment_metrics_dispatch(self):
         payload = Telemetry(
@@ -90,8 +98,8 @@ class TestTelemetryAppProcessor:
         proc = _processor(TelemetryAppProcessor)
         proc.process(payload, client_details=_client())
 
-        proc.db_handler.store_environment_metrics.assert_called_once()
-        proc.db_handler.store_device_metrics.assert_not_called()
+        (call,) = proc.db_handler.store_message.call_args_list
+        assert call.args[0].table == "environment_metrics"
 
 
 class TestPositionAppProcessor:
@@ -106,13 +114,34 @@ class TestPositionAppProcessor:
         proc = _processor(PositionAppProcessor)
         proc.process(payload, client_details=_client())
 
-        proc.db_handler.execute_db_operation.assert_called_once()
+        proc.db_handler.update_node_details.assert_called_once()
+        node_id, columns = proc.db_handler.update_node_details.call_args.args
+        assert node_id == 42
+        assert columns == {
+            "latitude": 329123456,
+            "longitude": -1175678910,
+            "altitude": 10,
+            "precision": 14,
+        }
 
     def test_zero_position_is_ignored(self):
         payload = Position(latitude_i=0, longitude_i=0).SerializeToString()
         proc = _processor(PositionAppProcessor)
         proc.process(payload, client_details=_client())
-        proc.db_handler.execute_db_operation.assert_not_called()
+        proc.db_handler.update_node_details.assert_not_called()
+
+
+class TestNodeInfoAppProcessor:
+    def test_known_nodes_only_take_the_fields_the_user_carries(self):
+        payload = User(short_name="AB", long_name="").SerializeToString()
+        proc = _processor(NodeInfoAppProcessor)
+        proc.process(payload, client_details=_client())
+
+        node_id, columns, defaults = proc.db_handler.update_node_details.call_args.args
+        assert node_id == 42
+        assert set(columns) == {"role", "short_name"}
+        assert defaults["long_name"] == ""
+        assert "hardware_model" in defaults
 
 
 class TestNeighborInfoAppProcessor:
@@ -124,7 +153,103 @@ class TestNeighborInfoAppProcessor:
             n.snr = snr
         payload = info.SerializeToString()
 
-        proc = _processor(NeighborInfoAppProcessor)
+        proc = NeighborInfoAppProcessor(MagicMock(name="pool"), MagicMock())
         proc.process(payload, client_details=_client())
 
         proc.db_handler.execute_db_operation.assert_called_once()
+        cur = MagicMock()
+        proc.db_handler.execute_db_operation.call_args.args[0](cur, MagicMock())
+        sql, params = cur.execute.call_args.args
+        assert "unnest" in sql
+        assert params == ([1, 2], [4.5, -3.0], 42, 42, 42)
+
+    def test_unchanged_reports_are_skipped(self):
+        def report(*snrs):
+            info = NeighborInfo()
+            for nid, snr in enumerate(snrs, start=1):
+                n = info.neighbors.add()
+                n.node_id = nid
+                n.snr = snr
+            return info.SerializeToString()
+
+        proc = NeighborInfoAppProcessor(MagicMock(name="pool"), MagicMock())
+        proc.process(report(4.5, -3.0), client_details=_client())
+        proc.process(report(4.75, -3.5), client_details=_client())
+        assert proc.db_handler.execute_db_operation.call_count == 1
+
+        proc.process(report(8.0, -3.0), client_details=_client())
+        proc.process(report(8.0, -3.0, 1.0), client_details=_client())
+        assert proc.db_handler.execute_db_operation.call_count == 3
+        assert proc.stats()["skipped_total"] == 1
+
+    def test_failed_writes_are_retried(self):
+        info = NeighborInfo()
+        info.neighbors.add(node_id=1, snr=1.0)
+        payload = info.SerializeToString()
+
+        proc = NeighborInfoAppProcessor(MagicMock(name="pool"), MagicMock())
+        proc.db_handler.execute_db_operation.side_effect = RuntimeError("down")
+        with pytest.raises(RuntimeError):
+            proc.process(payload, client_details=_client())
+        proc.db_handler.execute_db_operation.side_effect = None
+        proc.process(payload, client_details=_client())
+        assert proc.db_handler.execute_db_operation.call_count == 2
+
+    def test_failed_commits_are_retried(self):
+        """In a unit of work the write only fails at commit, after the
+        processor returned."""
+        info = NeighborInfo()
+        info.neighbors.add(node_id=1, snr=1.0)
+        payload = info.SerializeToString()
+        pool = MagicMock(name="pool")
+        conn = pool.connection.return_value.__enter__.return_value
+        conn.commit.side_effect = RuntimeError("rolled back")
+
+        proc = NeighborInfoAppProcessor(pool, DBHandler(pool))
+        with pytest.raises(RuntimeError):
+            with UnitOfWork(pool) as uow:
+                proc.process(payload, client_details=_client(), uow=uow)
+        assert proc.stats()["nodes"] == 0
+
+        conn.commit.side_effect = None
+        with UnitOfWork(pool) as uow:
+            proc.process(payload, client_details=_client(), uow=uow)
+        assert uow.statements == 1
+        assert proc.stats()["nodes"] == 1
+
+    def test_cache_bound_is_configurable(self, monkeypatch):
+        monkeypatch.setenv("NEIGHBOR_CACHE_MAX_NODES", "1")
+        proc = NeighborInfoAppProcessor(MagicMock(name="pool"), MagicMock())
+        for node_id in (1, 2):
+            proc.process(NeighborInfo().SerializeToString(), _client(node_id))
+        assert proc.stats()["nodes"] == 1
+
+
+class TestProcessorRegistry:
+    def test_processors_are_built_once_and_share_the_db_handler(self):
+        handler = MagicMock(name="db_handler")
+        registry = ProcessorRegistry(MagicMock(name="pool"), handler)
+
+        first = registry.processor_for(PortNum.TELEMETRY_APP)
+        second = registry.processor_for(PortNum.TELEMETRY_APP)
+
+        assert isinstance(first, TelemetryAppProcessor)
+        assert first is second
+        assert first.db_handler is handler
+
+    def test_unregistered_port_uses_one_unknown_processor(self):
+        registry = ProcessorRegistry(MagicMock(name="pool"), MagicMock())
+        a = registry.processor_for(9999)
+        b = registry.processor_for(9998)
+        assert isinstance(a, UnknownAppProcessor)
+        assert a is b
+
+    def test_filtered_port_falls_back_to_unknown(self, monkeypatch):
+        monkeypatch.setenv("EXPORTER_MESSAGE_TYPES_TO_FILTER", "TELEMETRY_APP")
+        registry = ProcessorRegistry(MagicMock(name="pool"), MagicMock())
+        assert isinstance(
+            registry.processor_for(PortNum.TELEMETRY_APP), UnknownAppProcessor
+        )
+        assert isinstance(
+            registry.processor_for(PortNum.POSITION_APP), PositionAppProcessor
+        )
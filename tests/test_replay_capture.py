@@ -0,0 +1,32 @@
+"""Checks on `scripts/replay_capture.py` with the exporter and database
+mocked out."""
+
+from unittest.mock import MagicMock
+
+import main
+from exporter.capture import CaptureWriter
+from scripts import replay_capture
+
+
+def test_replay_feeds_every_record_without_tracking_lag(tmp_path, monkeypatch):
+    path = tmp_path / "capture.bin"
+    writer = CaptureWriter(str(path))
+    writer.write(1_700_000_000.0, "msh/EU_868/2/e/LongFast/!gw1", b"one")
+    writer.write(1_700_000_001.0, "msh/EU_868/2/e/LongFast/!gw2", b"two")
+    writer.close()
+
+    start_ingest = MagicMock()
+    handle_message = MagicMock()
+    monkeypatch.setattr(replay_capture, "load_dotenv", MagicMock())
+    monkeypatch.setattr(replay_capture, "ConnectionPool", MagicMock())
+    monkeypatch.setattr(replay_capture, "summarize", lambda count, elapsed: count)
+    monkeypatch.setattr(main, "start_ingest", start_ingest)
+    monkeypatch.setattr(main, "stop_ingest", MagicMock())
+    monkeypatch.setattr(main, "handle_message", handle_message)
+
+    count = replay_capture.ingest(lambda: replay_capture.replay([str(path)], 0, 0))
+
+    assert count == 2
+    assert start_ingest.call_args.kwargs == {"track_lag": False}
+    payloads = [c.args[2].payload for c in handle_message.call_args_list]
+    assert payloads == [b"one", b"two"]
@@ -0,0 +1,147 @@
+"""Unit tests for `exporter.spool` — segment files, recovery after a
+restart, and the batch writer spooling while the database is down."""
+
+import os
+from datetime import datetime
+from unittest.mock import MagicMock
+
+import psycopg
+
+from exporter.db_handler import BatchWriter
+from exporter.spool import Spool, SpoolReplayer, read_segment
+
+ROW_TIME = datetime(2024, 5, 1, 12, 30, 15, 250000)
+
+
+def _rows(n, start=0):
+    return [(ROW_TIME, start + i, 1.5, None, True) for i in range(n)]
+
+
+def _batches(spool):
+    spool.seal()
+    return [batch for path in spool.sealed() for batch in read_segment(path)]
+
+
+def test_round_trip_keeps_types_and_timestamps(tmp_path):
+    spool = Spool(str(tmp_path))
+    assert spool.append("device_metrics", ("time", "node_id", "v", "n", "b"), _rows(2))
+    assert spool.append(
+        "mesh_packet_metrics", ("time", "payload"), [(ROW_TIME, b"\x00\xff")]
+    )
+
+    batches = _batches(spool)
+    assert batches[0] == (
+        "device_metrics",
+        ("time", "node_id", "v", "n", "b"),
+        _rows(2),
+    )
+    assert batches[1] == (
+        "mesh_packet_metrics",
+        ("time", "payload"),
+        [(ROW_TIME, b"\x00\xff")],
+    )
+    stats = spool.stats()
+    assert stats["depth_rows"] == 3
+    assert stats["spooled_rows_total"] == 3
+
+
+def test_segments_rotate_and_survive_a_restart(tmp_path):
+    spool = Spool(str(tmp_path), segment_bytes=300)
+    for i in range(5):
+        spool.append(
+            "device_metrics", ("time", "node_id", "v", "n", "b"), _rows(2, i * 2)
+        )
+    spool.close()
+    assert len(os.listdir(tmp_path)) > 1
+
+    reopened = Spool(str(tmp_path), segment_bytes=300)
+    assert reopened.stats()["depth_rows"] == 10
+    reopened.append("device_metrics", ("time", "node_id", "v", "n", "b"), _rows(1, 10))
+    ids = [row[1] for _, _, rows in _batches(reopened) for row in rows]
+    assert ids == list(range(11))
+
+
+def test_a_torn_tail_ends_the_segment(tmp_path):
+    spool = Spool(str(tmp_path))
+    spool.append("device_metrics", ("time", "node_id", "v", "n", "b"), _rows(2))
+    spool.append("device_metrics", ("time", "node_id", "v", "n", "b"), _rows(2, 2))
+    spool.close()
+    (path,) = spool.sealed()
+    with open(path, "r+b") as f:
+        f.truncate(os.path.getsize(path) - 5)
+    assert [len(rows) for _, _, rows in read_segment(path)] == [2]
+
+
+def test_a_full_spool_drops_new_batches(tmp_path):
+    spool = Spool(str(tmp_path), max_bytes=200)
+    assert spool.append("device_metrics", ("time", "node_id", "v", "n", "b"), _rows(1))
+    assert not spool.append(
+        "device_metrics", ("time", "node_id", "v", "n", "b"), _rows(10)
+    )
+    assert spool.stats()["dropped_rows_total"] == 10
+
+
+def test_writer_spools_while_the_database_is_unreachable(tmp_path):
+    pool = MagicMock()
+    pool.connection.side_effect = psycopg.OperationalError("connection refused")
+    spool = Spool(str(tmp_path))
+    writer = BatchWriter(pool, batch_size=2, spool=spool)
+
+    writer.add("device_metrics", {"time": ROW_TIME, "node_id": 1})
+    writer.add("device_metrics", {"time": ROW_TIME, "node_id": 2})
+    assert pool.connection.call_count == 1
+    assert not writer.stats()["healthy"]
+
+    # Later batches go straight to the spool without trying the database.
+    writer.add("device_metrics", {"time": ROW_TIME, "node_id": 3})
+    writer.add("device_metrics", {"time": ROW_TIME, "node_id": 4})
+    assert pool.connection.call_count == 1
+    assert writer.stats()["device_metrics"]["spooled_rows_total"] == 4
+    assert writer.stats()["device_metrics"]["failed_rows_total"] == 0
+
+    pool.connection.side_effect = None
+    replayer = SpoolReplayer(spool, writer.replay, on_recovered=writer.mark_healthy)
+    assert replayer.drain()
+    assert spool.empty()
+    assert writer.stats()["healthy"]
+    assert replayer.stats()["replayed_rows_total"] == 4
+    cur = pool.connection.return_value.__enter__.return_value.cursor.return_value
+    copy = cur.__enter__.return_value.copy.return_value.__enter__.return_value
+    assert [c.args[0][1] for c in copy.write_row.call_args_list] == [1, 2, 3, 4]
+
+
+def test_rejected_rows_are_dropped_not_spooled(tmp_path):
+    pool = MagicMock()
+    pool.connection.side_effect = psycopg.DataError("bad value")
+    spool = Spool(str(tmp_path))
+    writer = BatchWriter(pool, batch_size=1, spool=spool)
+    writer.add("device_metrics", {"time": ROW_TIME, "node_id": 1})
+    assert writer.stats()["healthy"]
+    assert spool.empty()
+
+
+def test_replayer_sets_aside_segments_the_database_rejects(tmp_path):
+    spool = Spool(str(tmp_path))
+    spool.append("device_metrics", ("time", "node_id", "v", "n", "b"), _rows(1))
+
+    def replay(batches):
+        raise psycopg.DataError("bad value")
+
+    replayer = SpoolReplayer(spool, replay, is_retryable=BatchWriter.is_unavailable)
+    assert replayer.drain()
+    assert spool.empty()
+    assert replayer.stats()["rejected_segments_total"] == 1
+    assert any(name.endswith(".rejected") for name in os.listdir(tmp_path))
+
+
+def test_replayer_keeps_segments_while_the_database_is_down(tmp_path):
+    spool = Spool(str(tmp_path))
+    spool.append("device_metrics", ("time", "node_id", "v", "n", "b"), _rows(1))
+
+    def replay(batches):
+        raise psycopg.OperationalError("connection refused")
+
+    replayer = SpoolReplayer(spool, replay, is_retryable=BatchWriter.is_unavailable)
+    assert not replayer.drain()
+    assert spool.stats()["depth_rows"] == 1
+    assert replayer.stats()["replay_failures_total"] == 1
@@ -0,0 +1,74 @@
+"""Checks on the synthetic traffic from `scripts/generate_traffic.py`: it
+must be valid, decryptable input for the exporter."""
+
+from collections import Counter
+
+import pytest
+
+try:
+    from meshtastic.mqtt_pb2 import ServiceEnvelope
+    from meshtastic.portnums_pb2 import PortNum
+except ImportError:
+    try:
+        from meshtastic.protobuf.mqtt_pb2 import ServiceEnvelope
+        from meshtastic.protobuf.portnums_pb2 import PortNum
+    except ImportError:
+        pytest.skip("meshtastic protobuf not installed", allow_module_level=True)
+
+from exporter.decode import decrypt_packet, parse_envelope
+from exporter.keyring import ChannelKeyring
+from scripts.generate_traffic import MeshModel
+
+
+def _events(seed=7):
+    return list(MeshModel(200, seed=seed).events(1800))
+
+
+def test_events_are_time_ordered_and_deterministic():
+    events = _events()
+    times = [e[0] for e in events]
+    assert times == sorted(times)
+    assert events == _events()
+    assert events != _events(seed=8)
+
+
+def test_every_packet_decodes_with_the_default_keyring():
+    keyring = ChannelKeyring.from_env()
+    ports = Counter()
+    copies = Counter()
+    for _, topic, payload in _events():
+        envelope = parse_envelope(payload)
+        assert envelope is not None
+        packet = envelope.packet
+        assert decrypt_packet(packet, keyring)
+        ports[packet.decoded.portnum] += 1
+        copies[(getattr(packet, "from"), packet.id)] += 1
+        if packet.decoded.portnum == PortNum.MAP_REPORT_APP:
+            assert topic == "msh/sim/2/map/"
+        else:
+            assert topic.startswith("msh/sim/2/e/LongFast/!")
+
+    assert keyring.stats()["skipped_total"] == 0
+    for port in (
+        PortNum.NODEINFO_APP,
+        PortNum.POSITION_APP,
+        PortNum.TELEMETRY_APP,
+        PortNum.MAP_REPORT_APP,
+    ):
+        assert ports[port] > 0
+    # Rebroadcasts: some packets reach MQTT through several gateways.
+    assert max(copies.values()) > 1
+
+
+def test_gateway_copies_share_the_payload_but_not_the_envelope():
+    by_key = {}
+    for _, topic, payload in _events():
+        envelope = ServiceEnvelope.FromString(payload)
+        packet = envelope.packet
+        if not packet.encrypted:
+            continue
+        key = (getattr(packet, "from"), packet.id)
+        by_key.setdefault(key, []).append(envelope)
+    repeated = next(envs for envs in by_key.values() if len(envs) > 1)
+    assert len({e.gateway_id for e in repeated}) == len(repeated)
+    assert len({e.packet.encrypted for e in repeated}) == 1